@@ -0,0 +1,123 @@
+"""
+Feed Serialization Micro-Benchmark
+
+Measures building the GET /api/photos response body for a large feed, before
+and after the fast-JSON changes:
+    before - url_for twice per photo, Flask's stdlib JSON provider, no compression
+    after  - per-request URL templates, orjson provider (when installed), gzip/brotli
+
+Usage:
+    python benchmarks/bench_feed_serialization.py [--photos 5000] [--repeat 20]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from flask import Flask, g, url_for  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+from lumina.config import Config  # noqa: E402
+from lumina.responses import init_compression, init_json  # noqa: E402
+from lumina.routes import _serialize_photo, api_blueprint, auth_blueprint  # noqa: E402
+
+
+def make_photos(count: int) -> list:
+    photos = []
+    for i in range(count):
+        photos.append({
+            'id': uuid.uuid4().hex,
+            'user_id': i % 50,
+            'username': f'user{i % 50}',
+            'topic': ('nature', 'city', 'food', 'memes')[i % 4],
+            'caption': 'A caption of typical length for a shared photo',
+            'timestamp': 1_700_000_000_000 + i,
+            'likes': i % 17,
+            'placeholder': 'data:image/jpeg;base64,' + 'A' * 440,
+            'dominant_color': '#405565',
+            'thumb_width': 400,
+            'thumb_height': 266,
+        })
+    return photos
+
+
+def serialize_before(photo):
+    """_serialize_photo as it was: url_for resolved for every photo."""
+    return {
+        'id': photo['id'],
+        'user_id': photo.get('user_id'),
+        'username': photo['username'],
+        'topic': photo['topic'],
+        'caption': photo.get('caption', ''),
+        'timestamp': photo['timestamp'],
+        'likes': photo.get('likes', 0),
+        'thumbnail': url_for('photos_api.get_image', photo_id=photo['id'], variant='thumb'),
+        'fullRes': url_for('photos_api.get_image', photo_id=photo['id'], variant='full'),
+        'placeholder': photo.get('placeholder'),
+        'dominantColor': photo.get('dominant_color'),
+        'thumbWidth': photo.get('thumb_width'),
+        'thumbHeight': photo.get('thumb_height'),
+    }
+
+
+def make_app(optimized: bool) -> Flask:
+    app = Flask(__name__)
+    app.config['JSON_COMPRESS_MIN_SIZE'] = Config.JSON_COMPRESS_MIN_SIZE
+    app.register_blueprint(api_blueprint, url_prefix='/api')
+    app.register_blueprint(auth_blueprint, url_prefix='/api')
+    if optimized:
+        init_json(app)
+        init_compression(app)
+    else:
+        app.json = DefaultJSONProvider(app)
+    return app
+
+
+def run(app: Flask, photos: list, serializer, repeat: int) -> dict:
+    timings = []
+    size = 0
+    headers = {'Accept-Encoding': 'br, gzip'}
+    for _ in range(repeat):
+        with app.test_request_context('/api/photos?scope=all', headers=headers):
+            start = time.perf_counter()
+            response = app.json.response([serializer(p) for p in photos])
+            response = app.process_response(response)
+            body = response.get_data()
+            timings.append(time.perf_counter() - start)
+            g.pop('image_url_templates', None)
+        size = len(body)
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'min_ms': min(timings) * 1000,
+        'bytes': size,
+        'encoding': response.headers.get('Content-Encoding', 'identity'),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--photos', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    photos = make_photos(args.photos)
+    before = run(make_app(optimized=False), photos, serialize_before, args.repeat)
+    after = run(make_app(optimized=True), photos, _serialize_photo, args.repeat)
+
+    print(f"Feed of {args.photos} photos, {args.repeat} runs")
+    for label, result in (('before', before), ('after', after)):
+        print(f"  {label:<7} median {result['median_ms']:8.1f} ms   min {result['min_ms']:8.1f} ms   "
+              f"{result['bytes']:>9} bytes ({result['encoding']})")
+    print(f"  speedup {before['median_ms'] / after['median_ms']:.1f}x, "
+          f"{1 - after['bytes'] / before['bytes']:.0%} fewer bytes on the wire")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Feed Streaming Benchmark
+
+Compares peak Python memory and time-to-first-byte of GET /api/photos?scope=all
+when the response is built in one piece (list_photos + jsonify) versus
+streamed from StorageDynamoDB.iter_photos.
+
+The storage is replaced by an in-process stand-in that yields scan pages of
+synthetic photos, so only the response path is measured.
+
+Usage:
+    python benchmarks/bench_feed_streaming.py [--photos 50000] [--page-size 1000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from flask import Flask, jsonify  # noqa: E402
+
+from lumina.config import Config  # noqa: E402
+from lumina.responses import init_compression, init_json, stream_json_array  # noqa: E402
+from lumina.routes import _serialize_photo, api_blueprint, auth_blueprint  # noqa: E402
+
+
+class PagedPhotoSource:
+    """Yields synthetic photo dicts the way a DynamoDB scan returns pages."""
+
+    def __init__(self, count: int, page_size: int) -> None:
+        self.count = count
+        self.page_size = page_size
+
+    def iter_photos(self, user_ids=None):
+        for start in range(0, self.count, self.page_size):
+            page = [self._photo(i) for i in range(start, min(start + self.page_size, self.count))]
+            yield from page
+
+    def list_photos(self, user_ids=None):
+        photos = list(self.iter_photos(user_ids))
+        photos.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
+        return photos
+
+    @staticmethod
+    def _photo(i: int) -> dict:
+        return {
+            'id': uuid.uuid4().hex, 'user_id': i % 50, 'username': f'user{i % 50}',
+            'topic': 'nature', 'caption': 'A caption of typical length for a shared photo',
+            'timestamp': 1_700_000_000_000 + i, 'likes': i % 17,
+            'placeholder': 'data:image/jpeg;base64,' + 'A' * 440, 'dominant_color': '#405565',
+            'thumb_width': 400, 'thumb_height': 266,
+        }
+
+
+def make_app() -> Flask:
+    app = Flask(__name__)
+    app.config['JSON_COMPRESS_MIN_SIZE'] = Config.JSON_COMPRESS_MIN_SIZE
+    app.register_blueprint(api_blueprint, url_prefix='/api')
+    app.register_blueprint(auth_blueprint, url_prefix='/api')
+    init_json(app)
+    init_compression(app)
+    return app
+
+
+def measure(app: Flask, build) -> dict:
+    with app.test_request_context('/api/photos?scope=all'):
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = app.process_response(build())
+        chunks = iter(response.response)
+        first = next(chunks)
+        ttfb = time.perf_counter() - start
+        total = len(first) + sum(len(chunk) for chunk in chunks)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {'ttfb_ms': ttfb * 1000, 'total_ms': elapsed * 1000, 'peak_mb': peak / 2**20, 'bytes': total}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--photos', type=int, default=50000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    source = PagedPhotoSource(args.photos, args.page_size)
+    app = make_app()
+    buffered = measure(app, lambda: jsonify([_serialize_photo(p) for p in source.list_photos()]))
+    streamed = measure(app, lambda: stream_json_array(source.iter_photos(), _serialize_photo))
+
+    print(f"scope=all feed of {args.photos} photos ({args.page_size} per scan page)")
+    for label, result in (('buffered', buffered), ('streamed', streamed)):
+        print(f"  {label:<9} ttfb {result['ttfb_ms']:8.1f} ms   total {result['total_ms']:8.1f} ms   "
+              f"peak {result['peak_mb']:7.1f} MiB   {result['bytes']} bytes")
+
+
+if __name__ == '__main__':
+    main()
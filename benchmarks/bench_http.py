@@ -0,0 +1,222 @@
+"""
+HTTP Load Benchmark
+
+Closed-loop load driver for the Flask API: each worker logs in as its own
+seeded user and issues the next request as soon as the previous one
+completes, drawing routes from a weighted mix that resembles browsing
+(feeds, thumbnails, comment threads, likes, comments, messages and the
+inbox).
+
+Logins are off by default. Pass --login-weight to mix them in; comparing
+the other routes' p99 with and without logins shows how much password
+hashing interferes with browsing, and 503s on auth.login are logins shed
+by the bounded hashing pool (see lumina/passwords.py).
+
+By default the real application (create_app, with every hook) is served
+in-process by a threaded werkzeug server over the storage stand-ins from
+harness.py. Pass --url to drive an already running deployment instead; its
+database must contain the bench<N> users (password 'bench-password') and
+at least one photo.
+
+Admission control (lumina/admission.py) is off for the in-process server so
+the closed-loop clients are never rate limited; pass --admission to turn it
+on and see how feed.all (a scan) is shed while cheap routes keep their tail
+latency. Responses with 429/503 are counted per route as 'shed' (they also
+count as errors).
+
+Per-route and overall p50/p95/p99 latency and throughput are printed as JSON.
+
+Usage:
+    python benchmarks/bench_http.py [--workers 8] [--duration 30] [--photos 300] [--backend local]
+    python benchmarks/bench_http.py --url http://127.0.0.1:8000 --workers 32
+    python benchmarks/bench_http.py --login-weight 10
+    python benchmarks/bench_http.py --admission --workers 32
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import bench_app, environment, local_storage, seed, summarize, write_results  # noqa: E402
+
+# (name, weight, method, path template); {photo} and {friend} are filled per request
+REQUEST_MIX = [
+    ('feed.home', 20, 'GET', '/api/photos?scope=home'),
+    ('feed.all', 5, 'GET', '/api/photos?scope=all'),
+    ('feed.profile', 5, 'GET', '/api/photos?scope=profile'),
+    ('image.thumb', 40, 'GET', '/api/photos/{photo}/image/thumb'),
+    ('image.full', 5, 'GET', '/api/photos/{photo}/image/full'),
+    ('comments.list', 10, 'GET', '/api/photos/{photo}/comments'),
+    ('comments.add', 3, 'POST', '/api/photos/{photo}/comments'),
+    ('like', 5, 'POST', '/api/photos/{photo}/like'),
+    ('messages.list', 5, 'GET', '/api/messages?user_id={friend}'),
+    ('messages.send', 2, 'POST', '/api/messages'),
+    ('conversations.list', 3, 'GET', '/api/conversations'),
+    ('auth.login', 0, 'POST', '/api/auth/login'),
+]
+
+
+class Worker(threading.Thread):
+    def __init__(self, base_url: str, username: str, photo_ids, friend_id: int,
+                 deadline: float, seed_value: int, mix=REQUEST_MIX) -> None:
+        super().__init__(daemon=True)
+        self.mix = mix
+        self.base_url = base_url
+        self.username = username
+        self.photo_ids = photo_ids
+        self.friend_id = friend_id
+        self.deadline = deadline
+        self.rng = random.Random(seed_value)
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.shed = defaultdict(int)
+
+    def request(self, method: str, path: str, payload=None) -> int:
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers={
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip, br',
+        })
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def run(self) -> None:
+        self.request('POST', '/api/auth/login', {'username': self.username, 'password': 'bench-password'})
+        names = [entry[0] for entry in self.mix]
+        weights = [entry[1] for entry in self.mix]
+        routes = {entry[0]: entry[2:] for entry in self.mix}
+        while time.perf_counter() < self.deadline:
+            name = self.rng.choices(names, weights)[0]
+            method, template = routes[name]
+            path = template.format(photo=self.rng.choice(self.photo_ids), friend=self.friend_id)
+            payload = None
+            if name == 'comments.add':
+                payload = {'text': 'bench comment'}
+            elif name == 'messages.send':
+                payload = {'to_user_id': self.friend_id, 'text': 'bench message'}
+            elif name == 'auth.login':
+                payload = {'username': self.username, 'password': 'bench-password'}
+            start = time.perf_counter()
+            try:
+                status = self.request(method, path, payload)
+            except OSError:
+                status = 0
+            elapsed = time.perf_counter() - start
+            if 200 <= status < 400:
+                self.latencies[name].append(elapsed)
+            else:
+                self.errors[name] += 1
+                if status in (429, 503):
+                    self.shed[name] += 1
+
+
+def drive(base_url: str, usernames, photo_ids, friend_ids, workers: int, duration: float,
+          login_weight: int = 0) -> dict:
+    mix = [(name, login_weight if name == 'auth.login' else weight, *rest) for name, weight, *rest in REQUEST_MIX]
+    deadline = time.perf_counter() + duration
+    threads = [Worker(base_url, usernames[i % len(usernames)], photo_ids, friend_ids[i % len(friend_ids)],
+                      deadline, i, mix) for i in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    routes = {}
+    all_latencies, all_errors = [], 0
+    for name, weight, *_ in mix:
+        if not weight:
+            continue
+        latencies = [value for thread in threads for value in thread.latencies[name]]
+        errors = sum(thread.errors[name] for thread in threads)
+        routes[name] = summarize(latencies, elapsed, errors)
+        routes[name]['shed'] = sum(thread.shed[name] for thread in threads)
+        all_latencies.extend(latencies)
+        all_errors += errors
+    return {'overall': summarize(all_latencies, elapsed, all_errors), 'routes': routes}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='drive this server instead of an in-process one')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent closed-loop clients')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of load')
+    parser.add_argument('--login-weight', type=int, default=0,
+                        help='weight of auth.login in the request mix (feed.home is 20)')
+    parser.add_argument('--admission', action='store_true',
+                        help='enable admission control on the in-process server')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--friends', type=int, default=5, help='accepted friendships per user')
+    parser.add_argument('--photos', type=int, default=300)
+    parser.add_argument('--comments', type=int, default=2, help='comments per photo')
+    parser.add_argument('--messages', type=int, default=100)
+    parser.add_argument('--backend', choices=('dynamodb', 'local'), default='dynamodb',
+                        help="storage to measure: StorageDynamoDB on stand-ins, or StorageLocal")
+    parser.add_argument('--mysql', action='store_true', help='use the MySQL server from DB_* instead of sqlite')
+    parser.add_argument('--aws-endpoints', action='store_true',
+                        help='use AWS_ENDPOINT_URL_* (DynamoDB Local, S3 emulator) instead of moto')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    if args.url:
+        usernames = [f'bench{i}' for i in range(args.users)]
+        # Log in once to collect photo ids from the whole-table feed
+        probe = Worker(args.url.rstrip('/'), usernames[0], [], 0, 0, 0)
+        probe.request('POST', '/api/auth/login', {'username': usernames[0], 'password': 'bench-password'})
+        with probe.opener.open(args.url.rstrip('/') + '/api/photos?scope=all', timeout=60) as response:
+            photo_ids = [p['id'] for p in json.loads(response.read())]
+        # Seeded users get consecutive ids from 1, so bench<i>'s friend is id i + 2
+        friend_ids = [(i + 1) % args.users + 1 for i in range(args.users)]
+        results = drive(args.url.rstrip('/'), usernames, photo_ids, friend_ids, args.workers, args.duration,
+                        args.login_weight)
+    else:
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs) -> None:
+                pass
+
+        with local_storage(use_mysql=args.mysql, aws_endpoints=args.aws_endpoints, backend=args.backend) as storage:
+            print('seeding...', file=sys.stderr)
+            data = seed(storage, args.users, args.friends, args.photos, args.comments, args.messages)
+            app = bench_app(storage, METRICS_ENABLED=False, ADMISSION_ENABLED=args.admission)
+            server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            print(f'running against 127.0.0.1:{server.port}...', file=sys.stderr)
+            users = data['users']
+            try:
+                results = drive(f'http://127.0.0.1:{server.port}', [u['username'] for u in users],
+                                data['photo_ids'], [users[(i + 1) % len(users)]['id'] for i in range(len(users))],
+                                args.workers, args.duration, args.login_weight)
+            finally:
+                server.shutdown()
+
+    write_results({
+        'benchmark': 'http',
+        'environment': environment(),
+        'parameters': vars(args),
+        **results,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
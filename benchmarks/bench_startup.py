@@ -0,0 +1,83 @@
+"""
+Worker Startup Benchmark
+
+Measures what a fresh gunicorn worker pays before it can serve: each run is
+a new interpreter that imports the package and calls create_app() with the
+DynamoDB backend, then creates the storage's AWS clients the way the first
+request would. Reported phases (p50/p95/p99 ms over --runs processes):
+
+    import      - `import lumina`
+    create_app  - application factory, including storage construction
+    first_use   - boto3 import and client creation on first storage access
+    total       - interpreter start to ready, measured by the parent
+
+No backend is contacted: MySQL points at a closed local port and AWS
+credentials are dummies, so any network I/O at boot shows up as an error.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 20] [--output startup.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import ROOT, environment, summarize, write_results  # noqa: E402
+
+CHILD = """
+import json, time
+t0 = time.perf_counter()
+import lumina
+t1 = time.perf_counter()
+app = lumina.create_app()
+t2 = time.perf_counter()
+app.extensions['photo_storage'].photos_table
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'first_use': t3 - t2}))
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20, help='fresh interpreters to start')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    env = dict(os.environ,
+               STORAGE_BACKEND='dynamodb', DB_HOST='127.0.0.1', DB_PORT='9',
+               AWS_ACCESS_KEY_ID='bench', AWS_SECRET_ACCESS_KEY='bench', AWS_REGION='us-east-1',
+               METRICS_ENABLED='false')
+    phases = {'import': [], 'create_app': [], 'first_use': [], 'total': []}
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            errors += 1
+            print(result.stderr.strip().splitlines()[-1], file=sys.stderr)
+            continue
+        for phase, value in json.loads(result.stdout.strip().splitlines()[-1]).items():
+            phases[phase].append(value)
+        phases['total'].append(elapsed)
+    elapsed = time.perf_counter() - started
+
+    write_results({
+        'benchmark': 'startup',
+        'environment': environment(),
+        'parameters': vars(args),
+        'phases': {phase: summarize(values, elapsed, errors) for phase, values in phases.items()},
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Storage Benchmark
+
+Times the StorageDynamoDB operations behind every hot route against local
+stand-ins (see harness.py) and prints p50/p95/p99 latency and throughput per
+operation as JSON:
+
+    reads  - list_photos (home/profile/all scopes), get_image_bytes (thumb/full),
+             list_comments, list_messages, list_conversations, verify_user
+    writes - add_photo, add_photos (an album of ALBUM_SIZE, to compare per-photo
+             cost against add_photo), add_comment, send_message, increment_like
+
+Reads run before writes so every read sees the seeded data volume.
+
+Usage:
+    python benchmarks/bench_storage.py [--users 50] [--friends 5] [--photos 500]
+        [--comments 3] [--messages 200] [--iterations 200] [--backend local] [--output results.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import environment, local_storage, seed, synthetic_image, timed_calls, write_results  # noqa: E402
+
+ALBUM_SIZE = 10
+
+
+def run(storage, data, iterations: int, write_iterations: int) -> dict:
+    rng = random.Random(1)
+    users = data['users']
+    photo_ids = data['photo_ids']
+    user = users[0]
+    friend = users[1 % len(users)]
+    home_ids = [user['id']] + storage.friend_ids(user['id'])
+
+    reads = {
+        'list_photos.home': lambda: storage.list_photos(user_ids=home_ids),
+        'list_photos.profile': lambda: storage.list_photos(user_ids=[user['id']]),
+        'list_photos.all': lambda: storage.list_photos(),
+        'get_image_bytes.thumb': lambda: storage.get_image_bytes(rng.choice(photo_ids), 'thumb'),
+        'get_image_bytes.full': lambda: storage.get_image_bytes(rng.choice(photo_ids), 'full'),
+        'list_comments': lambda: storage.list_comments(rng.choice(photo_ids)),
+        'list_messages': lambda: storage.list_messages(user['id'], friend['id']),
+        'list_conversations': lambda: storage.list_conversations(user['id']),
+        'verify_user': lambda: storage.verify_user(user['username'], 'bench-password'),
+    }
+    writes = {
+        'add_photo': lambda: storage.add_photo(user, 'nature', synthetic_image(rng, 320, 240), 'bench'),
+        f'add_photos.x{ALBUM_SIZE}': lambda: storage.add_photos(
+            user, 'nature', [synthetic_image(rng, 320, 240) for _ in range(ALBUM_SIZE)], 'bench'),
+        'add_comment': lambda: storage.add_comment(rng.choice(photo_ids), friend, 'bench comment'),
+        'send_message': lambda: storage.send_message(user, friend['id'], 'bench message'),
+        'increment_like': lambda: storage.increment_like(rng.choice(photo_ids)),
+    }
+
+    results = {}
+    for name, fn in reads.items():
+        print(f'  {name}', file=sys.stderr)
+        results[name] = timed_calls(fn, iterations)
+    for name, fn in writes.items():
+        print(f'  {name}', file=sys.stderr)
+        results[name] = timed_calls(fn, write_iterations)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--friends', type=int, default=5, help='accepted friendships per user')
+    parser.add_argument('--photos', type=int, default=500)
+    parser.add_argument('--comments', type=int, default=3, help='comments per photo')
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=200, help='calls per read operation')
+    parser.add_argument('--write-iterations', type=int, default=50, help='calls per write operation')
+    parser.add_argument('--backend', choices=('dynamodb', 'local'), default='dynamodb',
+                        help="storage to measure: StorageDynamoDB on stand-ins, or StorageLocal")
+    parser.add_argument('--mysql', action='store_true', help='use the MySQL server from DB_* instead of sqlite')
+    parser.add_argument('--aws-endpoints', action='store_true',
+                        help='use AWS_ENDPOINT_URL_* (DynamoDB Local, S3 emulator) instead of moto')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    with local_storage(use_mysql=args.mysql, aws_endpoints=args.aws_endpoints, backend=args.backend) as storage:
+        print('seeding...', file=sys.stderr)
+        data = seed(storage, args.users, args.friends, args.photos, args.comments, args.messages)
+        print('running...', file=sys.stderr)
+        operations = run(storage, data, args.iterations, args.write_iterations)
+
+    write_results({
+        'benchmark': 'storage',
+        'environment': environment(),
+        'parameters': vars(args),
+        'operations': operations,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
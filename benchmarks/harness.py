@@ -0,0 +1,346 @@
+"""
+Benchmark Harness
+
+Local stand-ins for every backend StorageDynamoDB talks to, plus seeding
+and result helpers shared by the benchmark scripts:
+
+    DynamoDB + S3 - moto, in-process (default). To use DynamoDB Local and a
+                    local S3 emulator instead, export AWS_ENDPOINT_URL_DYNAMODB
+                    and AWS_ENDPOINT_URL_S3 (honoured by boto3 itself) and
+                    pass --aws-endpoints.
+    MySQL         - a sqlite shim (default), or a real server such as
+                    `docker run -e MYSQL_ROOT_PASSWORD=bench -p 3306:3306 mysql:8`
+                    with --mysql and the usual DB_* environment variables.
+
+With --backend local the scripts measure StorageLocal (SQLite + files in a
+temporary LOCAL_DATA_DIR) instead, which needs no stand-ins at all.
+
+Nothing here talks to AWS: credentials are forced to dummy values.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import boto3  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from lumina.config import Config  # noqa: E402
+from lumina.storage_dynamodb import StorageDynamoDB  # noqa: E402
+from lumina.storage_local import StorageLocal  # noqa: E402
+
+REGION = 'us-east-1'
+
+
+# ----------------------------------------------------------------------
+# MySQL stand-in
+# ----------------------------------------------------------------------
+class _ShimCursor:
+    """pymysql DictCursor look-alike over sqlite3 (%s placeholders, dict rows)."""
+
+    def __init__(self, cursor: sqlite3.Cursor) -> None:
+        self._cursor = cursor
+
+    def __enter__(self) -> '_ShimCursor':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._cursor.close()
+
+    def execute(self, query: str, args=None) -> int:
+        self._cursor.execute(query.replace('%s', '?'), tuple(args or ()))
+        return self._cursor.rowcount
+
+    def fetchone(self) -> Optional[Dict[str, Any]]:
+        row = self._cursor.fetchone()
+        return dict(row) if row is not None else None
+
+    def fetchall(self) -> List[Dict[str, Any]]:
+        return [dict(row) for row in self._cursor.fetchall()]
+
+    @property
+    def lastrowid(self) -> int:
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+
+class _ShimConnection:
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+
+    def cursor(self) -> _ShimCursor:
+        return _ShimCursor(self._conn.cursor())
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS friend_requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    requester_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    receiver_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'accepted', 'declined')),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+class SQLiteShimStorage(StorageDynamoDB):
+    """StorageDynamoDB whose MySQL side runs on a sqlite file."""
+
+    def __init__(self, config, sqlite_path: str) -> None:
+        self.sqlite_path = sqlite_path
+        super().__init__(config)
+
+    def migrate(self) -> None:
+        conn = sqlite3.connect(self.sqlite_path)
+        # WAL lets the HTTP driver's reader threads run alongside writers
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SQLITE_SCHEMA)
+        conn.close()
+
+    @contextmanager
+    def _raw_connection(self):
+        conn = _ShimConnection(self.sqlite_path)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    connection = _raw_connection
+
+
+# ----------------------------------------------------------------------
+# DynamoDB / S3 stand-ins
+# ----------------------------------------------------------------------
+def bench_config(**overrides: Any) -> Config:
+    config = Config()
+    config.STORAGE_BACKEND = 'dynamodb'
+    config.AWS_REGION = REGION
+    config.AWS_ACCESS_KEY_ID = 'bench'
+    config.AWS_SECRET_ACCESS_KEY = 'bench'
+    config.S3_BUCKET = 'lumina-bench'
+    # moto has no provisioned capacity; pacing calls would only measure the limiter
+    config.DYNAMODB_READ_CAPACITY = 0
+    config.DYNAMODB_WRITE_CAPACITY = 0
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    return config
+
+
+def create_aws_resources(config: Config) -> None:
+    """Create the three DynamoDB tables and the S3 bucket the app expects."""
+    dynamodb = boto3.resource('dynamodb', region_name=REGION,
+                              aws_access_key_id='bench', aws_secret_access_key='bench')
+    existing = set(dynamodb.meta.client.list_tables()['TableNames'])
+    for name in (config.DYNAMODB_PHOTOS_TABLE, config.DYNAMODB_COMMENTS_TABLE,
+                 config.DYNAMODB_MESSAGES_TABLE):
+        if name in existing:
+            continue
+        dynamodb.create_table(
+            TableName=name,
+            KeySchema=[{'AttributeName': 'PK', 'KeyType': 'HASH'},
+                       {'AttributeName': 'SK', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'PK', 'AttributeType': 'S'},
+                                  {'AttributeName': 'SK', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+    s3 = boto3.client('s3', region_name=REGION, aws_access_key_id='bench', aws_secret_access_key='bench')
+    if config.S3_BUCKET not in {b['Name'] for b in s3.list_buckets().get('Buckets', [])}:
+        s3.create_bucket(Bucket=config.S3_BUCKET)
+
+
+@contextmanager
+def local_storage(use_mysql: bool = False, aws_endpoints: bool = False, backend: str = 'dynamodb',
+                  **config_overrides: Any) -> Iterator[StorageDynamoDB]:
+    """Yield a StorageDynamoDB wired to local stand-ins (or a StorageLocal), torn down on exit."""
+    with ExitStack() as stack:
+        if backend == 'local':
+            workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix='lumina-bench-'))
+            storage = StorageLocal(bench_config(STORAGE_BACKEND='local', LOCAL_DATA_DIR=workdir,
+                                                **config_overrides))
+            storage.migrate()
+            yield storage
+            return
+        os.environ.update({'AWS_ACCESS_KEY_ID': 'bench', 'AWS_SECRET_ACCESS_KEY': 'bench',
+                           'AWS_DEFAULT_REGION': REGION})
+        if not aws_endpoints:
+            from moto import mock_aws
+            stack.enter_context(mock_aws())
+        config = bench_config(**config_overrides)
+        create_aws_resources(config)
+        if use_mysql:
+            storage = StorageDynamoDB(config)
+        else:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix='lumina-bench-'))
+            storage = SQLiteShimStorage(config, os.path.join(workdir, 'users.db'))
+        storage.migrate()
+        yield storage
+
+
+# ----------------------------------------------------------------------
+# Seeding
+# ----------------------------------------------------------------------
+def synthetic_image(rng: random.Random, width: int = 640, height: int = 480) -> Image.Image:
+    """A distinct gradient-plus-noise image, so uploads are not deduplicated."""
+    base = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), rng.uniform(10, 60))
+    tint = tuple(rng.randrange(256) for _ in range(3))
+    return Image.merge('RGB', (base, noise, Image.new('L', (width, height), tint[2])))
+
+
+def synthetic_jpeg(rng: random.Random, width: int = 640, height: int = 480) -> bytes:
+    buffer = BytesIO()
+    synthetic_image(rng, width, height).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def seed(storage: StorageDynamoDB, users: int, friends: int, photos: int,
+         comments: int, messages: int, seed_value: int = 607) -> Dict[str, Any]:
+    """
+    Populate storage deterministically.
+
+    friends is per user (accepted requests to the next N users), comments is
+    per photo and messages is the total spread over friend pairs.
+    """
+    rng = random.Random(seed_value)
+    accounts = [storage.create_user(f'bench{i}', 'bench-password') for i in range(users)]
+    for i, account in enumerate(accounts):
+        for offset in range(1, friends + 1):
+            other = accounts[(i + offset) % users]
+            if storage.send_friend_request(account['id'], other['id']):
+                pending = storage.list_friend_requests(other['id'])
+                for request in pending:
+                    if request['requester_id'] == account['id']:
+                        storage.respond_friend_request(request['id'], other['id'], True)
+
+    photo_ids = []
+    for i in range(photos):
+        owner = accounts[i % users]
+        record = storage.add_photo(owner, rng.choice(['nature', 'city', 'food', 'memes']),
+                                   synthetic_image(rng, 320, 240), caption=f'photo {i}')
+        photo_ids.append(record['id'])
+        for c in range(comments):
+            storage.add_comment(record['id'], accounts[(i + c + 1) % users], f'comment {c}')
+
+    for m in range(messages):
+        sender = accounts[m % users]
+        receiver = accounts[(m % users + 1) % users]
+        storage.send_message(sender, receiver['id'], f'message {m}')
+
+    return {'users': accounts, 'photo_ids': photo_ids}
+
+
+# ----------------------------------------------------------------------
+# Results
+# ----------------------------------------------------------------------
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, float]:
+    """p50/p95/p99 (ms) and throughput (ops/s) of one operation."""
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'errors': errors,
+        'mean_ms': statistics.fmean(ordered) * 1000 if ordered else 0.0,
+        'p50_ms': percentile(ordered, 0.50) * 1000,
+        'p95_ms': percentile(ordered, 0.95) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'throughput_ops': len(ordered) / elapsed if elapsed else 0.0,
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Identify the run so results can be compared across commits."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+
+def write_results(results: Dict[str, Any], output: Optional[str]) -> None:
+    text = json.dumps(results, indent=2, default=str)
+    if output:
+        Path(output).write_text(text + '\n')
+    print(text)
+
+
+def timed_calls(fn: Callable[[], Any], iterations: int, warmup: int = 1) -> Dict[str, float]:
+    """Call fn sequentially and summarize its latency."""
+    for _ in range(warmup):
+        fn()
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def bench_app(storage: StorageDynamoDB, **config_overrides: Any):
+    """Build the real application (all hooks included) around an existing storage."""
+    import lumina.storage_dynamodb
+    import lumina.storage_local
+    from lumina import create_app
+
+    class BenchConfig(Config):
+        pass
+
+    module, name = ((lumina.storage_local, 'StorageLocal') if isinstance(storage, StorageLocal)
+                    else (lumina.storage_dynamodb, 'StorageDynamoDB'))
+    for key, value in {'STORAGE_BACKEND': storage.config.STORAGE_BACKEND, 'SECRET_KEY': 'bench',
+                       **config_overrides}.items():
+        setattr(BenchConfig, key, value)
+
+    # create_app constructs its own storage; hand it the seeded one instead
+    original = getattr(module, name)
+    setattr(module, name, lambda config: storage)
+    try:
+        return create_app(BenchConfig)
+    finally:
+        setattr(module, name, original)
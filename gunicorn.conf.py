@@ -0,0 +1,44 @@
+"""
+Gunicorn Configuration
+
+Loaded automatically when gunicorn is started from the project root:
+
+    gunicorn --bind 0.0.0.0:5000 app:app
+
+Prometheus multiprocess mode: when PROMETHEUS_MULTIPROC_DIR is set, every
+worker writes its metric samples into that directory and /metrics aggregates
+them. The directory is emptied when the master starts, and a worker's live
+samples are discarded when it exits.
+
+Preloading: with GUNICORN_PRELOAD_APP=1 the app is imported once in the
+master and workers are forked from it, so a new worker starts without
+re-importing anything. This is safe because the storage creates its AWS
+clients on first use in each process and opens MySQL connections per call.
+"""
+
+import os
+import shutil
+
+preload_app = os.environ.get('GUNICORN_PRELOAD_APP', '').lower() in ('1', 'true', 'yes')
+
+
+def on_starting(server):
+    """Start every deployment with an empty metrics directory."""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop the exited worker's live samples from the aggregated metrics."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def when_ready(server):
+    """With preloading, import the backend libraries once so forked workers inherit them."""
+    if preload_app:
+        import boto3  # noqa: F401
+        import pymysql  # noqa: F401
@@ -11,15 +11,21 @@ The factory pattern is a Flask best practice for production applications.
 Storage Backends:
     - MongoDB (default): Uses MongoDB + GridFS for photo storage
     - DynamoDB: Uses AWS DynamoDB + S3 for fully managed AWS storage
+    - Local: Uses SQLite + the filesystem for single-node deployments and tests
     
-Set STORAGE_BACKEND environment variable to 'mongodb' or 'dynamodb'.
+Set STORAGE_BACKEND environment variable to 'mongodb', 'dynamodb' or 'local'.
 """
 
 from __future__ import annotations
 
 from flask import Flask, send_from_directory
 
+from .admission import init_admission
+from .cli import register_cli
 from .config import Config
+from .metrics import init_metrics
+from .profiling import init_profiling
+from .responses import init_compression, init_json
 from .routes import api_blueprint, auth_blueprint
 
 
@@ -55,11 +61,28 @@ def create_app(config_class: type[Config] = Config) -> Flask:
     app.config['MAX_FULL_WIDTH'] = config.MAX_FULL_WIDTH
     app.config['MAX_THUMB_WIDTH'] = config.MAX_THUMB_WIDTH
 
+    # Fast JSON serialization and compression of large JSON responses
+    init_json(app)
+    init_compression(app)
+
+    # Per-route timings and the Prometheus /metrics endpoint
+    init_metrics(app)
+
+    # Opt-in sampling profiler and Server-Timing (no-op unless configured)
+    init_profiling(app)
+
+    # Per-user rate limits and per-route-class concurrency limits (login_required)
+    init_admission(app)
+
     # Initialize storage layer based on STORAGE_BACKEND setting
     if config.STORAGE_BACKEND == 'dynamodb':
         from .storage_dynamodb import StorageDynamoDB
         storage = StorageDynamoDB(config)
         app.logger.info("Using DynamoDB + S3 storage backend")
+    elif config.STORAGE_BACKEND == 'local':
+        from .storage_local import StorageLocal
+        storage = StorageLocal(config)
+        app.logger.info("Using local SQLite + filesystem storage backend")
     else:
         from .storage import Storage
         storage = Storage(config)
@@ -71,6 +94,9 @@ def create_app(config_class: type[Config] = Config) -> Flask:
     app.register_blueprint(api_blueprint, url_prefix='/api')
     app.register_blueprint(auth_blueprint, url_prefix='/api')
 
+    # Maintenance commands (flask --app app <command>)
+    register_cli(app)
+
     @app.route('/')
     def index():
         """Serve the single-page application HTML."""
@@ -0,0 +1,343 @@
+"""
+Admission Control Module
+
+Keeps expensive endpoints from crowding out cheap ones. Every authenticated
+request is classified (login_required does this) into a route class:
+
+    upload  - photo, album and profile-picture uploads (CPU-bound encoding)
+    scan    - whole-table feeds (scope=all) and searches
+    image   - photo and profile-picture GETs (a feed page loads dozens)
+    default - everything else (likes, comments, messages, ...)
+
+and admitted in two steps:
+
+    1. Per-user token bucket for the class (ADMISSION_<CLASS>_RATE per
+       second, ADMISSION_<CLASS>_BURST deep). An empty bucket answers 429
+       with Retry-After set to when the next token arrives.
+    2. Concurrency limit for the class across all workers
+       (ADMISSION_<CLASS>_CONCURRENCY, 0 = unlimited). A request waits at
+       most ADMISSION_QUEUE_TARGET seconds for a slot and is then shed with
+       503 + Retry-After, so requests never queue behind a backlog they
+       cannot get through.
+
+A request that turns out to cost more than one token once its body is
+read (an album upload pays per photo) is charged the difference with
+charge(); the bucket may go into debt, delaying the user's next requests
+in that class rather than failing the one already admitted.
+
+State lives in a small memory-mapped file guarded by flock, so limits hold
+across gunicorn workers. Set ADMISSION_STATE_PATH (e.g. on /dev/shm) to
+share one file between all workers of a deployment; by default a temporary
+file is created when the app is built, which is shared only by workers
+forked from a preloaded app (GUNICORN_PRELOAD_APP). Slots held by a worker
+that died are reclaimed the next time its class is at its limit.
+"""
+
+from __future__ import annotations
+
+import atexit
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Mapping, NamedTuple, Optional, Union
+
+from flask import Flask
+
+from .metrics import ADMISSION_SHED, ADMISSION_WAIT
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: limits are then per process
+    fcntl = None
+
+ROUTE_CLASSES = ('default', 'scan', 'upload', 'image')
+
+# Poll interval while waiting for a concurrency slot (workers share no condition variable)
+QUEUE_POLL_INTERVAL = 0.005
+
+# File layout: header, one row per worker process, then the user bucket table
+MAGIC = b'LUMADM02'
+WORKER_ROWS = 256
+WORKER_ROW = struct.Struct('<q%di' % len(ROUTE_CLASSES))        # pid, in-flight per class
+WORKER_TABLE = struct.Struct('<' + WORKER_ROW.format[1:] * WORKER_ROWS)
+BUCKET_ROW = struct.Struct('<qi4xdd')                           # user id, class + 1, tokens, updated
+BUCKET_PROBE = 8
+WORKERS_OFFSET = len(MAGIC)
+BUCKETS_OFFSET = WORKERS_OFFSET + WORKER_ROWS * WORKER_ROW.size
+
+
+class Rejection(NamedTuple):
+    """Why a request was not admitted and when the client should retry."""
+    status: int
+    retry_after: int
+    reason: str
+
+
+def admission_class(route_class: Union[str, Callable[[], str]]):
+    """
+    Tag a view with its route class; login_required reads the tag.
+
+    route_class may be a callable evaluated per request, for views whose cost
+    depends on their arguments. Apply it below @login_required.
+    """
+    def decorate(fn):
+        fn.admission_class = route_class
+        return fn
+
+    return decorate
+
+
+class _ProcessState(NamedTuple):
+    pid: int
+    fd: int
+    buffer: mmap.mmap
+    row: int
+
+
+class AdmissionController:
+    """Per-user token buckets and cross-worker concurrency limits per route class."""
+
+    def __init__(self, settings: Mapping[str, Any]) -> None:
+        """Read the ADMISSION_* settings (app.config); the state file is opened lazily per process."""
+        self.rates = {name: settings[f'ADMISSION_{name.upper()}_RATE'] for name in ROUTE_CLASSES}
+        self.bursts = {name: settings[f'ADMISSION_{name.upper()}_BURST'] for name in ROUTE_CLASSES}
+        self.concurrency = {name: settings[f'ADMISSION_{name.upper()}_CONCURRENCY'] for name in ROUTE_CLASSES}
+        self.queue_target = settings['ADMISSION_QUEUE_TARGET']
+        self.user_slots = settings['ADMISSION_USER_SLOTS']
+        self.size = BUCKETS_OFFSET + self.user_slots * BUCKET_ROW.size
+
+        self.path = str(settings['ADMISSION_STATE_PATH'] or '')
+        if not self.path:
+            fd, self.path = tempfile.mkstemp(prefix='lumina-admission-')
+            os.close(fd)
+            atexit.register(_unlink, self.path, os.getpid())
+
+        self._state: Optional[_ProcessState] = None
+        self._thread_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Admission
+    # ------------------------------------------------------------------
+    def admit(self, user_id: int, route_class: str) -> Union[Callable[[], None], Rejection]:
+        """
+        Admit one request; return a release callable, or a Rejection to send.
+
+        The release callable must be called exactly once when the request
+        (including a streamed body) is finished.
+        """
+        retry_after = self._take_token(user_id, route_class)
+        if retry_after:
+            ADMISSION_SHED.labels(route_class, 'rate').inc()
+            return Rejection(429, retry_after, 'too many requests, slow down')
+
+        limit = self.concurrency[route_class]
+        if limit <= 0:
+            return _noop
+        start = time.perf_counter()
+        reclaimed = False
+        while True:
+            with self._locked() as state:
+                if self._in_flight(state, route_class) < limit:
+                    self._add_in_flight(state, route_class, 1)
+                    break
+                if not reclaimed:
+                    reclaimed = True
+                    self._reclaim_dead_workers(state)
+                    continue
+            if time.perf_counter() - start >= self.queue_target:
+                ADMISSION_WAIT.labels(route_class).observe(time.perf_counter() - start)
+                ADMISSION_SHED.labels(route_class, 'concurrency').inc()
+                # The request never ran; give its token back
+                self._return_token(user_id, route_class)
+                return Rejection(503, 1, 'server is busy, try again shortly')
+            time.sleep(QUEUE_POLL_INTERVAL)
+        ADMISSION_WAIT.labels(route_class).observe(time.perf_counter() - start)
+
+        released = threading.Event()
+
+        def release() -> None:
+            if not released.is_set():
+                released.set()
+                with self._locked() as state:
+                    self._add_in_flight(state, route_class, -1)
+
+        return release
+
+    def charge(self, user_id: int, route_class: str, amount: float) -> None:
+        """Debit amount more tokens for an admitted request; the bucket may go negative."""
+        rate = self.rates[route_class]
+        if rate <= 0 or amount <= 0:
+            return
+        burst = self.bursts[route_class]
+        with self._locked() as state:
+            offset, tokens = self._bucket(state, user_id, route_class, rate, burst)
+            self._store_bucket(state, offset, user_id, route_class, tokens - amount)
+
+    # ------------------------------------------------------------------
+    # Per-user token buckets
+    # ------------------------------------------------------------------
+    def _take_token(self, user_id: int, route_class: str) -> int:
+        """Take a token; return 0 on success, else whole seconds until one is available."""
+        rate = self.rates[route_class]
+        if rate <= 0:
+            return 0
+        burst = self.bursts[route_class]
+        with self._locked() as state:
+            offset, tokens = self._bucket(state, user_id, route_class, rate, burst)
+            if tokens < 1:
+                return max(1, math.ceil((1 - tokens) / rate))
+            self._store_bucket(state, offset, user_id, route_class, tokens - 1)
+        return 0
+
+    def _return_token(self, user_id: int, route_class: str) -> None:
+        rate = self.rates[route_class]
+        if rate <= 0:
+            return
+        burst = self.bursts[route_class]
+        with self._locked() as state:
+            offset, tokens = self._bucket(state, user_id, route_class, rate, burst)
+            self._store_bucket(state, offset, user_id, route_class, min(burst, tokens + 1))
+
+    def _bucket(self, state: _ProcessState, user_id: int, route_class: str,
+                rate: float, burst: float):
+        """
+        Find (or claim) the bucket row for user_id and return (offset, refilled tokens).
+
+        Rows are probed linearly from the hash slot; when the whole window is
+        taken, the least recently used row is reused (an idle bucket is full
+        anyway).
+        """
+        class_id = ROUTE_CLASSES.index(route_class) + 1
+        # Wall-clock time: a state file may outlive a reboot, monotonic clocks do not
+        now = time.time()
+        home = hash((user_id, class_id)) % self.user_slots
+        victim, victim_updated = None, math.inf
+        for probe in range(BUCKET_PROBE):
+            offset = BUCKETS_OFFSET + ((home + probe) % self.user_slots) * BUCKET_ROW.size
+            row_user, row_class, tokens, updated = BUCKET_ROW.unpack_from(state.buffer, offset)
+            if row_class == class_id and row_user == user_id:
+                return offset, min(burst, tokens + max(0.0, now - updated) * rate)
+            if row_class == 0:
+                return offset, burst
+            if updated < victim_updated:
+                victim, victim_updated = offset, updated
+        return victim, burst
+
+    @staticmethod
+    def _store_bucket(state: _ProcessState, offset: int, user_id: int, route_class: str,
+                      tokens: float) -> None:
+        BUCKET_ROW.pack_into(state.buffer, offset, user_id, ROUTE_CLASSES.index(route_class) + 1,
+                             tokens, time.time())
+
+    # ------------------------------------------------------------------
+    # Cross-worker concurrency
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _in_flight(state: _ProcessState, route_class: str) -> int:
+        index = ROUTE_CLASSES.index(route_class) + 1
+        return sum(WORKER_TABLE.unpack_from(state.buffer, WORKERS_OFFSET)[index::len(ROUTE_CLASSES) + 1])
+
+    @staticmethod
+    def _add_in_flight(state: _ProcessState, route_class: str, delta: int) -> None:
+        offset = WORKERS_OFFSET + state.row * WORKER_ROW.size
+        values = list(WORKER_ROW.unpack_from(state.buffer, offset))
+        values[0] = state.pid
+        values[ROUTE_CLASSES.index(route_class) + 1] += delta
+        WORKER_ROW.pack_into(state.buffer, offset, *values)
+
+    @staticmethod
+    def _reclaim_dead_workers(state: _ProcessState) -> None:
+        for row in range(WORKER_ROWS):
+            offset = WORKERS_OFFSET + row * WORKER_ROW.size
+            pid = WORKER_ROW.unpack_from(state.buffer, offset)[0]
+            if pid and pid != state.pid and not _pid_alive(pid):
+                WORKER_ROW.pack_into(state.buffer, offset, 0, *([0] * len(ROUTE_CLASSES)))
+
+    # ------------------------------------------------------------------
+    # Shared state
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _locked(self) -> Iterator[_ProcessState]:
+        """Hold the in-process lock and the cross-process flock around a state update."""
+        with self._thread_lock:
+            state = self._process_state()
+            if fcntl is not None:
+                fcntl.flock(state.fd, fcntl.LOCK_EX)
+            try:
+                yield state
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(state.fd, fcntl.LOCK_UN)
+
+    def _process_state(self) -> _ProcessState:
+        # Called with _thread_lock held. flock locks belong to the open file, so
+        # a forked worker must open its own rather than share the parent's
+        state = self._state
+        if state is not None and state.pid == os.getpid():
+            return state
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            buffer = mmap.mmap(fd, self.size)
+            if buffer[:len(MAGIC)] != MAGIC:
+                buffer[:] = bytes(self.size)
+                buffer[:len(MAGIC)] = MAGIC
+            row = _claim_worker_row(buffer, os.getpid())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        self._state = state = _ProcessState(os.getpid(), fd, buffer, row)
+        return state
+
+
+def _claim_worker_row(buffer: mmap.mmap, pid: int) -> int:
+    """Take a free row (or one left by a dead process) for this process's in-flight counts."""
+    fallback = None
+    for row in range(WORKER_ROWS):
+        row_pid = WORKER_ROW.unpack_from(buffer, WORKERS_OFFSET + row * WORKER_ROW.size)[0]
+        if row_pid == 0 or row_pid == pid:
+            fallback = row
+            break
+        if fallback is None and not _pid_alive(row_pid):
+            fallback = row
+    if fallback is None:
+        raise RuntimeError(f'admission state supports at most {WORKER_ROWS} worker processes')
+    WORKER_ROW.pack_into(buffer, WORKERS_OFFSET + fallback * WORKER_ROW.size, pid, *([0] * len(ROUTE_CLASSES)))
+    return fallback
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _unlink(path: str, owner_pid: int) -> None:
+    # Only the process that created the default temp file removes it
+    if os.getpid() == owner_pid:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _noop() -> None:
+    pass
+
+
+def init_admission(app: Flask) -> None:
+    """Install the admission controller used by login_required (if enabled)."""
+    if app.config['ADMISSION_ENABLED']:
+        app.extensions['admission'] = AdmissionController(app.config)
@@ -0,0 +1,156 @@
+"""
+ASGI Application Module
+
+Serves the regular Flask app from an ASGI server:
+
+    uvicorn --factory lumina.asgi:create_asgi_app --workers 4
+
+Each request runs the Flask routes unchanged, so metrics, profiling and
+admission apply as they do under gunicorn, on a thread pool of ASGI_THREADS
+per process. The event loop only parses HTTP and moves bytes; request bodies
+are spooled before the route runs and response chunks are sent as the route
+produces them, so streamed feeds and images keep bounded memory.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import create_app
+from .config import Config
+
+# Request bodies larger than this are spooled to a temporary file
+BODY_MEMORY_LIMIT = 1024 * 1024
+
+
+class WSGIThreadApp:
+    """ASGI callable that runs a WSGI app on a bounded thread pool."""
+
+    def __init__(self, wsgi_app: Callable, threads: int) -> None:
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max(threads, 1), thread_name_prefix='asgi')
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f"unsupported ASGI scope type {scope['type']!r}")
+
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_MEMORY_LIMIT)
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            environ = _environ(scope, body, body.tell())
+            body.seek(0)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._run, environ, send, loop)
+        finally:
+            body.close()
+
+    async def _lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _run(self, environ: Dict[str, Any], send: Callable, loop: asyncio.AbstractEventLoop) -> None:
+        """Call the WSGI app on a pool thread, forwarding its response to the event loop."""
+        def call(message: Dict[str, Any]) -> None:
+            # Blocks this thread until the server has taken the message (backpressure)
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response: List[Any] = []
+        started = False
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None) -> Callable:
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [status, headers]
+            return lambda data: None
+
+        def start() -> None:
+            status, headers = response
+            call({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            })
+
+        result: Iterable[bytes] = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started:
+                    start()
+                    started = True
+                call({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                start()
+            call({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+def _environ(scope: Dict[str, Any], body: Any, length: int) -> Dict[str, Any]:
+    """Build the WSGI environ (PEP 3333) for an ASGI HTTP scope and its spooled body."""
+    server: Optional[Tuple[str, int]] = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        # Repeated headers are joined as HTTP allows (cookies with '; ')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    # The body is complete, so its length is known even for chunked uploads
+    environ['CONTENT_LENGTH'] = str(length)
+    return environ
+
+
+def create_asgi_app(config_class: type[Config] = Config) -> WSGIThreadApp:
+    """
+    Build the ASGI application.
+
+    Args:
+        config_class: Configuration class passed to create_app
+
+    Returns:
+        WSGIThreadApp: ASGI callable for uvicorn/hypercorn
+    """
+    app = create_app(config_class)
+    return WSGIThreadApp(app, config_class.ASGI_THREADS)
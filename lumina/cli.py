@@ -0,0 +1,117 @@
+"""
+Command Line Interface Module
+
+Maintenance commands registered on the Flask CLI. Run them with:
+
+    flask --app app <command>
+
+Commands:
+    migrate               - Create the MySQL database and tables (run once per deploy)
+    backfill-placeholders - Compute LQIP placeholders for existing photos
+    backfill-inbox        - Build conversation inbox entries for existing messages
+    backfill-comment-counts - Recount each photo's comment count and comment preview
+    transfer              - Copy all data between backends or to/from a directory (resumable)
+    encoder-report        - Compare fixed and adaptive JPEG sizes for sample images
+"""
+
+from __future__ import annotations
+
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
+from PIL import Image
+
+from .imaging import encode_variant, normalize_image
+
+
+def register_cli(app: Flask) -> None:
+    """Attach the maintenance commands to the application's CLI group."""
+    app.cli.add_command(migrate)
+    app.cli.add_command(backfill_placeholders)
+    app.cli.add_command(backfill_inbox)
+    app.cli.add_command(backfill_comment_counts)
+    app.cli.add_command(transfer)
+    app.cli.add_command(encoder_report)
+
+
+@click.command('migrate')
+@with_appcontext
+def migrate() -> None:
+    """Create the database schema; workers no longer do this at boot."""
+    current_app.extensions['photo_storage'].migrate()
+    click.echo("Schema is up to date")
+
+
+@click.command('backfill-placeholders')
+@click.option('--workers', default=8, show_default=True,
+              help='Maximum number of thumbnails processed concurrently.')
+@with_appcontext
+def backfill_placeholders(workers: int) -> None:
+    """Compute inline placeholders for photos uploaded before they existed."""
+    storage = current_app.extensions['photo_storage']
+    updated = storage.backfill_placeholders(max_workers=workers)
+    click.echo(f"Updated {updated} photo(s)")
+
+
+@click.command('backfill-inbox')
+@with_appcontext
+def backfill_inbox() -> None:
+    """Create inbox entries for conversations started before the inbox existed."""
+    created = current_app.extensions['photo_storage'].backfill_inbox()
+    click.echo(f"Created {created} inbox entr{'y' if created == 1 else 'ies'}")
+
+
+@click.command('backfill-comment-counts')
+@with_appcontext
+def backfill_comment_counts() -> None:
+    """Store comment counts and previews on photos commented before they existed."""
+    updated = current_app.extensions['photo_storage'].backfill_comment_counts()
+    click.echo(f"Updated {updated} photo(s)")
+
+
+@click.command('transfer')
+@click.option('--source', required=True, help='mongodb, dynamodb or dir:PATH.')
+@click.option('--dest', required=True, help='mongodb, dynamodb or dir:PATH.')
+@click.option('--segments', default=4, show_default=True,
+              help='Parallel scan segments per DynamoDB stream.')
+@click.option('--workers', default=4, show_default=True, help='Segments read and written concurrently.')
+@click.option('--copy-workers', default=8, show_default=True, help='Images copied concurrently.')
+@click.option('--page-size', default=100, show_default=True, help='Records read and written per batch.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False),
+              help='Progress file; run again with the same file to resume.')
+@with_appcontext
+def transfer(source: str, dest: str, segments: int, workers: int, copy_workers: int, page_size: int,
+             checkpoint: str) -> None:
+    """Stream photos, images, comments and messages from one backend to another."""
+    from . import transfer as data_transfer
+
+    config = current_app.extensions['photo_storage'].config
+    try:
+        progress = data_transfer.Checkpoint(checkpoint, source, dest)
+        endpoints = data_transfer.open_storage(source, config), data_transfer.open_storage(dest, config)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    written = data_transfer.transfer(*endpoints, progress, segments=segments, workers=workers,
+                                     copy_workers=copy_workers, page_size=page_size, echo=click.echo)
+    click.echo("Copied " + ", ".join(f"{count} {stream}" for stream, count in written.items()))
+
+
+@click.command('encoder-report')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def encoder_report(paths) -> None:
+    """Report bytes saved by the adaptive encoder over the fixed one."""
+    config = current_app.config
+    total = baseline = 0
+    for path in paths:
+        with Image.open(path) as source:
+            image = normalize_image(source.convert('RGB'))
+        for variant, max_width in (('thumb', config['MAX_THUMB_WIDTH']), ('full', config['MAX_FULL_WIDTH'])):
+            encoded = encode_variant(image, max_width, mode='adaptive',
+                                     ssim_target=config['JPEG_SSIM_TARGET'])
+            total += len(encoded.data)
+            baseline += encoded.baseline_size
+            click.echo(f"{path} [{variant}] q={encoded.quality} "
+                       f"{encoded.baseline_size} -> {len(encoded.data)} bytes "
+                       f"({encoded.bytes_saved / encoded.baseline_size:.1%} saved)")
+    click.echo(f"Total: {baseline} -> {total} bytes ({(baseline - total) / baseline:.1%} saved)")
@@ -14,11 +14,14 @@ Environment Variables:
     DB_NAME         - MySQL database name (default: lumina)
     
     Storage Backend (choose one):
-    STORAGE_BACKEND - 'mongodb' or 'dynamodb' (default: mongodb)
+    STORAGE_BACKEND - 'mongodb', 'dynamodb' or 'local' (default: mongodb)
     
     MongoDB Configuration:
     MONGO_URI       - MongoDB connection string (default: mongodb://localhost:27017)
     MONGO_DB        - MongoDB database name (default: lumina)
+    MONGO_MAX_POOL_SIZE     - Connections per process in the shared MongoClient (default: 100)
+    MONGO_MIN_POOL_SIZE     - Connections kept open when idle (default: 0)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS - Longest wait for a pooled connection (default: 2000)
     
     AWS/DynamoDB Configuration:
     AWS_REGION          - AWS region (default: us-east-1)
@@ -28,6 +31,60 @@ Environment Variables:
     DYNAMODB_PHOTOS_TABLE   - DynamoDB table for photos (default: lumina_photos)
     DYNAMODB_COMMENTS_TABLE - DynamoDB table for comments (default: lumina_comments)
     DYNAMODB_MESSAGES_TABLE - DynamoDB table for messages (default: lumina_messages)
+    DYNAMODB_READ_CAPACITY  - Read units/s each process spends per table (default: 25; 0 disables
+                              the limiter); set to provisioned RCU divided by the process count
+    DYNAMODB_WRITE_CAPACITY - Write units/s each process spends per table (default: 25; 0 disables)
+    DYNAMODB_THROTTLE_MAX_WAIT - Longest a call waits for capacity before going ahead (default: 1.0 s)
+    DYNAMODB_SCAN_SEGMENTS  - Parallel segments for full-table scans: 'all' feeds, backfills (default: 4)
+    DYNAMODB_SCAN_READ_RATE - Read units/s one full-table scan may spend across its segments
+                              (default: 0, bounded only by DYNAMODB_READ_CAPACITY)
+    AWS_RETRY_MODE      - botocore retry mode (default: adaptive)
+    AWS_MAX_ATTEMPTS    - Attempts per call, including the first (default: 8)
+    AWS_MAX_POOL_CONNECTIONS - Kept-alive HTTP connections per boto3 client (default: 50)
+
+    Local Configuration:
+    LOCAL_DATA_DIR      - SQLite database and image files (default: <repo>/data)
+
+    Image Encoding:
+    JPEG_ENCODER        - 'adaptive' or 'fixed' (default: adaptive)
+    JPEG_SSIM_TARGET    - Minimum luma SSIM for adaptive variants (default: 0.95)
+
+    Bulk Upload (POST /api/photos/bulk):
+    BULK_UPLOAD_MAX_FILES - Most photos per request, files plus zip members (default: 50)
+    BULK_UPLOAD_MAX_BYTES - Most uncompressed bytes extracted from a zip (default: 256 MiB)
+    BULK_UPLOAD_WORKERS   - Threads decoding and encoding one request's photos (default: 4)
+
+    Password Hashing:
+    PASSWORD_HASH_METHOD  - werkzeug method as written in the hash prefix (default: scrypt:32768:8:1);
+                            older hashes are upgraded on the next login
+    PASSWORD_HASH_WORKERS - KDF processes per app process (default: 2; 0 hashes inline)
+    PASSWORD_HASH_QUEUE   - Hashes allowed to wait for a worker before shedding with 503 (default: 8)
+
+    Admission Control (per route class: DEFAULT, SCAN, UPLOAD, IMAGE; see lumina/admission.py):
+    ADMISSION_ENABLED       - Apply per-user rate limits and concurrency limits (default: true)
+    ADMISSION_<CLASS>_RATE  - Requests (upload: photos) per second per user (default: 20 / 2 / 1 / 200; 0 = unlimited)
+    ADMISSION_<CLASS>_BURST - Requests a user may make at once (default: 60 / 10 / 20 / 400)
+    ADMISSION_<CLASS>_CONCURRENCY - In-flight requests across all workers (default: 0 / 8 / 4 / 0; 0 = unlimited)
+    ADMISSION_QUEUE_TARGET  - Longest wait for a concurrency slot before answering 503 (default: 0.1 s)
+    ADMISSION_STATE_PATH    - Shared state file for all workers, e.g. /dev/shm/lumina-admission
+                              (default: a temp file shared by workers forked from a preloaded app)
+    ADMISSION_USER_SLOTS    - Per-user buckets kept before the least recently used are reused (default: 16384)
+
+    Responses:
+    JSON_COMPRESS_MIN_SIZE - Smallest JSON body (bytes) sent gzip/brotli encoded (default: 1024)
+
+    ASGI Serving (see lumina/asgi.py):
+    ASGI_THREADS - Requests one ASGI process runs at once on its thread pool (default: 50)
+
+    Observability:
+    METRICS_ENABLED          - Collect Prometheus metrics (default: true)
+    METRICS_TOKEN            - Bearer token scrapers send to read /metrics (default: unset, not served)
+    PROMETHEUS_MULTIPROC_DIR - Shared sample directory for multi-worker gunicorn
+    PROFILE_SAMPLE_RATE      - Fraction of requests to profile (default: 0, disabled)
+    PROFILE_TOKEN            - Requests sending this X-Profile-Token are always profiled
+    PROFILE_DIR              - Where profiles are written (default: ./profiles)
+    PROFILE_FORMAT           - 'collapsed' or 'speedscope' (default: collapsed)
+    PROFILE_INTERVAL         - Stack sampling interval in seconds (default: 0.005)
 """
 
 from __future__ import annotations
@@ -55,7 +112,7 @@ class Config:
     # Security - MUST be set in production
     SECRET_KEY: str = os.environ.get('SECRET_KEY', 'dev-secret-change-me')
 
-    # Storage backend selection: 'mongodb' or 'dynamodb'
+    # Storage backend selection: 'mongodb', 'dynamodb' or 'local'
     STORAGE_BACKEND: str = os.environ.get('STORAGE_BACKEND', 'mongodb')
 
     # MySQL configuration (user authentication & friendships)
@@ -68,6 +125,13 @@ class Config:
     # MongoDB configuration (for STORAGE_BACKEND='mongodb')
     MONGO_URI: str = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
     MONGO_DB: str = os.environ.get('MONGO_DB', 'lumina')
+    # One MongoClient per process is shared by every request thread; a saturated
+    # pool fails fast after MONGO_WAIT_QUEUE_TIMEOUT_MS instead of queueing forever
+    MONGO_MAX_POOL_SIZE: int = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+    MONGO_MIN_POOL_SIZE: int = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '60000'))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000'))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
 
     # AWS configuration (for STORAGE_BACKEND='dynamodb')
     AWS_REGION: str = os.environ.get('AWS_REGION', 'us-east-1')
@@ -78,7 +142,75 @@ class Config:
     DYNAMODB_COMMENTS_TABLE: str = os.environ.get('DYNAMODB_COMMENTS_TABLE', 'lumina_comments')
     DYNAMODB_MESSAGES_TABLE: str = os.environ.get('DYNAMODB_MESSAGES_TABLE', 'lumina_messages')
 
+    # Throttling: per-table token buckets sized from provisioned capacity, plus
+    # jittered adaptive retries, so throttles become short waits rather than errors
+    DYNAMODB_READ_CAPACITY: float = float(os.environ.get('DYNAMODB_READ_CAPACITY', '25'))
+    DYNAMODB_WRITE_CAPACITY: float = float(os.environ.get('DYNAMODB_WRITE_CAPACITY', '25'))
+    DYNAMODB_THROTTLE_MAX_WAIT: float = float(os.environ.get('DYNAMODB_THROTTLE_MAX_WAIT', '1.0'))
+    AWS_RETRY_MODE: str = os.environ.get('AWS_RETRY_MODE', 'adaptive')
+    AWS_MAX_ATTEMPTS: int = int(os.environ.get('AWS_MAX_ATTEMPTS', '8'))
+    AWS_MAX_POOL_CONNECTIONS: int = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '50'))
+
+    # Full-table scans (parallel_scan): segments read concurrently and their combined read rate
+    DYNAMODB_SCAN_SEGMENTS: int = int(os.environ.get('DYNAMODB_SCAN_SEGMENTS', '4'))
+    DYNAMODB_SCAN_READ_RATE: float = float(os.environ.get('DYNAMODB_SCAN_READ_RATE', '0'))
+
+    # Single-node configuration (for STORAGE_BACKEND='local')
+    LOCAL_DATA_DIR: Path = Path(os.environ.get('LOCAL_DATA_DIR', str(BASE_DIR / 'data')))
+
     # Image processing constraints
     MAX_FULL_WIDTH: int = 1200   # Maximum width for full-resolution images
     MAX_THUMB_WIDTH: int = 400   # Maximum width for thumbnail images
     MAX_THUMB_WIDTH: int = 400   # Maximum width for thumbnail images
+
+    # Album uploads: photos are processed concurrently and their metadata written in batches
+    BULK_UPLOAD_MAX_FILES: int = int(os.environ.get('BULK_UPLOAD_MAX_FILES', '50'))
+    BULK_UPLOAD_MAX_BYTES: int = int(os.environ.get('BULK_UPLOAD_MAX_BYTES', str(256 * 1024 * 1024)))
+    BULK_UPLOAD_WORKERS: int = int(os.environ.get('BULK_UPLOAD_WORKERS', '4'))
+
+    # JPEG encoding: 'adaptive' searches the smallest quality meeting the SSIM target,
+    # 'fixed' always encodes at quality 85
+    JPEG_ENCODER: str = os.environ.get('JPEG_ENCODER', 'adaptive')
+    JPEG_SSIM_TARGET: float = float(os.environ.get('JPEG_SSIM_TARGET', '0.95'))
+
+    # Password KDF runs in a bounded process pool so logins cannot starve other routes
+    PASSWORD_HASH_METHOD: str = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS: int = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_QUEUE: int = int(os.environ.get('PASSWORD_HASH_QUEUE', '8'))
+    PASSWORD_HASH_TIMEOUT: float = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '5'))
+
+    # Admission control: per-user token buckets and cross-worker concurrency limits
+    # per route class, shedding with 429/503 + Retry-After instead of queueing
+    ADMISSION_ENABLED: bool = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+    ADMISSION_DEFAULT_RATE: float = float(os.environ.get('ADMISSION_DEFAULT_RATE', '20'))
+    ADMISSION_DEFAULT_BURST: float = float(os.environ.get('ADMISSION_DEFAULT_BURST', '60'))
+    ADMISSION_DEFAULT_CONCURRENCY: int = int(os.environ.get('ADMISSION_DEFAULT_CONCURRENCY', '0'))
+    ADMISSION_SCAN_RATE: float = float(os.environ.get('ADMISSION_SCAN_RATE', '2'))
+    ADMISSION_SCAN_BURST: float = float(os.environ.get('ADMISSION_SCAN_BURST', '10'))
+    ADMISSION_SCAN_CONCURRENCY: int = int(os.environ.get('ADMISSION_SCAN_CONCURRENCY', '8'))
+    ADMISSION_UPLOAD_RATE: float = float(os.environ.get('ADMISSION_UPLOAD_RATE', '1'))
+    ADMISSION_UPLOAD_BURST: float = float(os.environ.get('ADMISSION_UPLOAD_BURST', '20'))
+    ADMISSION_UPLOAD_CONCURRENCY: int = int(os.environ.get('ADMISSION_UPLOAD_CONCURRENCY', '4'))
+    ADMISSION_IMAGE_RATE: float = float(os.environ.get('ADMISSION_IMAGE_RATE', '200'))
+    ADMISSION_IMAGE_BURST: float = float(os.environ.get('ADMISSION_IMAGE_BURST', '400'))
+    ADMISSION_IMAGE_CONCURRENCY: int = int(os.environ.get('ADMISSION_IMAGE_CONCURRENCY', '0'))
+    ADMISSION_QUEUE_TARGET: float = float(os.environ.get('ADMISSION_QUEUE_TARGET', '0.1'))
+    ADMISSION_STATE_PATH: str = os.environ.get('ADMISSION_STATE_PATH', '')
+    ADMISSION_USER_SLOTS: int = int(os.environ.get('ADMISSION_USER_SLOTS', '16384'))
+
+    # JSON responses at least this large are gzip/brotli encoded when the client accepts it
+    JSON_COMPRESS_MIN_SIZE: int = int(os.environ.get('JSON_COMPRESS_MIN_SIZE', '1024'))
+
+    # ASGI serving: the Flask app runs on a thread pool of this size per process
+    ASGI_THREADS: int = int(os.environ.get('ASGI_THREADS', '50'))
+
+    # Prometheus metrics, served at /metrics only to requests carrying this bearer token
+    METRICS_ENABLED: bool = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_TOKEN: str = os.environ.get('METRICS_TOKEN', '')
+
+    # Sampling profiler: profiled requests are written to PROFILE_DIR/<endpoint>/
+    PROFILE_SAMPLE_RATE: float = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_TOKEN: str = os.environ.get('PROFILE_TOKEN', '')
+    PROFILE_DIR: Path = Path(os.environ.get('PROFILE_DIR', str(BASE_DIR / 'profiles')))
+    PROFILE_FORMAT: str = os.environ.get('PROFILE_FORMAT', 'collapsed')
+    PROFILE_INTERVAL: float = float(os.environ.get('PROFILE_INTERVAL', '0.005'))
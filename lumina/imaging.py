@@ -0,0 +1,213 @@
+"""
+Image Processing Module
+
+Pillow helpers shared by the storage backends:
+    - normalize_image: apply EXIF orientation, convert to sRGB, drop metadata
+    - encode_variant: resize and JPEG-encode a variant (fixed or adaptive quality)
+    - placeholder_fields: tiny LQIP data URI and dominant color for feed items
+    - content_hash: digest of the decoded pixels used for content addressing
+
+Encoder Modes:
+    fixed    - quality 85 baseline JPEG (the original behaviour)
+    adaptive - progressive JPEG whose quality is binary-searched per variant
+               for the smallest file that still meets an SSIM target
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+from io import BytesIO
+from typing import Dict, NamedTuple, Tuple
+
+from PIL import Image, ImageMath, ImageOps, features
+
+from .metrics import timed_stage
+
+try:
+    from PIL import ImageCms
+    SRGB_PROFILE = ImageCms.createProfile('sRGB')
+except ImportError:  # Pillow built without littlecms
+    ImageCms = None
+    SRGB_PROFILE = None
+
+# Longest edge (px) of the inline LQIP placeholder embedded in feed items
+PLACEHOLDER_SIZE = 16
+
+# A 16 px WebP is ~100 bytes; JPEG's fixed headers alone are ~300, so it is only
+# the fallback for Pillow builds without libwebp
+PLACEHOLDER_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+PLACEHOLDER_QUALITY = 40
+
+# Quality used by the fixed encoder, and as the baseline adaptive savings are measured against
+BASELINE_QUALITY = 85
+
+# Quality search range for the adaptive encoder
+MIN_QUALITY = 40
+MAX_QUALITY = 92
+
+# At or above this quality the content has fine chroma detail (text, graphics),
+# so a full-resolution chroma encode (4:4:4 instead of 4:2:0) is tried; it is
+# kept only if it is no larger
+FULL_CHROMA_QUALITY = 88
+
+# SSIM stabilizing constants for 8-bit luma
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+_SSIM_BLOCK = 8
+
+
+class EncodedVariant(NamedTuple):
+    """JPEG bytes for one variant, plus what the fixed encoder would have produced."""
+    data: bytes
+    quality: int
+    baseline_size: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.baseline_size - len(self.data)
+
+
+@timed_stage('normalize')
+def normalize_image(image: Image.Image) -> Image.Image:
+    """
+    Bring an uploaded image into the canonical form every variant is built from.
+
+    Applies the EXIF orientation (so clients no longer rotate photos themselves),
+    converts embedded ICC profiles to sRGB, and drops EXIF/ICC metadata.
+    """
+    ImageOps.exif_transpose(image, in_place=True)
+    icc_profile = image.info.get('icc_profile')
+    if icc_profile and ImageCms is not None:
+        try:
+            image = ImageCms.profileToProfile(
+                image, ImageCms.ImageCmsProfile(BytesIO(icc_profile)), SRGB_PROFILE, outputMode='RGB'
+            )
+        except (ImageCms.PyCMSError, OSError):
+            pass
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.info = {}
+    return image
+
+
+@timed_stage('hash')
+def content_hash(image: Image.Image) -> str:
+    """SHA-256 over the decoded pixels, so re-encoded or re-tagged copies match."""
+    digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def scaled_size(size: Tuple[int, int], max_width: int) -> Tuple[int, int]:
+    """Return (width, height) after constraining width to max_width."""
+    width, height = size
+    if width > max_width:
+        return max_width, int(height * max_width / width)
+    return width, height
+
+
+@timed_stage('placeholder')
+def placeholder_fields(image: Image.Image) -> Dict[str, str]:
+    """Build a tiny (~150 character) WebP data URI and the dominant color for LQIP rendering."""
+    width, height = image.size
+    scale = PLACEHOLDER_SIZE / max(width, height)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    img = image.resize(size, Image.BOX)
+    buffer = BytesIO()
+    if PLACEHOLDER_FORMAT == 'WEBP':
+        img.save(buffer, format='WEBP', quality=PLACEHOLDER_QUALITY, method=6)
+    else:
+        img.save(buffer, format='JPEG', quality=PLACEHOLDER_QUALITY, optimize=True)
+    data = base64.b64encode(buffer.getvalue()).decode('ascii')
+
+    # Most frequent entry of a 4-color palette is the dominant color
+    paletted = img.quantize(colors=4)
+    _, index = max(paletted.getcolors())
+    r, g, b = paletted.getpalette()[index * 3:index * 3 + 3]
+    return {
+        'placeholder': f'data:image/{PLACEHOLDER_FORMAT.lower()};base64,{data}',
+        'dominant_color': f'#{r:02x}{g:02x}{b:02x}',
+    }
+
+
+@timed_stage('encode')
+def encode_variant(image: Image.Image, max_width: int, mode: str = 'fixed',
+                   ssim_target: float = 0.95) -> EncodedVariant:
+    """
+    Resize image to max_width and encode it as JPEG.
+
+    In 'adaptive' mode the quality is binary-searched for the smallest
+    progressive JPEG whose luma SSIM against the resized source is at least
+    ssim_target. The baseline is returned instead when it is smaller and
+    meets the target too, so adaptive never stores more bytes than fixed
+    would for the same fidelity. Metadata is never written.
+    """
+    img = image
+    if img.width > max_width:
+        img = img.resize(scaled_size(img.size, max_width), Image.LANCZOS)
+
+    baseline = _encode(img, quality=BASELINE_QUALITY, progressive=False)
+    if mode != 'adaptive':
+        return EncodedVariant(baseline, BASELINE_QUALITY, len(baseline))
+
+    reference = img.convert('L')
+    lo, hi = MIN_QUALITY, MAX_QUALITY
+    best, best_quality = None, MAX_QUALITY
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        data = _encode(img, quality=quality)
+        if ssim(reference, Image.open(BytesIO(data)).convert('L')) >= ssim_target:
+            best, best_quality = data, quality
+            hi = quality - 1
+        else:
+            lo = quality + 1
+
+    if best is None:
+        # Nothing met the target; the search ended on the MAX_QUALITY encode
+        best = data
+    if best_quality >= FULL_CHROMA_QUALITY:
+        full_chroma = _encode(img, quality=best_quality, subsampling=0)
+        if len(full_chroma) <= len(best):
+            best = full_chroma
+    if len(baseline) < len(best) and ssim(reference, Image.open(BytesIO(baseline)).convert('L')) >= ssim_target:
+        return EncodedVariant(baseline, BASELINE_QUALITY, len(baseline))
+    return EncodedVariant(best, best_quality, len(baseline))
+
+
+def ssim(a: Image.Image, b: Image.Image) -> float:
+    """
+    Mean structural similarity of two equally sized grayscale images.
+
+    Statistics are taken over non-overlapping 8x8 blocks (BOX downsampling
+    yields exact block means), which keeps every step inside Pillow's C code.
+    """
+    x, y = a.convert('F'), b.convert('F')
+    size = (max(1, x.width // _SSIM_BLOCK), max(1, x.height // _SSIM_BLOCK))
+
+    def block_mean(im: Image.Image) -> Image.Image:
+        return im.resize(size, Image.BOX)
+
+    mx, my = block_mean(x), block_mean(y)
+    mxx = block_mean(ImageMath.lambda_eval(lambda v: v['x'] * v['x'], x=x))
+    myy = block_mean(ImageMath.lambda_eval(lambda v: v['y'] * v['y'], y=y))
+    mxy = block_mean(ImageMath.lambda_eval(lambda v: v['x'] * v['y'], x=x, y=y))
+    ssim_map = ImageMath.lambda_eval(
+        lambda v: ((2 * v['mx'] * v['my'] + _SSIM_C1) * (2 * (v['mxy'] - v['mx'] * v['my']) + _SSIM_C2))
+        / ((v['mx'] * v['mx'] + v['my'] * v['my'] + _SSIM_C1)
+           * (v['mxx'] - v['mx'] * v['mx'] + v['myy'] - v['my'] * v['my'] + _SSIM_C2)),
+        mx=mx, my=my, mxx=mxx, myy=myy, mxy=mxy,
+    )
+    # ImageStat is histogram based and unreliable for float images
+    return ssim_map.resize((1, 1), Image.BOX).getpixel((0, 0))
+
+
+def _encode(img: Image.Image, quality: int, progressive: bool = True, subsampling: int = 2) -> bytes:
+    """Encode without EXIF/ICC (Pillow only writes metadata that is passed explicitly)."""
+    buffer = BytesIO()
+    if progressive:
+        img.save(buffer, format='JPEG', quality=quality, optimize=True,
+                 progressive=True, subsampling=subsampling)
+    else:
+        img.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
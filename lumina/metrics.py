@@ -0,0 +1,343 @@
+"""
+Metrics Module
+
+Prometheus instrumentation for the hot paths:
+    - HTTP: per-route latency and response size (Flask request hooks)
+    - Storage: latency and errors of every public storage method
+    - Backends: per-call latency, errors and payload sizes for MySQL,
+      DynamoDB, S3 and MongoDB, plus DynamoDB ConsumedCapacity, time spent
+      waiting for the capacity limiter and calls that stayed throttled
+    - Images: Pillow pipeline stage timings
+    - Passwords: KDF latency and requests shed by the bounded hashing pool
+    - Admission: queue wait per route class and requests shed with 429/503
+
+Metrics are exposed at GET /metrics to scrapers sending
+"Authorization: Bearer <METRICS_TOKEN>"; without a token configured the
+endpoint is not registered (samples are still collected). Under gunicorn, set
+PROMETHEUS_MULTIPROC_DIR to an empty, writable directory before the workers
+start; each worker then writes its samples there and /metrics aggregates all
+of them (see gunicorn.conf.py for the matching child_exit hook).
+
+prometheus_client is optional: without it every metric is a no-op and
+/metrics is not registered.
+"""
+
+from __future__ import annotations
+
+import hmac
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from typing import Any, Callable, Iterator
+
+from flask import Flask, abort, g, request
+
+from .profiling import record_phase
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess
+except ImportError:  # metrics become no-ops
+    prometheus_client = None
+
+# Latency buckets (seconds) spanning sub-millisecond cache hits to slow scans
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Payload buckets (bytes) from small JSON items to full-size images
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# DynamoDB operations that accept ReturnConsumedCapacity
+CAPACITY_OPERATIONS = {
+    'GetItem', 'PutItem', 'UpdateItem', 'DeleteItem', 'Query', 'Scan',
+    'BatchGetItem', 'BatchWriteItem', 'TransactGetItems', 'TransactWriteItems',
+}
+
+
+class _NoopMetric:
+    """Stand-in used when prometheus_client is not installed."""
+
+    def labels(self, *args: Any, **kwargs: Any) -> '_NoopMetric':
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+
+def _histogram(name: str, documentation: str, labels, buckets):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return Histogram(name, documentation, labels, buckets=buckets)
+
+
+def _counter(name: str, documentation: str, labels):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return Counter(name, documentation, labels)
+
+
+HTTP_LATENCY = _histogram(
+    'lumina_http_request_seconds', 'Flask request latency by route',
+    ['endpoint', 'method', 'status'], LATENCY_BUCKETS)
+HTTP_RESPONSE_SIZE = _histogram(
+    'lumina_http_response_bytes', 'Response body size by route (when known up front)',
+    ['endpoint'], SIZE_BUCKETS)
+
+STORAGE_LATENCY = _histogram(
+    'lumina_storage_seconds', 'Latency of public storage methods',
+    ['backend', 'method'], LATENCY_BUCKETS)
+STORAGE_ERRORS = _counter(
+    'lumina_storage_errors_total', 'Exceptions raised by public storage methods',
+    ['backend', 'method', 'error'])
+
+BACKEND_LATENCY = _histogram(
+    'lumina_backend_seconds', 'Latency of individual MySQL, DynamoDB and S3 calls (including retries)',
+    ['backend', 'operation'], LATENCY_BUCKETS)
+BACKEND_ERRORS = _counter(
+    'lumina_backend_errors_total', 'Failed MySQL, DynamoDB and S3 calls',
+    ['backend', 'operation', 'error'])
+BACKEND_PAYLOAD = _histogram(
+    'lumina_backend_payload_bytes', 'Object sizes sent to and read from S3',
+    ['backend', 'operation'], SIZE_BUCKETS)
+DYNAMODB_CAPACITY = _counter(
+    'lumina_dynamodb_consumed_capacity_total', 'DynamoDB capacity units consumed',
+    ['table', 'operation'])
+
+DYNAMODB_CAPACITY_WAIT = _histogram(
+    'lumina_dynamodb_capacity_wait_seconds', 'Time calls waited for the client-side capacity limiter',
+    ['kind'], LATENCY_BUCKETS)
+BACKEND_THROTTLED = _counter(
+    'lumina_backend_throttled_total', 'DynamoDB and S3 calls still throttled after every retry',
+    ['backend', 'operation'])
+
+PASSWORD_HASH_LATENCY = _histogram(
+    'lumina_password_hash_seconds', 'Password KDF time including the wait for a pool worker',
+    ['operation'], LATENCY_BUCKETS)
+PASSWORD_HASH_SHED = _counter(
+    'lumina_password_hash_shed_total', 'Password KDF calls rejected because the pool queue was full',
+    ['operation'])
+
+ADMISSION_WAIT = _histogram(
+    'lumina_admission_wait_seconds', 'Time requests waited for a concurrency slot of their route class',
+    ['route_class'], LATENCY_BUCKETS)
+ADMISSION_SHED = _counter(
+    'lumina_admission_shed_total', 'Requests rejected by admission control (429 rate, 503 concurrency)',
+    ['route_class', 'reason'])
+
+IMAGE_STAGE_LATENCY = _histogram(
+    'lumina_image_stage_seconds', 'Time spent in each image pipeline stage',
+    ['stage'], LATENCY_BUCKETS)
+
+
+# ----------------------------------------------------------------------
+# Flask
+# ----------------------------------------------------------------------
+def init_metrics(app: Flask) -> None:
+    """Time every request and, if METRICS_TOKEN is set, expose /metrics."""
+    if not app.config.get('METRICS_ENABLED', True) or prometheus_client is None:
+        return
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unmatched'
+            HTTP_LATENCY.labels(endpoint, request.method, response.status_code).observe(
+                time.perf_counter() - start)
+            if response.content_length is not None:
+                HTTP_RESPONSE_SIZE.labels(endpoint).observe(response.content_length)
+        return response
+
+    token = app.config.get('METRICS_TOKEN', '')
+    if not token:
+        return
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus text exposition, aggregated across workers in multiprocess mode."""
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+            abort(401)
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        return (prometheus_client.generate_latest(registry), 200,
+                {'Content-Type': prometheus_client.CONTENT_TYPE_LATEST})
+
+
+# ----------------------------------------------------------------------
+# Storage
+# ----------------------------------------------------------------------
+def instrument_storage(backend: str, exclude=()) -> Callable[[type], type]:
+    """
+    Class decorator that times every public method of a storage class,
+    including those inherited from a shared base such as MySQLAccounts.
+
+    Generator methods are timed over the full iteration rather than the call
+    that creates them. Names in exclude (e.g. context managers) are skipped.
+    """
+    def decorate(cls: type) -> type:
+        names = {name for klass in cls.__mro__[:-1] for name in vars(klass)}
+        for name in sorted(names):
+            fn = inspect.getattr_static(cls, name)
+            if name.startswith('_') or name in exclude or not inspect.isfunction(fn):
+                continue
+            wrapper = _timed_generator if inspect.isgeneratorfunction(fn) else _timed_method
+            setattr(cls, name, wrapper(fn, backend))
+        return cls
+
+    return decorate
+
+
+def _timed_method(fn: Callable, backend: str) -> Callable:
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            STORAGE_ERRORS.labels(backend, fn.__name__, type(e).__name__).inc()
+            raise
+        finally:
+            STORAGE_LATENCY.labels(backend, fn.__name__).observe(time.perf_counter() - start)
+            record_phase('storage', start)
+
+    return wrapper
+
+
+def _timed_generator(fn: Callable, backend: str) -> Callable:
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            yield from fn(*args, **kwargs)
+        except Exception as e:
+            STORAGE_ERRORS.labels(backend, fn.__name__, type(e).__name__).inc()
+            raise
+        finally:
+            STORAGE_LATENCY.labels(backend, fn.__name__).observe(time.perf_counter() - start)
+            record_phase('storage', start)
+
+    return wrapper
+
+
+def instrument_boto_client(client: Any) -> None:
+    """
+    Record latency, errors and payload sizes of every call made by a botocore
+    client; DynamoDB calls also request and record ConsumedCapacity.
+    """
+    events = client.meta.events
+    service = client.meta.service_model.service_id.hyphenize()
+
+    if service == 'dynamodb':
+        events.register('before-parameter-build.dynamodb', _request_consumed_capacity)
+    events.register(f'before-parameter-build.{service}', _record_request_payload)
+    events.register(f'before-call.{service}', _start_call)
+    events.register(f'after-call.{service}', _finish_call)
+    events.register(f'after-call-error.{service}', _fail_call)
+
+
+def _request_consumed_capacity(params, model, **kwargs) -> None:
+    if model.name in CAPACITY_OPERATIONS:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+
+def _record_request_payload(params, model, **kwargs) -> None:
+    body = params.get('Body')
+    if isinstance(body, (bytes, bytearray)):
+        BACKEND_PAYLOAD.labels(_service(model), model.name).observe(len(body))
+
+
+def _service(model) -> str:
+    return model.service_model.service_id.hyphenize()
+
+
+def _start_call(context, **kwargs) -> None:
+    context['metrics_start'] = time.perf_counter()
+
+
+def _finish_call(http_response, parsed, model, context, **kwargs) -> None:
+    service = _service(model)
+    start = context.pop('metrics_start', None)
+    if start is not None:
+        BACKEND_LATENCY.labels(service, model.name).observe(time.perf_counter() - start)
+    error = parsed.get('Error', {}).get('Code')
+    if error:
+        BACKEND_ERRORS.labels(service, model.name, error).inc()
+    if 'ContentLength' in parsed and model.name == 'GetObject':
+        BACKEND_PAYLOAD.labels(service, model.name).observe(parsed['ContentLength'])
+    capacity = parsed.get('ConsumedCapacity')
+    if capacity:
+        for entry in capacity if isinstance(capacity, list) else [capacity]:
+            DYNAMODB_CAPACITY.labels(entry.get('TableName', ''), model.name).inc(
+                entry.get('CapacityUnits', 0))
+
+
+def _fail_call(exception, context, event_name, **kwargs) -> None:
+    # after-call-error carries no model; the event name is after-call-error.<service>.<operation>
+    _, service, operation = event_name.split('.', 2)
+    start = context.pop('metrics_start', None)
+    if start is not None:
+        BACKEND_LATENCY.labels(service, operation).observe(time.perf_counter() - start)
+    BACKEND_ERRORS.labels(service, operation, type(exception).__name__).inc()
+
+
+@lru_cache(maxsize=None)
+def mongo_command_listener() -> Any:
+    """pymongo CommandListener recording each command's server round trip (pass via event_listeners)."""
+    from pymongo import monitoring
+
+    class CommandTimer(monitoring.CommandListener):
+        def started(self, event) -> None:
+            pass
+
+        def succeeded(self, event) -> None:
+            BACKEND_LATENCY.labels('mongodb', event.command_name).observe(event.duration_micros / 1e6)
+
+        def failed(self, event) -> None:
+            BACKEND_LATENCY.labels('mongodb', event.command_name).observe(event.duration_micros / 1e6)
+            BACKEND_ERRORS.labels('mongodb', event.command_name, event.failure.get('codeName', 'Error')).inc()
+
+    return CommandTimer()
+
+
+@contextmanager
+def timed_backend_call(backend: str, operation: str) -> Iterator[None]:
+    """Time a backend call that has no event hooks of its own (e.g. a MySQL query)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        BACKEND_ERRORS.labels(backend, operation, type(e).__name__).inc()
+        raise
+    finally:
+        BACKEND_LATENCY.labels(backend, operation).observe(time.perf_counter() - start)
+
+
+# ----------------------------------------------------------------------
+# Image pipeline
+# ----------------------------------------------------------------------
+def timed_stage(stage: str) -> Callable[[Callable], Callable]:
+    """Decorator recording how long an image pipeline stage takes."""
+    def decorate(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                IMAGE_STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,100 @@
+"""
+Password Hashing Module
+
+Runs the password KDF (scrypt by default) in a small process pool instead
+of the request thread. A KDF call holds the GIL for ~100 ms, so a burst of
+logins executed inline stalls every feed and image request served by the
+same worker.
+
+Admission is bounded: at most PASSWORD_HASH_WORKERS hashes run and
+PASSWORD_HASH_QUEUE more wait; anything beyond that raises
+PasswordHashingBusy, which the auth routes turn into 503 + Retry-After
+rather than letting logins queue without limit.
+
+Stored hashes whose parameters differ from PASSWORD_HASH_METHOD are
+upgraded transparently on the next successful login (needs_rehash), so the
+KDF cost can be tuned without resetting passwords.
+
+Pool workers are spawned (the parent runs request threads, so forking is
+unsafe), which re-imports the entry script in each worker: scripts must
+keep serving and other side effects under `if __name__ == '__main__'`, as
+app.py does.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from .metrics import PASSWORD_HASH_LATENCY, PASSWORD_HASH_SHED
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when the KDF pool and its queue are full; retry later."""
+
+
+class PasswordHasher:
+    """
+    Bounded, per-process pool for generate_password_hash / check_password_hash.
+
+    With PASSWORD_HASH_WORKERS = 0 hashes run inline in the calling thread
+    (still subject to the queue limit), which suits tests and scripts.
+    """
+
+    def __init__(self, config) -> None:
+        self.method = config.PASSWORD_HASH_METHOD
+        self.workers = config.PASSWORD_HASH_WORKERS
+        self.timeout = config.PASSWORD_HASH_TIMEOUT
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + config.PASSWORD_HASH_QUEUE)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_pid: Optional[int] = None
+        self._pool_lock = threading.Lock()
+
+    def hash(self, password: str) -> str:
+        """Hash password with the configured method."""
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        """Check password against a stored hash."""
+        return self._run('verify', check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """True if pwhash was made with other parameters than PASSWORD_HASH_METHOD."""
+        return pwhash.split('$', 1)[0] != self.method
+
+    def _run(self, operation: str, fn: Callable, *args: Any) -> Any:
+        if not self._slots.acquire(blocking=False):
+            PASSWORD_HASH_SHED.labels(operation).inc()
+            raise PasswordHashingBusy()
+        start = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            future = self._executor().submit(fn, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                # Queued too long behind other hashes: shed instead of holding the request
+                future.cancel()
+                PASSWORD_HASH_SHED.labels(operation).inc()
+                raise PasswordHashingBusy() from None
+        finally:
+            self._slots.release()
+            PASSWORD_HASH_LATENCY.labels(operation).observe(time.perf_counter() - start)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # A pool inherited across fork has no live workers; each process starts its own
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    self._pool_pid = os.getpid()
+        return self._pool
@@ -0,0 +1,219 @@
+"""
+Profiling Module
+
+Opt-in, in-place profiling of live requests:
+    - A configurable fraction of requests (PROFILE_SAMPLE_RATE), and any
+      request carrying X-Profile-Token equal to PROFILE_TOKEN, is profiled.
+    - A background thread samples the request thread's Python stack every
+      PROFILE_INTERVAL seconds; the stacks are written to PROFILE_DIR/<endpoint>/
+      as collapsed stacks (flamegraph.pl, speedscope, inferno) or as a
+      speedscope JSON file (PROFILE_FORMAT).
+    - Profiled responses get a Server-Timing header splitting the request
+      into auth, admission (queue wait), storage and serialize time.
+
+When both PROFILE_SAMPLE_RATE and PROFILE_TOKEN are unset no hooks are
+installed and record_phase() is a single global check.
+"""
+
+from __future__ import annotations
+
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, g, has_request_context, request
+
+PROFILE_HEADER = 'X-Profile-Token'
+
+# Called as recorder(phase, start, end) while profiling is enabled, None otherwise
+_phase_recorder = None
+
+Frame = Tuple[str, str, int]
+
+
+def record_phase(phase: str, start: float, end: Optional[float] = None) -> None:
+    """
+    Attribute the perf_counter interval [start, end] to a Server-Timing phase.
+
+    Overlapping intervals (e.g. nested storage calls) are merged, so callers
+    at any depth can record without double counting.
+    """
+    if _phase_recorder is not None:
+        _phase_recorder(phase, start, time.perf_counter() if end is None else end)
+
+
+def _record_for_request(phase: str, start: float, end: float) -> None:
+    if has_request_context():
+        intervals = g.get('phase_intervals')
+        if intervals is not None:
+            intervals.setdefault(phase, []).append((start, end))
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='lumina-profiler', daemon=True)
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format: 'root;child;leaf count' per line."""
+        lines = [';'.join(_frame_label(f) for f in stack) + f' {count}'
+                 for stack, count in self.samples.items()]
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self, name: str) -> Dict:
+        """Speedscope 'sampled' profile."""
+        frames: List[Dict] = []
+        index: Dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, count in self.samples.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                ids.append(index[frame])
+            samples.append(ids)
+            weights.append(count * self.interval)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled', 'name': name, 'unit': 'seconds',
+                'startValue': 0, 'endValue': self.duration,
+                'samples': samples, 'weights': weights,
+            }],
+        }
+
+
+def _frame_label(frame: Frame) -> str:
+    name, filename, line = frame
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+def _merged_duration(intervals: List[Tuple[float, float]]) -> float:
+    total, current_start, current_end = 0.0, None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def init_profiling(app: Flask) -> None:
+    """Install the sampling hooks if profiling is configured."""
+    global _phase_recorder
+
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    token = app.config['PROFILE_TOKEN']
+    if rate <= 0 and not token:
+        return
+
+    interval = app.config['PROFILE_INTERVAL']
+    output_format = app.config['PROFILE_FORMAT']
+    directory = Path(app.config['PROFILE_DIR'])
+    _phase_recorder = _record_for_request
+
+    # JSON serialization counts as the serialize phase wherever it happens
+    json_provider = app.json
+    for method in ('dumps', 'response'):
+        setattr(json_provider, method, _timed_serialize(getattr(json_provider, method)))
+
+    def sampled() -> bool:
+        supplied = request.headers.get(PROFILE_HEADER)
+        if token and supplied and hmac.compare_digest(supplied, token):
+            return True
+        return rate > 0 and random.random() < rate
+
+    @app.before_request
+    def start_profile():
+        if not sampled():
+            return
+        g.phase_intervals = {}
+        g.profile_start = time.perf_counter()
+        g.profiler = StackSampler(threading.get_ident(), interval)
+        g.profiler.start()
+
+    @app.after_request
+    def finish_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        total = time.perf_counter() - g.profile_start
+        intervals = g.pop('phase_intervals', {})
+        timings = [f'{phase};dur={_merged_duration(intervals.get(phase, [])) * 1000:.1f}'
+                   for phase in ('auth', 'admission', 'storage', 'serialize')]
+        timings.append(f'total;dur={total * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+
+        # Streamed bodies are still being produced; keep sampling until they are sent
+        endpoint = request.endpoint or 'unmatched'
+        response.call_on_close(lambda: _write_profile(profiler, directory, endpoint, output_format))
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exc):
+        # after_request is skipped when the view raised; don't leak the sampler thread
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop()
+
+
+def _timed_serialize(fn):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            record_phase('serialize', start)
+
+    return wrapper
+
+
+def _write_profile(profiler: StackSampler, directory: Path, endpoint: str, output_format: str) -> None:
+    profiler.stop()
+    route_dir = directory / endpoint
+    route_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    if output_format == 'speedscope':
+        (route_dir / f'{stem}.speedscope.json').write_text(json.dumps(profiler.speedscope(endpoint)))
+    else:
+        (route_dir / f'{stem}.collapsed').write_text(profiler.collapsed())
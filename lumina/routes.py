@@ -11,6 +11,14 @@ Blueprints:
 Authentication:
     Session-based authentication using Flask sessions.
     Protected endpoints use the @login_required decorator.
+    Password hashing runs in a bounded pool; when it is saturated, signup
+    and login answer 503 with Retry-After instead of queueing.
+    Likewise, API calls whose DynamoDB/S3 requests stay throttled after
+    every retry answer 503 with Retry-After (see throttling.py).
+    Authenticated requests pass admission control first: per-user rate
+    limits and cross-worker concurrency limits per route class (uploads,
+    scans, image reads, everything else) answer 429/503 with Retry-After
+    (see admission.py).
 
 API Endpoints:
     Authentication:
@@ -20,11 +28,14 @@ API Endpoints:
         GET  /api/auth/me      - Get current user info
     
     Photos:
-        GET  /api/photos              - List photos (with scope filter)
+        GET  /api/photos              - List photos (scope filter; with_comments=1 embeds
+                                        the latest comments)
         POST /api/photos              - Upload new photo
+        POST /api/photos/bulk         - Upload several photos (files and/or a zip)
         DELETE /api/photos/<id>       - Delete a photo
         POST /api/photos/<id>/like    - Like a photo
         GET/POST /api/photos/<id>/comments - Get/add comments
+        DELETE /api/photos/<id>/comments/<comment_id> - Delete a comment
         GET  /api/photos/<id>/image/<variant> - Get image binary
     
     Social:
@@ -34,16 +45,36 @@ API Endpoints:
         POST /api/friends/respond     - Accept/decline request
         GET  /api/friends             - List friends
         GET/POST /api/messages        - Get/send messages
+        GET  /api/conversations       - Inbox: conversations by last activity, unread counts
+        POST /api/conversations/<user_id>/read - Mark a conversation read
 """
 
 from __future__ import annotations
 
+import time
+import zipfile
 from functools import wraps
 from io import BytesIO
 
-from flask import Blueprint, jsonify, request, send_file, session, url_for
+from flask import Blueprint, current_app, g, jsonify, request, send_file, session, url_for
 from PIL import Image
 
+from .admission import Rejection, admission_class
+from .metrics import timed_stage
+from .passwords import PasswordHashingBusy
+from .profiling import record_phase
+from .responses import stream_json_array
+from .throttling import StorageThrottled
+
+# Browser cache lifetime (seconds) for photo variants, which never change once stored
+IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600
+
+# Bytes inflated per read when extracting a bulk upload archive member
+ARCHIVE_READ_CHUNK = 1024 * 1024
+
+# Stand-in photo id used to build per-request image URL templates
+_PHOTO_ID_SENTINEL = 'PHOTOIDSENTINEL'
+
 # Blueprint for photo-related API endpoints
 api_blueprint = Blueprint('photos_api', __name__)
 
@@ -58,7 +89,6 @@ def _storage():
 
 def _get_app_extension(key):
     """Helper to access Flask app extensions."""
-    from flask import current_app
     return current_app.extensions[key]
 
 
@@ -81,6 +111,10 @@ def login_required(fn):
     
     Checks for valid session and passes user object to the wrapped function.
     Returns 401 Unauthorized if no valid session exists.
+
+    When admission control is enabled, the request is then admitted for the
+    view's route class (see admission.py; tag views with @admission_class)
+    or answered 429/503 with Retry-After.
     
     Usage:
         @api_blueprint.route('/protected')
@@ -90,25 +124,143 @@ def login_required(fn):
     """
     @wraps(fn)
     def wrapper(*args, **kwargs):
+        start = time.perf_counter()
         user = _current_user()
+        record_phase('auth', start)
         if not user:
             return jsonify({'message': 'authentication required'}), 401
-        return fn(*args, **kwargs, user=user)
+
+        admission = current_app.extensions.get('admission')
+        if admission is None:
+            return fn(*args, **kwargs, user=user)
+        route_class = getattr(fn, 'admission_class', 'default')
+        start = time.perf_counter()
+        admitted = admission.admit(user['id'], route_class() if callable(route_class) else route_class)
+        record_phase('admission', start)
+        if isinstance(admitted, Rejection):
+            response = jsonify({'message': admitted.reason})
+            response.status_code = admitted.status
+            response.headers['Retry-After'] = str(admitted.retry_after)
+            return response
+        try:
+            response = current_app.make_response(fn(*args, **kwargs, user=user))
+        except BaseException:
+            admitted()
+            raise
+        if response.is_streamed:
+            # Hold the slot until the streamed body has been sent
+            response.call_on_close(admitted)
+        else:
+            admitted()
+        return response
 
     return wrapper
 
 
-def _serialize_photo(photo):
+def _versioned(etag_parts, build):
+    """
+    Serve a GET guarded by storage change counters.
+
+    etag_parts must include the versions read *before* build() runs its query.
+    A matching If-None-Match is answered with 304 without calling build();
+    if any version could not be read the response is built without an ETag.
+    """
+    if any(part is None for part in etag_parts):
+        return build()
+    etag = '-'.join(str(part) for part in etag_parts)
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.make_response(build())
+    response.set_etag(etag, weak=True)
+    # Cache per user, but always revalidate
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _image_url(photo_id, variant):
+    """
+    Build an image URL from a per-request template.
+
+    Feeds serialize thousands of photos; resolving the route once per request
+    and splicing in the id avoids two url_for calls per photo. Photo ids are
+    hex strings, so no escaping is needed.
+    """
+    templates = g.get('image_url_templates')
+    if templates is None:
+        templates = g.image_url_templates = {
+            v: url_for('photos_api.get_image', photo_id=_PHOTO_ID_SENTINEL, variant=v).split(_PHOTO_ID_SENTINEL)
+            for v in ('thumb', 'full')
+        }
+    prefix, suffix = templates[variant]
+    return f'{prefix}{photo_id}{suffix}'
+
+
+@timed_stage('decode')
+def _decode_upload(file):
+    """Decode an uploaded image file into an RGB Pillow image."""
+    image = Image.open(file.stream)
+    return image.convert('RGB')
+
+
+def _bulk_uploads(files):
+    """
+    Collect (filename, stream) pairs from a bulk upload: every 'photos' file,
+    then the members of an optional 'archive' zip.
+
+    Raises ValueError when the archive would extract to more than
+    BULK_UPLOAD_MAX_BYTES, and zipfile.BadZipFile for a corrupt archive.
+    Members are inflated in chunks against that budget, so a size header
+    that understates the content cannot extract more than the limit.
+    """
+    uploads = [(file.filename or '', file.stream) for file in files.getlist('photos') if file]
+    archive = files.get('archive')
+    if not archive:
+        return uploads
+
+    max_files = current_app.config['BULK_UPLOAD_MAX_FILES']
+    remaining = current_app.config['BULK_UPLOAD_MAX_BYTES']
+    with zipfile.ZipFile(archive.stream) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith('__MACOSX/') or name.rsplit('/', 1)[-1].startswith('.'):
+                continue
+            if len(uploads) >= max_files:
+                # Too many already; the caller rejects the request by count
+                uploads.append((name, None))
+                break
+            if info.file_size > remaining:
+                raise ValueError('archive too large')
+            data = BytesIO()
+            with zf.open(info) as member:
+                while True:
+                    chunk = member.read(min(ARCHIVE_READ_CHUNK, remaining + 1))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    if remaining < 0:
+                        raise ValueError('archive too large')
+                    data.write(chunk)
+            data.seek(0)
+            uploads.append((name, data))
+    return uploads
+
+
+def _serialize_photo(photo, with_comments=False):
     """
     Convert photo document to JSON-serializable format.
     
     Args:
         photo: MongoDB photo document
+        with_comments: also embed the photo's latest comments (recentComments)
         
     Returns:
-        dict: Photo data with URLs for thumbnail and full-res images
+        dict: Photo data with URLs for thumbnail and full-res images, plus an
+              inline placeholder the client can paint before the thumbnail loads
+              and the comment count, so a gallery needs no request per photo
     """
-    return {
+    serialized = {
         'id': photo['id'],
         'user_id': photo.get('user_id'),
         'username': photo['username'],
@@ -116,15 +268,41 @@ def _serialize_photo(photo):
         'caption': photo.get('caption', ''),
         'timestamp': photo['timestamp'],
         'likes': photo.get('likes', 0),
-        'thumbnail': url_for('photos_api.get_image', photo_id=photo['id'], variant='thumb'),
-        'fullRes': url_for('photos_api.get_image', photo_id=photo['id'], variant='full'),
+        'thumbnail': _image_url(photo['id'], 'thumb'),
+        'fullRes': _image_url(photo['id'], 'full'),
+        'placeholder': photo.get('placeholder'),
+        'dominantColor': photo.get('dominant_color'),
+        'thumbWidth': photo.get('thumb_width'),
+        'thumbHeight': photo.get('thumb_height'),
+        'commentCount': photo.get('comment_count', 0),
     }
+    if with_comments:
+        serialized['recentComments'] = photo.get('recent_comments', [])
+    return serialized
+
+
+@api_blueprint.errorhandler(StorageThrottled)
+def storage_throttled(error):
+    """Answer 503 rather than an empty or missing result when capacity stays exhausted."""
+    response = jsonify({'message': 'storage is busy, try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
 
 
 # =============================================================================
 # Authentication Endpoints
 # =============================================================================
 
+@auth_blueprint.errorhandler(PasswordHashingBusy)
+def password_hashing_busy(error):
+    """Shed signups and logins while the password KDF pool is saturated."""
+    response = jsonify({'message': 'too many sign-ins in progress, try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
 @auth_blueprint.route('/auth/signup', methods=['POST'])
 def signup():
     data = request.get_json() or {}
@@ -185,37 +363,70 @@ def lookup_user(user):
     return jsonify({'id': target['id'], 'username': target['username']})
 
 
+def _list_photos_class():
+    # Whole-table feeds and searches scan far more items than a home or profile feed
+    scope = request.args.get('scope', 'home')
+    return 'scan' if scope not in ('home', 'profile') or request.args.get('q') else 'default'
+
+
 @api_blueprint.route('/photos', methods=['GET'])
 @login_required
+@admission_class(_list_photos_class)
 def list_photos(user):
     scope = request.args.get('scope', 'home')
     topic_filter = request.args.get('topic')
     search_query = request.args.get('q', '').lower()
-
-    if scope == 'profile':
+    with_comments = request.args.get('with_comments') == '1'
+
+    def matches(p):
+        if topic_filter and p['topic'].lower() != topic_filter.lower():
+            return False
+        if search_query and search_query not in p['topic'].lower() and search_query not in p['username'].lower():
+            return False
+        return True
+
+    def serialize(photo):
+        return _serialize_photo(photo, with_comments=with_comments)
+
+    # Feeds are versioned by the owners they show: 'photos:{id}' for each
+    # user in a profile or home feed (home also changes with the friend list,
+    # read first), and the global 'photos' counter for everything else.
+    if scope in ('home', 'profile'):
+        etag_parts = ['photos', scope, user['id']]
         user_ids = [user['id']]
-    elif scope == 'home':
-        user_ids = [user['id']] + _storage().friend_ids(user['id'])
-    elif scope == 'all':
-        user_ids = None
+        if scope == 'home':
+            etag_parts.append(_storage().get_version(f"friends:{user['id']}"))
+            user_ids += _storage().friend_ids(user['id'])
+        versions = _storage().get_versions([f'photos:{uid}' for uid in user_ids])
+        # Counters only grow, so their sum changes whenever any of them does
+        etag_parts.append(None if versions is None else sum(versions))
     else:
         user_ids = None
+        etag_parts = ['photos', 'all', user['id'], _storage().get_version('photos')]
+
+    def build():
+        if user_ids is None:
+            # Whole-table feeds are streamed in table order as they are scanned so
+            # worker memory stays flat; the client sorts by timestamp.
+            photos = (p for p in _storage().iter_photos() if matches(p))
+            return stream_json_array(photos, serialize, on_error=_log_stream_error)
+        photos = [p for p in _storage().list_photos(user_ids=user_ids) if matches(p)]
+        start = time.perf_counter()
+        body = [serialize(photo) for photo in photos]
+        record_phase('serialize', start)
+        return jsonify(body)
 
-    photos = _storage().list_photos(user_ids=user_ids)
+    return _versioned(etag_parts, build)
 
-    if topic_filter:
-        photos = [p for p in photos if p['topic'].lower() == topic_filter.lower()]
-    if search_query:
-        photos = [
-            p for p in photos
-            if search_query in p['topic'].lower() or search_query in p['username'].lower()
-        ]
 
-    return jsonify([_serialize_photo(photo) for photo in photos])
+def _log_stream_error(error):
+    """Record a storage failure that truncated a streamed response."""
+    current_app.logger.error("Streamed response truncated: %s", error)
 
 
 @api_blueprint.route('/photos', methods=['POST'])
 @login_required
+@admission_class('upload')
 def upload_photo(user):
     topic = request.form.get('topic', '').strip()
     caption = request.form.get('caption', '').strip()
@@ -225,8 +436,7 @@ def upload_photo(user):
         return jsonify({'message': 'topic and photo are required'}), 400
 
     try:
-        image = Image.open(photo_file.stream)
-        image = image.convert('RGB')
+        image = _decode_upload(photo_file)
     except Exception:
         return jsonify({'message': 'unable to process the uploaded file'}), 400
 
@@ -234,6 +444,64 @@ def upload_photo(user):
     return jsonify({'id': record['id']}), 201
 
 
+@api_blueprint.route('/photos/bulk', methods=['POST'])
+@login_required
+@admission_class('upload')
+def upload_photos_bulk(user):
+    # 'photos' files and/or an 'archive' zip share one topic and caption;
+    # 201 if every photo was stored, 207 with per-item results if only some were
+    topic = request.form.get('topic', '').strip()
+    caption = request.form.get('caption', '').strip()
+    if not topic:
+        return jsonify({'message': 'topic and photos are required'}), 400
+
+    try:
+        uploads = _bulk_uploads(request.files)
+    except ValueError:
+        return jsonify({'message': 'archive is too large'}), 413
+    except zipfile.BadZipFile:
+        return jsonify({'message': 'unable to read the uploaded archive'}), 400
+    if not uploads:
+        return jsonify({'message': 'topic and photos are required'}), 400
+    if len(uploads) > current_app.config['BULK_UPLOAD_MAX_FILES']:
+        return jsonify({'message': f"at most {current_app.config['BULK_UPLOAD_MAX_FILES']} photos per upload"}), 413
+    # Admission took one upload token for the request; the album pays for every photo
+    admission = current_app.extensions.get('admission')
+    if admission is not None:
+        admission.charge(user['id'], 'upload', len(uploads) - 1)
+
+    # Only headers are read here; pixels are decoded on the storage worker threads
+    results, images, slots = [], [], []
+    for filename, stream in uploads:
+        try:
+            images.append(Image.open(stream))
+        except Exception:
+            results.append({'filename': filename, 'status': 400, 'message': 'unable to process the uploaded file'})
+            continue
+        slots.append(len(results))
+        results.append({'filename': filename})
+
+    records = _storage().add_photos(user, topic, images, caption) if images else []
+    for index, record in zip(slots, records):
+        if isinstance(record, StorageThrottled):
+            results[index].update(status=503, message='storage is busy, try again shortly')
+        elif isinstance(record, Exception):
+            current_app.logger.error("Bulk upload of %s failed: %s", results[index]['filename'], record)
+            results[index].update(status=500, message='unable to store the uploaded file')
+        elif record:
+            results[index].update(status=201, id=record['id'])
+        else:
+            results[index].update(status=400, message='unable to process the uploaded file')
+
+    # One status if every photo ended the same way, else 207 with per-item results
+    statuses = {result['status'] for result in results}
+    response = jsonify({'results': results})
+    response.status_code = statuses.pop() if len(statuses) == 1 else 207
+    if response.status_code == 503:
+        response.headers['Retry-After'] = '1'
+    return response
+
+
 @api_blueprint.route('/photos/<photo_id>', methods=['DELETE'])
 @login_required
 def delete_photo(photo_id, user):
@@ -256,43 +524,69 @@ def like_photo(photo_id, user):
 @login_required
 def comments(photo_id, user):
     if request.method == 'GET':
-        comments = _storage().list_comments(photo_id)
-        clean = []
-        for c in comments:
-            c.pop('_id', None)
-            clean.append(c)
-        return jsonify(clean)
+        def build():
+            comments = _storage().list_comments(photo_id)
+            clean = []
+            for c in comments:
+                c.pop('_id', None)
+                clean.append(c)
+            return jsonify(clean)
+        return _versioned(['comments', _storage().get_version(f'comments:{photo_id}')], build)
     data = request.get_json() or {}
     text = (data.get('text') or '').strip()
     if not text:
         return jsonify({'message': 'text required'}), 400
-    if not _storage().get_photo(photo_id):
-        return jsonify({'message': 'photo not found'}), 404
     doc = _storage().add_comment(photo_id, user, text)
+    if doc is None:
+        return jsonify({'message': 'photo not found'}), 404
     doc.pop('_id', None)
     return jsonify(doc), 201
 
 
+@api_blueprint.route('/photos/<photo_id>/comments/<comment_id>', methods=['DELETE'])
+@login_required
+def delete_comment(photo_id, comment_id, user):
+    # Authors may delete their comments, photo owners any comment on their photo
+    if not _storage().delete_comment(photo_id, comment_id, user['id']):
+        return jsonify({'message': 'comment not found'}), 404
+    return '', 204
+
+
 @api_blueprint.route('/photos/<photo_id>/image/<variant>', methods=['GET'])
 @login_required
+@admission_class('image')
 def get_image(photo_id, variant, user):
     if variant not in {'thumb', 'full'}:
         return jsonify({'message': 'invalid variant'}), 400
-    data = _storage().get_image_bytes(photo_id, variant)
-    if data is None:
-        return jsonify({'message': 'not found'}), 404
-    return send_file(BytesIO(data), mimetype='image/jpeg')
+    # Files on disk are served by path so the WSGI server can use sendfile;
+    # GridFS streams are sent chunk by chunk; anything else as whole bytes
+    source = _storage().get_image_path(photo_id, variant)
+    if source is None:
+        source = _storage().open_image(photo_id, variant)
+    if source is None:
+        data = _storage().get_image_bytes(photo_id, variant)
+        if data is None:
+            return jsonify({'message': 'not found'}), 404
+        source = BytesIO(data)
+    # A photo's variants never change (content-addressed), so browsers may keep them
+    response = send_file(source, mimetype='image/jpeg', max_age=IMAGE_CACHE_MAX_AGE)
+    if getattr(source, 'length', None) is not None:
+        response.content_length = source.length
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
 
 
 @api_blueprint.route('/users/profile-picture', methods=['POST'])
 @login_required
+@admission_class('upload')
 def upload_profile_picture(user):
     file = request.files.get('photo')
     if not file:
         return jsonify({'message': 'photo is required'}), 400
     try:
-        image = Image.open(file.stream)
-        image = image.convert('RGB')
+        image = _decode_upload(file)
     except Exception:
         return jsonify({'message': 'unable to process the uploaded file'}), 400
     _storage().save_profile_picture(user['id'], image)
@@ -301,9 +595,13 @@ def upload_profile_picture(user):
 
 @api_blueprint.route('/users/<int:user_id>/profile-picture/<variant>', methods=['GET'])
 @login_required
+@admission_class('image')
 def profile_picture(user_id, variant, user):
     if variant not in {'thumb', 'full'}:
         return jsonify({'message': 'invalid variant'}), 400
+    path = _storage().get_profile_picture_path(user_id, variant)
+    if path is not None:
+        return send_file(path, mimetype='image/jpeg')
     data = _storage().get_profile_picture(user_id, variant)
     if not data:
         return jsonify({'message': 'not found'}), 404
@@ -329,7 +627,9 @@ def send_friend_request(user):
 @api_blueprint.route('/friends/requests', methods=['GET'])
 @login_required
 def list_requests(user):
-    return jsonify(_storage().list_friend_requests(user['id']))
+    version = _storage().get_version(f"friends:{user['id']}")
+    return _versioned(['requests', user['id'], version],
+                      lambda: jsonify(_storage().list_friend_requests(user['id'])))
 
 
 @api_blueprint.route('/friends/respond', methods=['POST'])
@@ -349,7 +649,9 @@ def respond_request(user):
 @api_blueprint.route('/friends', methods=['GET'])
 @login_required
 def friends(user):
-    return jsonify(_storage().list_friends(user['id']))
+    version = _storage().get_version(f"friends:{user['id']}")
+    return _versioned(['friends', user['id'], version],
+                      lambda: jsonify(_storage().list_friends(user['id'])))
 
 
 @api_blueprint.route('/messages', methods=['GET', 'POST'])
@@ -371,3 +673,36 @@ def messages(user):
     for m in msgs:
         m.pop('_id', None)
     return jsonify(msgs)
+
+
+@api_blueprint.route('/conversations', methods=['GET'])
+@login_required
+def conversations(user):
+    """
+    One page of the inbox, most recent conversation first.
+
+    Query params: limit (1-100, default 20) and cursor, the next_cursor of
+    the previous page ('{last_timestamp}-{other_user_id}').
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        cursor = request.args.get('cursor')
+        before = tuple(int(part) for part in cursor.split('-', 1)) if cursor else None
+        if before is not None and len(before) != 2:
+            raise ValueError(cursor)
+    except ValueError:
+        return jsonify({'message': 'invalid limit or cursor'}), 400
+    entries = _storage().list_conversations(user['id'], limit, before)
+    next_cursor = None
+    if len(entries) == limit:
+        last = entries[-1]
+        next_cursor = f"{last['last_timestamp']}-{last['other_user_id']}"
+    return jsonify({'conversations': entries, 'next_cursor': next_cursor})
+
+
+@api_blueprint.route('/conversations/<int:other_user_id>/read', methods=['POST'])
+@login_required
+def mark_conversation_read(user, other_user_id):
+    if not _storage().mark_conversation_read(user['id'], other_user_id):
+        return jsonify({'message': 'conversation not found'}), 404
+    return '', 204
@@ -0,0 +1,914 @@
+"""
+Storage Layer Module - MongoDB Architecture (MongoDB + GridFS)
+
+This module implements storage using:
+    - MySQL: User authentication, friendships (relational data, see MySQLAccounts)
+    - MongoDB: Photos metadata, comments, messages, change versions
+    - GridFS: Binary image storage (photo variants, profile pictures)
+
+Design Rationale:
+    A single MongoDB deployment holds both documents and images, so the
+    default backend needs no cloud services. Images are read from GridFS
+    one chunk at a time and streamed into the response rather than loaded
+    whole, and every list query is served by a compound index created by
+    `flask --app app migrate`.
+
+Collections:
+    - photos: _id=id, user_id, username, topic, caption, timestamp, likes, content_hash,
+              thumbnail_id, full_id (GridFS ids), placeholder, dominant_color, thumb_width, thumb_height,
+              comment_count, recent_comments (latest comments)
+              indexes (user_id, timestamp desc), (timestamp desc)
+    - blobs: _id=content_hash, refs, thumbnail_id, full_id, placeholder... (shared variants)
+    - comments: photo_id, comment_id, user_id, username, text, timestamp
+                index (photo_id, timestamp)
+    - messages: conversation_id, sort_key, message_id, from_user_id, to_user_id, text, timestamp
+                index (conversation_id, timestamp)
+    - inbox: _id='{owner_id}:{other_user_id}', owner_id, other_user_id, other_username,
+             last_message (preview), last_from_user_id, last_timestamp, unread
+             index (owner_id, last_timestamp desc, other_user_id desc)
+    - versions: _id=scope, version (change counter behind ETags)
+    - images.files / images.chunks: GridFS bucket
+          photos/{content_hash}_full.jpg, photos/{content_hash}_thumb.jpg
+          profiles/{user_id}_full.jpg, profiles/{user_id}_thumb.jpg
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from PIL import Image
+
+from .imaging import content_hash, encode_variant, normalize_image, placeholder_fields, scaled_size
+from .metrics import instrument_storage, mongo_command_listener
+from .passwords import PasswordHasher
+from .storage_mysql import MySQLAccounts
+
+# pymongo's index and sort directions (pymongo.ASCENDING / DESCENDING)
+ASCENDING = 1
+DESCENDING = -1
+
+# Documents fetched per round trip while streaming a feed
+FEED_BATCH_SIZE = 500
+
+# Characters of the last message kept in each inbox entry
+INBOX_PREVIEW_CHARS = 120
+
+# Backend-specific fields left out of exported records (see transfer.py)
+EXPORT_PRIVATE_FIELDS = ('_id', 'thumbnail_id', 'full_id')
+
+# Comments embedded in a photo document as its preview (the latest ones, oldest first)
+COMMENT_PREVIEW_SIZE = 2
+
+
+@lru_cache(maxsize=None)
+def _pymongo() -> Any:
+    """The pymongo package (with pymongo.errors), imported on first use like the client."""
+    import pymongo
+    import pymongo.errors
+
+    return pymongo
+
+
+@lru_cache(maxsize=None)
+def _gridfs() -> Any:
+    """The gridfs package (with gridfs.errors), imported on first use like the client."""
+    import gridfs
+    import gridfs.errors
+
+    return gridfs
+
+
+class MongoHandles(NamedTuple):
+    """The process's shared MongoClient and the handles built on it; never shared across a fork."""
+    pid: int
+    client: Any
+    db: Any
+    images: Any
+
+
+@instrument_storage('mongodb', exclude=('connection',))
+class Storage(MySQLAccounts):
+    """
+    Storage layer using MongoDB for documents and GridFS for images.
+
+    Implements the same public interface as StorageDynamoDB and returns the
+    same dictionaries. Photo variants can additionally be opened as GridFS
+    streams (open_image), which routes send without buffering the file.
+    """
+
+    # Fields shared by every photo that references the same content hash
+    VARIANT_FIELDS = ('thumbnail_id', 'full_id', 'thumb_width', 'thumb_height', 'placeholder', 'dominant_color')
+
+    def __init__(self, config) -> None:
+        """
+        Store configuration only.
+
+        The MongoClient is created on first use in each process and indexes
+        are created by `flask --app app migrate`, so building the storage (and
+        booting a worker) does no network I/O.
+        """
+        self.config = config
+        self.max_full_width = config.MAX_FULL_WIDTH
+        self.max_thumb_width = config.MAX_THUMB_WIDTH
+        self.jpeg_encoder = config.JPEG_ENCODER
+        self.jpeg_ssim_target = config.JPEG_SSIM_TARGET
+
+        # Running totals of encoded variant sizes vs the fixed quality-85 baseline
+        self.encoder_stats = {'variants': 0, 'bytes': 0, 'baseline_bytes': 0}
+        # Bulk uploads encode on several threads at once
+        self._encoder_stats_lock = threading.Lock()
+
+        # Password KDF runs in a bounded process pool (see passwords.py)
+        self.passwords = PasswordHasher(config)
+
+        self._handles: Optional[MongoHandles] = None
+        self._handles_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # MongoDB client (created lazily, per process)
+    # ------------------------------------------------------------------
+    def _mongo(self) -> MongoHandles:
+        """
+        Return this process's handles, creating them on first use.
+
+        MongoClient is thread-safe and pools connections, so every request
+        thread shares one; it is not fork-safe, so a forked worker builds its
+        own instead of inheriting the parent's sockets.
+        """
+        handles = self._handles
+        if handles is None or handles.pid != os.getpid():
+            with self._handles_lock:
+                handles = self._handles
+                if handles is None or handles.pid != os.getpid():
+                    handles = self._handles = self._create_handles()
+        return handles
+
+    def _create_handles(self) -> MongoHandles:
+        client = _pymongo().MongoClient(
+            self.config.MONGO_URI,
+            maxPoolSize=self.config.MONGO_MAX_POOL_SIZE,
+            minPoolSize=self.config.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=self.config.MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=self.config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            serverSelectionTimeoutMS=self.config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            retryWrites=True,
+            appname='lumina',
+            event_listeners=[mongo_command_listener()],
+        )
+        db = client[self.config.MONGO_DB]
+        return MongoHandles(os.getpid(), client, db, _gridfs().GridFSBucket(db, bucket_name='images'))
+
+    @property
+    def db(self):
+        return self._mongo().db
+
+    @property
+    def images(self):
+        return self._mongo().images
+
+    # ------------------------------------------------------------------
+    # Schema (run once per deployment, not per worker)
+    # ------------------------------------------------------------------
+    def migrate(self) -> None:
+        """Create the MySQL tables and the MongoDB indexes if they do not exist."""
+        super().migrate()
+        db = self.db
+        db.photos.create_index([('user_id', ASCENDING), ('timestamp', DESCENDING)])
+        db.photos.create_index([('timestamp', DESCENDING)])
+        db.comments.create_index([('photo_id', ASCENDING), ('timestamp', ASCENDING)])
+        db.messages.create_index([('conversation_id', ASCENDING), ('timestamp', ASCENDING)])
+        db.inbox.create_index([('owner_id', ASCENDING), ('last_timestamp', DESCENDING),
+                               ('other_user_id', DESCENDING)])
+        # GridFS creates these on its first write; creating them here keeps that write fast
+        db['images.files'].create_index([('filename', ASCENDING), ('uploadDate', ASCENDING)])
+        db['images.chunks'].create_index([('files_id', ASCENDING), ('n', ASCENDING)], unique=True)
+
+    # ------------------------------------------------------------------
+    # Profile pictures (GridFS)
+    # ------------------------------------------------------------------
+    def save_profile_picture(self, user_id: int, image: Image.Image) -> Dict[str, Any]:
+        """Save profile picture to GridFS (no database column needed)."""
+        image = normalize_image(image)
+        thumb_key = f"profiles/{user_id}_thumb.jpg"
+        full_key = f"profiles/{user_id}_full.jpg"
+        self._replace_file(thumb_key, self._resize_to_bytes(image, 200))
+        self._replace_file(full_key, self._resize_to_bytes(image, 800))
+        return {'full': full_key, 'thumb': thumb_key}
+
+    def get_profile_picture(self, user_id: int, variant: str) -> Optional[bytes]:
+        """Get profile picture from GridFS (returns None if none was uploaded)."""
+        key = f"profiles/{user_id}_{'thumb' if variant == 'thumb' else 'full'}.jpg"
+        try:
+            with self.images.open_download_stream_by_name(key) as stream:
+                return stream.read()
+        except _gridfs().errors.NoFile:
+            return None
+
+    def get_profile_picture_path(self, user_id: int, variant: str) -> None:
+        """Profile pictures live in GridFS, never on local disk."""
+        return None
+
+    # ------------------------------------------------------------------
+    # Photos (MongoDB + GridFS)
+    # ------------------------------------------------------------------
+    def list_photos(self, user_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """List photos newest first, optionally filtered by user IDs."""
+        try:
+            return list(self.iter_photos(user_ids))
+        except _pymongo().errors.PyMongoError as e:
+            print(f"Error listing photos: {e}")
+            return []
+
+    def iter_photos(self, user_ids: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield photos newest first, FEED_BATCH_SIZE documents per round trip.
+
+        The sort walks the (timestamp) or (user_id, timestamp) index, so the
+        server never sorts in memory. PyMongoError propagates to the caller.
+        """
+        query = {} if user_ids is None else {'user_id': {'$in': list(user_ids)}}
+        cursor = self.db.photos.find(query).sort('timestamp', -1).batch_size(FEED_BATCH_SIZE)
+        with cursor:
+            for doc in cursor:
+                yield self._deserialize_photo(doc)
+
+    def add_photo(self, user: Dict[str, Any], topic: str, image: Image.Image, caption: str = "") -> Dict[str, Any]:
+        """
+        Add a new photo.
+
+        Variants are content-addressed: re-uploading an image with identical
+        pixels reuses the stored variants and skips resizing, encoding and GridFS.
+        """
+        photo_id = uuid.uuid4().hex
+        timestamp = int(datetime.utcnow().timestamp() * 1000)
+        image = normalize_image(image)
+        digest = content_hash(image)
+        variants = self._acquire_variants(digest, image)
+
+        doc = {
+            '_id': photo_id,
+            'id': photo_id,
+            'user_id': user['id'],
+            'username': user['username'],
+            'topic': topic,
+            'caption': caption,
+            'timestamp': timestamp,
+            'likes': 0,
+            'comment_count': 0,
+            'recent_comments': [],
+            'content_hash': digest,
+            **variants,
+        }
+        self.db.photos.insert_one(doc)
+        self._bump_photo_versions([user['id']])
+        return self._deserialize_photo(doc)
+
+    def add_photos(self, user: Dict[str, Any], topic: str, images: List[Image.Image],
+                   caption: str = "") -> List[Union[Dict[str, Any], Exception, None]]:
+        """
+        Add several photos at once (album upload).
+
+        Images are decoded, hashed and encoded on BULK_UPLOAD_WORKERS threads
+        (Pillow releases the GIL while resizing and encoding) so their GridFS
+        uploads overlap, then all documents go to the server in one unordered
+        insert_many.
+
+        Returns one entry per image, in order: the stored photo, None if that
+        image could not be decoded, or the exception that stopped its variants
+        from being stored. If insert_many fails, documents already inserted
+        are removed, every variant reference is released and the error
+        propagates. Images are closed once processed.
+        """
+        with ThreadPoolExecutor(max_workers=self.config.BULK_UPLOAD_WORKERS) as pool:
+            prepared = list(pool.map(self._prepare_upload, images))
+
+        timestamp = int(datetime.utcnow().timestamp() * 1000)
+        docs: List[Union[Dict[str, Any], Exception, None]] = []
+        for entry in prepared:
+            if not isinstance(entry, tuple):
+                docs.append(entry)
+                continue
+            digest, variants = entry
+            photo_id = uuid.uuid4().hex
+            docs.append({
+                '_id': photo_id,
+                'id': photo_id,
+                'user_id': user['id'],
+                'username': user['username'],
+                'topic': topic,
+                'caption': caption,
+                'timestamp': timestamp,
+                'likes': 0,
+                'comment_count': 0,
+                'recent_comments': [],
+                'content_hash': digest,
+                **variants,
+            })
+        stored = [doc for doc in docs if isinstance(doc, dict)]
+        if stored:
+            try:
+                self.db.photos.insert_many(stored, ordered=False)
+            except Exception:
+                self._discard_uploads(stored)
+                raise
+            self._bump_photo_versions([user['id']])
+        return [self._deserialize_photo(doc) if isinstance(doc, dict) else doc for doc in docs]
+
+    def _prepare_upload(self, image: Image.Image) -> Union[Tuple[str, Dict[str, Any]], Exception, None]:
+        """
+        Normalize, hash and store the variants of one bulk upload.
+
+        Returns (content hash, variant fields), None if the image cannot be
+        decoded, or the exception that stopped the variants from being stored,
+        so one failed upload does not abort the others.
+        """
+        try:
+            try:
+                normalized = normalize_image(image)
+                digest = content_hash(normalized)
+            except (OSError, ValueError, Image.DecompressionBombError):
+                return None
+            return digest, self._acquire_variants(digest, normalized)
+        except Exception as e:
+            return e
+        finally:
+            image.close()
+
+    def _discard_uploads(self, docs: List[Dict[str, Any]]) -> None:
+        """Undo a failed bulk insert: delete whatever was inserted, then release the variants."""
+        try:
+            self.db.photos.delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+        except _pymongo().errors.PyMongoError as e:
+            # Inserted documents may still point at the variants, so keep their references
+            print(f"Error discarding failed bulk upload: {e}")
+            return
+        for doc in docs:
+            try:
+                self._release_variants(doc['content_hash'])
+            except _pymongo().errors.PyMongoError as e:
+                print(f"Error releasing variants of {doc['content_hash']}: {e}")
+
+    def delete_photo(self, photo_id: str) -> Optional[Dict[str, Any]]:
+        """Delete a photo, its comments, and its variants once no other photo uses them."""
+        try:
+            doc = self.db.photos.find_one_and_delete({'_id': photo_id})
+            if not doc:
+                return None
+            if doc.get('content_hash'):
+                self._release_variants(doc['content_hash'])
+            else:
+                self._delete_variant_files(doc)
+            self.db.comments.delete_many({'photo_id': photo_id})
+            self._bump_photo_versions([doc['user_id']], f'comments:{photo_id}')
+            return self._deserialize_photo(doc)
+        except _pymongo().errors.PyMongoError:
+            return None
+
+    def get_photo(self, photo_id: str) -> Optional[Dict[str, Any]]:
+        """Get a single photo by ID."""
+        try:
+            doc = self.db.photos.find_one({'_id': photo_id})
+            return self._deserialize_photo(doc) if doc else None
+        except _pymongo().errors.PyMongoError:
+            return None
+
+    def increment_like(self, photo_id: str) -> Optional[int]:
+        """Increment like count for a photo."""
+        try:
+            doc = self.db.photos.find_one_and_update(
+                {'_id': photo_id},
+                {'$inc': {'likes': 1}},
+                projection={'likes': True, 'user_id': True},
+                return_document=_pymongo().ReturnDocument.AFTER,
+            )
+        except _pymongo().errors.PyMongoError:
+            return None
+        if not doc:
+            return None
+        self._bump_photo_versions([doc['user_id']])
+        return int(doc.get('likes', 0))
+
+    def _acquire_variants(self, content_hash: str, image: Image.Image) -> Dict[str, Any]:
+        """
+        Take a reference on the stored variants for content_hash.
+
+        On a hit the reference count is incremented and the stored fields are
+        returned as-is. On a miss the variants are encoded and uploaded before
+        the blob document is written, so a reader never sees ids without files
+        behind them.
+        """
+        projection = {field: True for field in self.VARIANT_FIELDS}
+        stored = self.db.blobs.find_one_and_update(
+            {'_id': content_hash},
+            {'$inc': {'refs': 1}},
+            projection=projection,
+            return_document=_pymongo().ReturnDocument.AFTER,
+        )
+        if stored:
+            return {field: stored[field] for field in self.VARIANT_FIELDS if field in stored}
+
+        thumb_width, thumb_height = scaled_size(image.size, self.max_thumb_width)
+        variants = {
+            'thumbnail_id': self._upload(f"photos/{content_hash}_thumb.jpg",
+                                         self._resize_to_bytes(image, self.max_thumb_width)),
+            'full_id': self._upload(f"photos/{content_hash}_full.jpg",
+                                    self._resize_to_bytes(image, self.max_full_width)),
+            'thumb_width': thumb_width,
+            'thumb_height': thumb_height,
+            **placeholder_fields(image),
+        }
+        stored = self.db.blobs.find_one_and_update(
+            {'_id': content_hash},
+            {'$setOnInsert': variants, '$inc': {'refs': 1}},
+            projection=projection,
+            upsert=True,
+            return_document=_pymongo().ReturnDocument.AFTER,
+        )
+        if stored['full_id'] != variants['full_id']:
+            # A concurrent upload of the same content won; use its files and drop ours
+            self._delete_variant_files(variants)
+        return {field: stored[field] for field in self.VARIANT_FIELDS if field in stored}
+
+    def _release_variants(self, content_hash: str) -> None:
+        """Drop a reference and delete the GridFS variants when none remain."""
+        stored = self.db.blobs.find_one_and_update(
+            {'_id': content_hash},
+            {'$inc': {'refs': -1}},
+            return_document=_pymongo().ReturnDocument.AFTER,
+        )
+        if not stored or stored.get('refs', 0) > 0:
+            return
+        # Only delete if no upload re-acquired the variants in the meantime
+        result = self.db.blobs.delete_one({'_id': content_hash, 'refs': {'$lte': 0}})
+        if result.deleted_count:
+            self._delete_variant_files(stored)
+
+    def _delete_variant_files(self, doc: Dict[str, Any]) -> None:
+        for field in ('thumbnail_id', 'full_id'):
+            if doc.get(field) is None:
+                continue
+            try:
+                self.images.delete(doc[field])
+            except _gridfs().errors.NoFile:
+                pass
+
+    def backfill_placeholders(self, max_workers: int = 8) -> int:
+        """
+        Compute placeholders for photos uploaded before they were generated.
+
+        Thumbnails are read from GridFS and decoded on a bounded thread pool;
+        the MongoDB updates are issued from the calling thread. The shared
+        blob document is updated too, so later uploads of the same content
+        get the placeholder. Returns the number of photos updated.
+        """
+        cursor = self.db.photos.find(
+            {'placeholder': {'$exists': False}, 'thumbnail_id': {'$exists': True}},
+            projection={'thumbnail_id': True, 'content_hash': True, 'user_id': True},
+        ).batch_size(FEED_BATCH_SIZE)
+        owners = []
+        with ThreadPoolExecutor(max_workers=max_workers) as pool, cursor:
+            while True:
+                docs = [doc for _, doc in zip(range(FEED_BATCH_SIZE), cursor)]
+                if not docs:
+                    break
+                file_ids = [doc['thumbnail_id'] for doc in docs]
+                for doc, fields in zip(docs, pool.map(self._placeholder_for_file, file_ids)):
+                    if not fields:
+                        continue
+                    self.db.photos.update_one({'_id': doc['_id']}, {'$set': fields})
+                    if doc.get('content_hash'):
+                        self.db.blobs.update_one({'_id': doc['content_hash']}, {'$set': fields})
+                    owners.append(doc['user_id'])
+        if owners:
+            self._bump_photo_versions(owners)
+        return len(owners)
+
+    def _placeholder_for_file(self, file_id: Any) -> Optional[Dict[str, Any]]:
+        try:
+            with self.images.open_download_stream(file_id) as stream:
+                image = Image.open(stream)
+                image.load()
+        except (_gridfs().errors.NoFile, OSError):
+            return None
+        width, height = image.size
+        return {'thumb_width': width, 'thumb_height': height, **placeholder_fields(image.convert('RGB'))}
+
+    def open_image(self, photo_id: str, variant: str) -> Optional[BinaryIO]:
+        """
+        Open a photo variant as a GridFS stream (None if missing).
+
+        The stream reads one chunk per round trip and has a `length`
+        attribute; the caller closes it (send_file does once the body is sent).
+        """
+        field = 'thumbnail_id' if variant == 'thumb' else 'full_id'
+        doc = self.db.photos.find_one({'_id': photo_id}, projection={field: True})
+        if not doc or doc.get(field) is None:
+            return None
+        try:
+            return self.images.open_download_stream(doc[field])
+        except _gridfs().errors.NoFile:
+            return None
+
+    def get_image_bytes(self, photo_id: str, variant: str) -> Optional[bytes]:
+        """Get image bytes from GridFS (prefer open_image for responses)."""
+        stream = self.open_image(photo_id, variant)
+        if stream is None:
+            return None
+        with stream:
+            return stream.read()
+
+    def get_image_path(self, photo_id: str, variant: str) -> None:
+        """Images live in GridFS, never on local disk; routes use open_image."""
+        return None
+
+    # ------------------------------------------------------------------
+    # Comments (MongoDB)
+    # ------------------------------------------------------------------
+    def list_comments(self, photo_id: str) -> List[Dict[str, Any]]:
+        """List comments for a photo, oldest first."""
+        try:
+            cursor = self.db.comments.find({'photo_id': photo_id}, projection={'_id': False}).sort('timestamp', 1)
+            return list(cursor)
+        except _pymongo().errors.PyMongoError as e:
+            print(f"Error listing comments: {e}")
+            return []
+
+    def add_comment(self, photo_id: str, user: Dict[str, Any], text: str) -> Optional[Dict[str, Any]]:
+        """
+        Add a comment to a photo; None if the photo does not exist.
+
+        The photo's comment_count and recent_comments are updated with one
+        atomic $inc/$push before the comment is inserted (not in a
+        transaction: a standalone server has none).
+        """
+        item = {
+            'photo_id': photo_id,
+            'comment_id': uuid.uuid4().hex,
+            'user_id': user['id'],
+            'username': user['username'],
+            'text': text,
+            'timestamp': int(datetime.utcnow().timestamp() * 1000),
+        }
+        preview = {key: item[key] for key in ('comment_id', 'user_id', 'username', 'text', 'timestamp')}
+        photo = self.db.photos.find_one_and_update({'_id': photo_id, 'comment_count': {'$exists': True}}, {
+            '$inc': {'comment_count': 1},
+            '$push': {'recent_comments': {'$each': [preview], '$sort': {'timestamp': 1},
+                                          '$slice': -COMMENT_PREVIEW_SIZE}},
+        }, projection={'user_id': True})
+        counted = photo is not None
+        if not counted:
+            photo = self.db.photos.find_one({'_id': photo_id}, projection={'user_id': True})
+            if not photo:
+                return None
+        # insert_one adds an ObjectId _id to the dict it is given
+        self.db.comments.insert_one(dict(item))
+        if not counted:
+            # First comment since comment counts were introduced: count the stored ones
+            self._refresh_comment_summary(photo_id)
+        self._bump_photo_versions([photo['user_id']], f'comments:{photo_id}')
+        return item
+
+    def delete_comment(self, photo_id: str, comment_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Delete a comment written by user_id, or any comment on user_id's photo.
+
+        Returns the deleted comment, or None if there is no such comment or
+        the user may not delete it.
+        """
+        comment = self.db.comments.find_one({'photo_id': photo_id, 'comment_id': comment_id},
+                                            projection={'_id': False})
+        photo = self.db.photos.find_one({'_id': photo_id}, projection={'user_id': True})
+        if not comment or not photo or user_id not in (comment['user_id'], photo.get('user_id')):
+            return None
+        if not self.db.comments.delete_one({'photo_id': photo_id, 'comment_id': comment_id}).deleted_count:
+            return None
+        result = self.db.photos.update_one(
+            {'_id': photo_id, 'comment_count': {'$gt': 0}},
+            {'$inc': {'comment_count': -1}, '$set': {'recent_comments': self._recent_comments(photo_id)}},
+        )
+        if not result.matched_count:
+            self._refresh_comment_summary(photo_id)
+        self._bump_photo_versions([photo['user_id']], f'comments:{photo_id}')
+        return comment
+
+    def backfill_comment_counts(self) -> int:
+        """Recount comment_count and recent_comments for every photo; returns photos updated."""
+        owners = []
+        with self.db.photos.find(projection={'_id': True, 'user_id': True}).batch_size(FEED_BATCH_SIZE) as cursor:
+            for doc in cursor:
+                self._refresh_comment_summary(doc['_id'])
+                owners.append(doc['user_id'])
+        if owners:
+            self._bump_photo_versions(owners)
+        return len(owners)
+
+    def _refresh_comment_summary(self, photo_id: str) -> None:
+        """Recompute a photo's comment_count and recent_comments from the comments collection."""
+        self.db.photos.update_one({'_id': photo_id}, {'$set': {
+            'comment_count': self.db.comments.count_documents({'photo_id': photo_id}),
+            'recent_comments': self._recent_comments(photo_id),
+        }})
+
+    def _recent_comments(self, photo_id: str) -> List[Dict[str, Any]]:
+        """The latest COMMENT_PREVIEW_SIZE comments of a photo, oldest first."""
+        cursor = (self.db.comments.find({'photo_id': photo_id}, projection={'_id': False, 'photo_id': False})
+                  .sort([('timestamp', DESCENDING), ('comment_id', DESCENDING)])
+                  .limit(COMMENT_PREVIEW_SIZE))
+        return list(cursor)[::-1]
+
+    # ------------------------------------------------------------------
+    # Messages (MongoDB)
+    # ------------------------------------------------------------------
+    def send_message(self, from_user: Dict[str, Any], to_user_id: int, text: str) -> Dict[str, Any]:
+        """Send a message to another user and move the conversation to the top of both inboxes."""
+        timestamp = int(datetime.utcnow().timestamp() * 1000)
+        message_id = uuid.uuid4().hex
+
+        # Create conversation ID (smaller user ID first for consistency)
+        user1, user2 = sorted([from_user['id'], to_user_id])
+        item = {
+            'conversation_id': f"CONV#{user1}#{user2}",
+            'sort_key': f"{timestamp}#{message_id}",
+            'message_id': message_id,
+            'from_user_id': from_user['id'],
+            'from_username': from_user['username'],
+            'to_user_id': to_user_id,
+            'text': text,
+            'timestamp': timestamp,
+        }
+        self.db.messages.insert_one(dict(item))
+        to_username = (self.get_user_by_id(to_user_id) or {}).get('username', '')
+        self._update_inbox(item, to_username)
+        return item
+
+    def list_messages(self, user_id: int, other_user_id: int) -> List[Dict[str, Any]]:
+        """List the first 100 messages between two users, oldest first."""
+        user1, user2 = sorted([user_id, other_user_id])
+        try:
+            cursor = (self.db.messages.find({'conversation_id': f"CONV#{user1}#{user2}"}, projection={'_id': False})
+                      .sort('timestamp', 1).limit(100))
+            return list(cursor)
+        except _pymongo().errors.PyMongoError:
+            return []
+
+    # ------------------------------------------------------------------
+    # Conversation inbox (MongoDB)
+    # ------------------------------------------------------------------
+    # One inbox document per participant and conversation, _id '{owner}:{other}',
+    # indexed (owner_id, last_timestamp desc, other_user_id desc).
+    def list_conversations(self, user_id: int, limit: int = 20,
+                           before: Optional[Tuple[int, int]] = None) -> List[Dict[str, Any]]:
+        """
+        List a user's conversations, most recent activity first.
+
+        before is the (last_timestamp, other_user_id) of the last entry of the
+        previous page.
+        """
+        query: Dict[str, Any] = {'owner_id': user_id}
+        if before:
+            timestamp, other_user_id = before
+            query['$or'] = [
+                {'last_timestamp': {'$lt': timestamp}},
+                {'last_timestamp': timestamp, 'other_user_id': {'$lt': other_user_id}},
+            ]
+        try:
+            cursor = (self.db.inbox.find(query, projection={'_id': False, 'owner_id': False})
+                      .sort([('last_timestamp', DESCENDING), ('other_user_id', DESCENDING)])
+                      .limit(limit))
+            return list(cursor)
+        except _pymongo().errors.PyMongoError as e:
+            print(f"Error listing conversations: {e}")
+            return []
+
+    def mark_conversation_read(self, user_id: int, other_user_id: int) -> bool:
+        """Reset the unread counter of a conversation; False if there is no such conversation."""
+        result = self.db.inbox.update_one({'_id': f'{user_id}:{other_user_id}'}, {'$set': {'unread': 0}})
+        return result.matched_count > 0
+
+    def backfill_inbox(self) -> int:
+        """Create inbox entries for conversations that predate the inbox; returns entries created."""
+        latest: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        with self.db.messages.find(projection={'_id': False}).batch_size(FEED_BATCH_SIZE) as cursor:
+            for message in cursor:
+                for pair in {(message['from_user_id'], message['to_user_id']),
+                             (message['to_user_id'], message['from_user_id'])}:
+                    current = latest.get(pair)
+                    if current is None or message['timestamp'] >= current['timestamp']:
+                        latest[pair] = message
+
+        usernames: Dict[int, str] = {}
+        requests = []
+        for (owner, other), message in latest.items():
+            if other not in usernames:
+                usernames[other] = (self.get_user_by_id(other) or {}).get('username', '')
+            # $setOnInsert leaves conversations that already have an entry alone
+            requests.append(_pymongo().UpdateOne({'_id': f'{owner}:{other}'}, {'$setOnInsert': {
+                'owner_id': owner,
+                **self._inbox_fields(other, usernames[other], message),
+                'unread': 0,
+            }}, upsert=True))
+        if not requests:
+            return 0
+        return self.db.inbox.bulk_write(requests, ordered=False).upserted_count
+
+    def _update_inbox(self, message: Dict[str, Any], to_username: str) -> None:
+        """Point both participants' inbox entries at message; the recipient gains an unread."""
+        sender, recipient = message['from_user_id'], message['to_user_id']
+        requests = [_pymongo().UpdateOne({'_id': f'{sender}:{recipient}'}, {'$set': {
+            'owner_id': sender, **self._inbox_fields(recipient, to_username, message), 'unread': 0,
+        }}, upsert=True)]
+        if recipient != sender:
+            requests.append(_pymongo().UpdateOne({'_id': f'{recipient}:{sender}'}, {
+                '$set': {'owner_id': recipient, **self._inbox_fields(sender, message['from_username'], message)},
+                '$inc': {'unread': 1},
+            }, upsert=True))
+        self.db.inbox.bulk_write(requests, ordered=False)
+
+    @staticmethod
+    def _inbox_fields(other: int, other_username: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'other_user_id': other,
+            'other_username': other_username,
+            'last_message': message['text'][:INBOX_PREVIEW_CHARS],
+            'last_from_user_id': message['from_user_id'],
+            'last_timestamp': message['timestamp'],
+        }
+
+    # ------------------------------------------------------------------
+    # Export / import (MongoDB, see transfer.py)
+    # ------------------------------------------------------------------
+    # Streams: 'blobs', 'photos', 'comments' and 'messages', one collection
+    # each. Exports walk the _id index in a single segment; imports are
+    # unordered bulk upserts keyed on each record's natural key, so replaying
+    # a page after a resume overwrites rather than duplicates.
+    EXPORT_COLLECTIONS = {'blobs': 'blobs', 'photos': 'photos', 'comments': 'comments', 'messages': 'messages'}
+
+    def export_segments(self, stream: str, requested: int) -> int:
+        """Scan segments used for stream: always one (pages are read in _id order)."""
+        return 1
+
+    def export_size(self, stream: str) -> Optional[int]:
+        """Approximate documents in stream (collection metadata, no scan)."""
+        return self.db[self.EXPORT_COLLECTIONS[stream]].estimated_document_count()
+
+    def export_page(self, stream: str, segment: int, total_segments: int, cursor: Optional[str],
+                    limit: int) -> Tuple[List[Dict[str, Any]], Optional[str], int]:
+        """
+        Read the limit documents after cursor (an _id) in _id order.
+
+        Returns (records, cursor of the next page or None once the stream is
+        done, documents read). PyMongoError propagates.
+        """
+        query = {}
+        if cursor is not None:
+            # Comments and messages have ObjectId keys, kept in the checkpoint as hex strings
+            query['_id'] = {'$gt': self._export_key(stream, cursor)}
+        docs = list(self.db[self.EXPORT_COLLECTIONS[stream]].find(query).sort('_id', 1).limit(limit))
+        records = []
+        for doc in docs:
+            record = {key: value for key, value in doc.items() if key not in EXPORT_PRIVATE_FIELDS}
+            if stream == 'blobs':
+                record['content_hash'] = doc['_id']
+            records.append(record)
+        next_cursor = str(docs[-1]['_id']) if len(docs) == limit else None
+        return records, next_cursor, len(docs)
+
+    def read_variants(self, stream: str, record: Dict[str, Any]) -> Optional[Dict[str, bytes]]:
+        """Image bytes of a blob (or of a photo uploaded before content addressing); None if missing."""
+        if stream != 'blobs':
+            variants = {variant: self.get_image_bytes(record['id'], variant) for variant in ('thumb', 'full')}
+            return variants if all(variants.values()) else None
+        try:
+            variants = {}
+            for variant in ('thumb', 'full'):
+                with self.images.open_download_stream_by_name(f"photos/{record['content_hash']}_{variant}.jpg") as f:
+                    variants[variant] = f.read()
+            return variants
+        except _gridfs().errors.NoFile:
+            return None
+
+    def import_variants(self, stream: str, record: Dict[str, Any], variants: Dict[str, bytes]) -> Dict[str, Any]:
+        """Upload a record's image bytes to GridFS; returns the id fields to store with it."""
+        name = record['content_hash'] if stream == 'blobs' else record['id']
+        return {
+            'thumbnail_id': self._replace_file(f"photos/{name}_thumb.jpg", variants['thumb']),
+            'full_id': self._replace_file(f"photos/{name}_full.jpg", variants['full']),
+        }
+
+    def import_records(self, stream: str, records: List[Dict[str, Any]]) -> None:
+        """Upsert exported records (plus their import_variants fields) in one unordered bulk write."""
+        if not records:
+            return
+        blob_ids: Dict[str, Dict[str, Any]] = {}
+        if stream == 'photos':
+            # Content-addressed photos share the GridFS files of their blob (imported first)
+            hashes = list({r['content_hash'] for r in records if r.get('content_hash') and 'full_id' not in r})
+            if hashes:
+                projection = {'thumbnail_id': True, 'full_id': True}
+                blob_ids = {doc['_id']: doc for doc in self.db.blobs.find({'_id': {'$in': hashes}}, projection)}
+
+        requests = []
+        for record in records:
+            if stream == 'blobs':
+                doc = {key: value for key, value in record.items() if key != 'content_hash'}
+                requests.append(_pymongo().ReplaceOne({'_id': record['content_hash']}, doc, upsert=True))
+            elif stream == 'photos':
+                doc = dict(record)
+                blob = blob_ids.get(record.get('content_hash'))
+                if blob:
+                    doc.update(thumbnail_id=blob['thumbnail_id'], full_id=blob['full_id'])
+                requests.append(_pymongo().ReplaceOne({'_id': record['id']}, doc, upsert=True))
+            elif stream == 'comments':
+                requests.append(_pymongo().ReplaceOne(
+                    {'photo_id': record['photo_id'], 'comment_id': record['comment_id']}, record, upsert=True))
+            else:
+                requests.append(_pymongo().ReplaceOne(
+                    {'conversation_id': record['conversation_id'], 'sort_key': record['sort_key']}, record,
+                    upsert=True))
+        self.db[self.EXPORT_COLLECTIONS[stream]].bulk_write(requests, ordered=False)
+        if stream == 'photos':
+            self._bump_photo_versions(record['user_id'] for record in records)
+
+    def finish_import(self) -> None:
+        """Rebuild inboxes for the imported messages (feed versions are bumped per page)."""
+        self.backfill_inbox()
+
+    @staticmethod
+    def _export_key(stream: str, cursor: str) -> Any:
+        if stream in ('comments', 'messages'):
+            from bson import ObjectId
+
+            return ObjectId(cursor)
+        return cursor
+
+    # ------------------------------------------------------------------
+    # Change versions (MongoDB)
+    # ------------------------------------------------------------------
+    def get_version(self, scope: str) -> Optional[int]:
+        """Current change counter for scope (0 if never bumped, None on error)."""
+        try:
+            doc = self.db.versions.find_one({'_id': scope})
+        except _pymongo().errors.PyMongoError as e:
+            print(f"Error reading version {scope}: {e}")
+            return None
+        return int(doc['version']) if doc else 0
+
+    def get_versions(self, scopes: List[str]) -> Optional[List[int]]:
+        """Change counters of several scopes in one query, in order (None on error)."""
+        try:
+            found = {doc['_id']: int(doc['version']) for doc in self.db.versions.find({'_id': {'$in': scopes}})}
+        except _pymongo().errors.PyMongoError as e:
+            print(f"Error reading versions: {e}")
+            return None
+        return [found.get(scope, 0) for scope in scopes]
+
+    def bump_versions(self, *scopes: str) -> None:
+        """Increment the change counters of scopes after a write."""
+        for scope in scopes:
+            try:
+                self.db.versions.update_one({'_id': scope}, {'$inc': {'version': 1}}, upsert=True)
+            except _pymongo().errors.PyMongoError as e:
+                print(f"Error bumping version {scope}: {e}")
+
+    def _bump_photo_versions(self, owner_ids: Any, *scopes: str) -> None:
+        """Bump the owners' feed versions and the global one (scope=all), plus scopes."""
+        self.bump_versions('photos', *(f'photos:{owner}' for owner in sorted(set(owner_ids))), *scopes)
+
+    # ------------------------------------------------------------------
+    # Internal utilities
+    # ------------------------------------------------------------------
+    def _upload(self, filename: str, data: bytes) -> Any:
+        """Store data in GridFS and return the new file's id."""
+        return self.images.upload_from_stream(filename, data, metadata={'contentType': 'image/jpeg'})
+
+    def _replace_file(self, filename: str, data: bytes) -> Any:
+        """Upload a new revision of filename, delete the older ones and return the new file's id."""
+        file_id = self._upload(filename, data)
+        for old in self.images.find({'filename': filename, '_id': {'$ne': file_id}}):
+            self.images.delete(old._id)
+        return file_id
+
+    def _deserialize_photo(self, doc: Dict) -> Dict[str, Any]:
+        """Convert a photo document to the standard dict (GridFS ids as strings)."""
+        if not doc:
+            return {}
+        result = {key: value for key, value in doc.items() if key != '_id'}
+        for field in ('thumbnail_id', 'full_id'):
+            if field in result:
+                result[field] = str(result[field])
+        return result
+
+    def _resize_to_bytes(self, image: Image.Image, max_width: int) -> bytes:
+        """Resize image and convert to JPEG bytes using the configured encoder."""
+        encoded = encode_variant(image, max_width, mode=self.jpeg_encoder, ssim_target=self.jpeg_ssim_target)
+        with self._encoder_stats_lock:
+            self.encoder_stats['variants'] += 1
+            self.encoder_stats['bytes'] += len(encoded.data)
+            self.encoder_stats['baseline_bytes'] += encoded.baseline_size
+        return encoded.data
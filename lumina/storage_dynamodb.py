@@ -19,194 +19,383 @@ AWS Free Tier Limits:
 
 from __future__ import annotations
 
-import base64
+import os
+import queue
+import random
+import threading
+import time
 import uuid
-from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from decimal import Decimal
+from functools import lru_cache
 from io import BytesIO
-from typing import Any, Dict, List, Optional
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
-import boto3
-import pymysql
-from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
 from PIL import Image
-from pymysql.connections import Connection
-from pymysql.cursors import DictCursor
-from werkzeug.security import check_password_hash, generate_password_hash
 
+from .imaging import content_hash, encode_variant, normalize_image, placeholder_fields, scaled_size
+from .metrics import instrument_boto_client, instrument_storage
+from .passwords import PasswordHasher
+from .storage_mysql import MySQLAccounts
+from .throttling import CapacityLimiter, StorageThrottled, TokenBucket, client_options, raise_on_throttle
 
-class StorageDynamoDB:
+# Characters of the last message kept in each inbox entry
+INBOX_PREVIEW_CHARS = 120
+
+# Comments embedded in a photo item as its preview (the latest ones, oldest first)
+COMMENT_PREVIEW_SIZE = 2
+
+# Backend-specific fields left out of exported records (see transfer.py)
+EXPORT_PRIVATE_FIELDS = ('PK', 'SK', 'thumbnail_key', 'full_key', 'thumbnail_id', 'full_id', 'comment_rev')
+
+# Pages buffered per segment between parallel_scan workers and the consumer
+SCAN_QUEUE_PAGES = 2
+
+# Marks a finished scan segment on the page queue
+_SEGMENT_DONE = object()
+
+# Keys per BatchGetItem request (the API maximum)
+BATCH_GET_SIZE = 100
+
+# Optimistic transactions retried when a concurrent writer changed the item they were conditioned on
+TRANSACTION_ATTEMPTS = 5
+
+# First backoff (seconds) between those attempts; doubled per retry, with full jitter
+TRANSACTION_BACKOFF = 0.01
+
+
+def _activity_key(timestamp: int, other_user_id: int) -> str:
+    # Zero-padded so keys sort by time
+    return f'ACT#{timestamp:013d}#{other_user_id}'
+
+
+def _unchanged(pointer: Dict[str, Any], values: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Condition on an inbox pointer still holding the message and unread count it was read with."""
+    return {
+        'ConditionExpression': 'message_id = :mid AND unread = :unread',
+        'ExpressionAttributeValues': {**(values or {}), ':mid': pointer['message_id'], ':unread': pointer['unread']},
+    }
+
+
+def _comment_preview(comment: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a comment kept in a photo's recent_comments."""
+    return {key: comment[key] for key in ('comment_id', 'user_id', 'username', 'text', 'timestamp')}
+
+
+def _latest_comments(comments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The COMMENT_PREVIEW_SIZE newest comments, oldest first."""
+    ordered = sorted(comments, key=lambda c: (int(c['timestamp']), c['comment_id']))
+    return ordered[-COMMENT_PREVIEW_SIZE:]
+
+
+@lru_cache(maxsize=None)
+def _conditions() -> Any:
+    """boto3.dynamodb.conditions (Attr, Key), imported on first use like the clients."""
+    from boto3.dynamodb import conditions
+
+    return conditions
+
+
+def _attr(name: str) -> Any:
+    return _conditions().Attr(name)
+
+
+def _key(name: str) -> Any:
+    return _conditions().Key(name)
+
+
+def _back_off(attempt: int) -> None:
+    """
+    Sleep before retrying a transaction cancelled by a concurrent writer.
+
+    Full jitter spreads writers contending on one item (a popular photo's
+    comment summary) instead of having them collide again in lockstep.
+    After the last attempt StorageThrottled is raised (503 + Retry-After).
+    """
+    if attempt >= TRANSACTION_ATTEMPTS - 1:
+        raise StorageThrottled(f'transaction still conflicting after {TRANSACTION_ATTEMPTS} attempts')
+    time.sleep(random.uniform(0, TRANSACTION_BACKOFF * 2 ** attempt))
+
+
+def _batches(items: Iterator[Any], size: int) -> Iterator[List[Any]]:
+    """Group an iterator into lists of at most size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _put_page(pages: queue.Queue, page: Any, stop: threading.Event) -> bool:
+    """Hand a page to the consumer unless it stopped listening; False if it did."""
+    while not stop.is_set():
+        try:
+            pages.put(page, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _track_latest(latest: Dict[Tuple[int, int], Dict[str, Any]], message: Dict[str, Any]) -> None:
+    """Remember message as the latest of both participants' conversations if it is newer."""
+    pairs = {(message['from_user_id'], message['to_user_id']), (message['to_user_id'], message['from_user_id'])}
+    for pair in pairs:
+        current = latest.get(pair)
+        if current is None or message['timestamp'] >= current['timestamp']:
+            latest[pair] = message
+
+
+class AWSClients(NamedTuple):
+    """boto3 objects owned by one process; never shared across a fork."""
+    pid: int
+    dynamodb: Any
+    s3: Any
+    photos_table: Any
+    comments_table: Any
+    messages_table: Any
+
+
+@instrument_storage('dynamodb', exclude=('connection',))
+class StorageDynamoDB(MySQLAccounts):
     """
     AWS-native storage layer using DynamoDB and S3.
     
     Database Schema:
-        MySQL Tables (RDS):
+        MySQL Tables (RDS, see MySQLAccounts):
             - users: id, username, email, password_hash, created_at
             - friend_requests: id, requester_id, receiver_id, status, created_at
         
         DynamoDB Tables:
-            - lumina_photos: PK=PHOTO#{id}, SK=META, user_id, username, topic, likes, timestamp
+            - lumina_photos: PK=PHOTO#{id}, SK=META, user_id, username, topic, likes, timestamp,
+                             content_hash, placeholder, dominant_color, thumb_width, thumb_height,
+                             comment_count, recent_comments (latest comments), comment_rev
+            - lumina_photos: PK=BLOB#{content_hash}, SK=REF, refs, thumbnail_key, full_key, placeholder...
+            - lumina_photos: PK=VERSION#{scope}, SK=VERSION, version (change counter behind ETags)
             - lumina_comments: PK=PHOTO#{photo_id}, SK=COMMENT#{timestamp}#{comment_id}
             - lumina_messages: PK=CONV#{conversation_id}, SK=MSG#{timestamp}
+            - lumina_messages: PK=INBOX#{user_id}, SK=ACT#{timestamp}#{other_id} (inbox entry) and
+                               SK=PEER#{other_id} (pointer to the entry's current key)
         
         S3 Bucket:
-            - photos/{photo_id}_full.jpg
-            - photos/{photo_id}_thumb.jpg
+            - photos/{content_hash}_{upload_id}_full.jpg (shared by every photo with identical pixels;
+              upload_id is new for each upload that creates the BLOB item, so a release never deletes
+              objects a later acquire wrote)
+            - photos/{content_hash}_{upload_id}_thumb.jpg
+            - photos/{photo_id}_full.jpg (legacy, uploaded before content addressing)
+            - photos/{photo_id}_thumb.jpg (legacy)
             - profiles/{user_id}_full.jpg (optional, stored directly without DB reference)
             - profiles/{user_id}_thumb.jpg (optional, stored directly without DB reference)
     """
 
+    # Fields shared by every photo that references the same content hash
+    VARIANT_FIELDS = ('thumbnail_key', 'full_key', 'thumb_width', 'thumb_height', 'placeholder', 'dominant_color')
+
     def __init__(self, config) -> None:
-        """Initialize AWS and MySQL connections."""
+        """
+        Store configuration only.
+
+        AWS clients are created on first use in each process and the MySQL
+        schema is created by `flask --app app migrate`, so building the storage
+        (and booting a worker) does no network I/O.
+        """
         self.config = config
         self.max_full_width = config.MAX_FULL_WIDTH
         self.max_thumb_width = config.MAX_THUMB_WIDTH
-
-        # AWS clients
-        self.dynamodb = boto3.resource(
-            'dynamodb',
-            region_name=config.AWS_REGION,
-            aws_access_key_id=config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
-        )
-        self.s3 = boto3.client(
-            's3',
-            region_name=config.AWS_REGION,
-            aws_access_key_id=config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
-        )
+        self.jpeg_encoder = config.JPEG_ENCODER
+        self.jpeg_ssim_target = config.JPEG_SSIM_TARGET
         self.bucket_name = config.S3_BUCKET
+        self.scan_segments = max(1, config.DYNAMODB_SCAN_SEGMENTS)
+        self.scan_read_rate = config.DYNAMODB_SCAN_READ_RATE
 
-        # DynamoDB tables
-        self.photos_table = self.dynamodb.Table(config.DYNAMODB_PHOTOS_TABLE)
-        self.comments_table = self.dynamodb.Table(config.DYNAMODB_COMMENTS_TABLE)
-        self.messages_table = self.dynamodb.Table(config.DYNAMODB_MESSAGES_TABLE)
+        # Running totals of encoded variant sizes vs the fixed quality-85 baseline
+        self.encoder_stats = {'variants': 0, 'bytes': 0, 'baseline_bytes': 0}
+        # Bulk uploads encode on several threads at once
+        self._encoder_stats_lock = threading.Lock()
 
-        self._ensure_ready()
+        # Password KDF runs in a bounded process pool (see passwords.py)
+        self.passwords = PasswordHasher(config)
+
+        self._clients: Optional[AWSClients] = None
+        self._clients_lock = threading.Lock()
 
     # ------------------------------------------------------------------
-    # Initialization
+    # AWS clients (created lazily, per process)
     # ------------------------------------------------------------------
-    def _ensure_ready(self) -> None:
-        """Initialize MySQL database and tables."""
-        self._ensure_database()
-        self._ensure_tables()
-
-    def _ensure_database(self) -> None:
-        with self._raw_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(f"CREATE DATABASE IF NOT EXISTS `{self.config.DB_NAME}` CHARACTER SET utf8mb4")
-
-    def _ensure_tables(self) -> None:
-        with self.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS users (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        username VARCHAR(255) NOT NULL UNIQUE,
-                        email VARCHAR(255) NOT NULL,
-                        password_hash VARCHAR(255) NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-                    """
-                )
-                cur.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS friend_requests (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        requester_id INT NOT NULL,
-                        receiver_id INT NOT NULL,
-                        status ENUM('pending','accepted','declined') NOT NULL DEFAULT 'pending',
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (requester_id) REFERENCES users(id) ON DELETE CASCADE,
-                        FOREIGN KEY (receiver_id) REFERENCES users(id) ON DELETE CASCADE
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-                    """
-                )
+    def _aws(self) -> AWSClients:
+        """
+        Return this process's boto3 objects, creating them on first use.
 
-    @contextmanager
-    def _raw_connection(self) -> Connection:
-        conn = pymysql.connect(
-            host=self.config.DB_HOST,
-            port=self.config.DB_PORT,
-            user=self.config.DB_USER,
-            password=self.config.DB_PASSWORD,
-            autocommit=True,
-            cursorclass=DictCursor,
+        boto3 sessions and their connection pools are not fork-safe; keying
+        them on the pid means a worker forked from a preloaded master (or from
+        a process that already made calls) builds its own on first use.
+        """
+        clients = self._clients
+        if clients is None or clients.pid != os.getpid():
+            with self._clients_lock:
+                clients = self._clients
+                if clients is None or clients.pid != os.getpid():
+                    clients = self._clients = self._create_clients()
+        return clients
+
+    def _create_clients(self) -> AWSClients:
+        import boto3
+        from botocore.config import Config as ClientConfig
+
+        session = boto3.session.Session(
+            region_name=self.config.AWS_REGION,
+            aws_access_key_id=self.config.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=self.config.AWS_SECRET_ACCESS_KEY,
         )
-        try:
-            yield conn
-        finally:
-            conn.close()
-
-    @contextmanager
-    def connection(self) -> Connection:
-        conn = pymysql.connect(
-            host=self.config.DB_HOST,
-            port=self.config.DB_PORT,
-            user=self.config.DB_USER,
-            password=self.config.DB_PASSWORD,
-            database=self.config.DB_NAME,
-            autocommit=True,
-            cursorclass=DictCursor,
+        client_config = ClientConfig(max_pool_connections=self.config.AWS_MAX_POOL_CONNECTIONS,
+                                     **client_options(self.config))
+        dynamodb = session.resource('dynamodb', config=client_config)
+        s3 = session.client('s3', config=client_config)
+        instrument_boto_client(dynamodb.meta.client)
+        instrument_boto_client(s3)
+        # Throttles become short waits (limiter, retries); only persistent ones surface as 503s
+        CapacityLimiter.from_config(self.config).register(dynamodb.meta.client)
+        raise_on_throttle(dynamodb.meta.client)
+        raise_on_throttle(s3)
+        return AWSClients(
+            pid=os.getpid(),
+            dynamodb=dynamodb,
+            s3=s3,
+            photos_table=dynamodb.Table(self.config.DYNAMODB_PHOTOS_TABLE),
+            comments_table=dynamodb.Table(self.config.DYNAMODB_COMMENTS_TABLE),
+            messages_table=dynamodb.Table(self.config.DYNAMODB_MESSAGES_TABLE),
         )
-        try:
-            yield conn
-        finally:
-            conn.close()
+
+    @property
+    def dynamodb(self):
+        return self._aws().dynamodb
+
+    @property
+    def s3(self):
+        return self._aws().s3
+
+    @property
+    def photos_table(self):
+        return self._aws().photos_table
+
+    @property
+    def comments_table(self):
+        return self._aws().comments_table
+
+    @property
+    def messages_table(self):
+        return self._aws().messages_table
 
     # ------------------------------------------------------------------
-    # User management (MySQL)
+    # Full-table scans (DynamoDB)
     # ------------------------------------------------------------------
-    def create_user(self, username: str, password: str, email: Optional[str] = None) -> Dict[str, Any]:
-        password_hash = generate_password_hash(password)
-        # Use placeholder email if none provided (for backwards compatibility)
-        if not email:
-            email = f"{username}@lumina.local"
-        
-        with self.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
-                    (username, email, password_hash),
-                )
-                user_id = cur.lastrowid
-        return {'id': user_id, 'username': username}
-
-    def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
-        with self.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT id, username, email, password_hash, created_at FROM users WHERE username=%s",
-                    (username,),
-                )
-                return cur.fetchone()
-
-    def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
-        with self.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT id, username, email, created_at FROM users WHERE id=%s",
-                    (user_id,),
-                )
-                return cur.fetchone()
+    def parallel_scan(self, table: Any, filter_expression: Any = None, projection: Optional[List[str]] = None,
+                      segments: Optional[int] = None, read_rate: Optional[float] = None,
+                      consistent_read: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every item of table matching filter_expression, scanning segments concurrently.
 
-    def verify_user(self, username: str, password: str) -> Optional[Dict[str, Any]]:
-        user = self.get_user_by_username(username)
-        if not user:
-            return None
-        if not check_password_hash(user['password_hash'], password):
-            return None
-        return {
-            'id': user['id'],
-            'username': user['username'],
+        The table is split into segments (default DYNAMODB_SCAN_SEGMENTS),
+        each scanned on its own thread. Pages are merged through a bounded
+        queue in arrival order, not table order, so memory stays at a few
+        pages however large the table is. projection limits the attributes
+        returned; read_rate (default DYNAMODB_SCAN_READ_RATE, 0 for none)
+        caps the read units per second all segments spend together, on top
+        of the per-table capacity limiter.
+
+        Items are returned raw (numbers as Decimal). ClientError propagates;
+        closing the iterator early stops the remaining segments.
+        """
+        segments = max(1, segments or self.scan_segments)
+        rate = self.scan_read_rate if read_rate is None else read_rate
+        # Debt is never forgiven (unlimited max_wait), so a large page delays the following ones
+        bucket = TokenBucket(rate, rate, float('inf')) if rate > 0 else None
+        pages: queue.Queue = queue.Queue(maxsize=segments * SCAN_QUEUE_PAGES)
+        stop = threading.Event()
+
+        def scan_segment(segment: int) -> None:
+            try:
+                for response in self._scan_pages(table, segment, segments, filter_expression, projection,
+                                                 consistent_read, bucket):
+                    if not _put_page(pages, response.get('Items', []), stop):
+                        return
+            except Exception as e:
+                _put_page(pages, e, stop)
+            else:
+                _put_page(pages, _SEGMENT_DONE, stop)
+
+        pool = ThreadPoolExecutor(max_workers=segments)
+        for segment in range(segments):
+            pool.submit(scan_segment, segment)
+        remaining = segments
+        try:
+            while remaining:
+                page = pages.get()
+                if page is _SEGMENT_DONE:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            # Consumer stopped early or a segment failed: stop the other segments
+            stop.set()
+            pool.shutdown(wait=True)
+
+    def _scan_pages(self, table: Any, segment: int, total_segments: int, filter_expression: Any,
+                    projection: Optional[List[str]], consistent_read: bool, bucket: Optional[TokenBucket],
+                    start_key: Optional[Dict[str, Any]] = None,
+                    limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the Scan responses of one segment, starting after start_key.
+
+        Goes through the shared client (thread-safe, unlike Table resources).
+        With a bucket, each page reserves one unit before it is sent and is
+        charged the capacity it actually consumed afterwards.
+        """
+        scan_kwargs: Dict[str, Any] = {
+            'TableName': table.name,
+            'Segment': segment,
+            'TotalSegments': total_segments,
+            'ReturnConsumedCapacity': 'TOTAL',
         }
+        if filter_expression is not None:
+            scan_kwargs['FilterExpression'] = filter_expression
+        if projection:
+            scan_kwargs['ProjectionExpression'] = ', '.join(f'#p{i}' for i in range(len(projection)))
+            scan_kwargs['ExpressionAttributeNames'] = {f'#p{i}': name for i, name in enumerate(projection)}
+        if consistent_read:
+            scan_kwargs['ConsistentRead'] = True
+        if limit:
+            scan_kwargs['Limit'] = limit
+        if start_key:
+            scan_kwargs['ExclusiveStartKey'] = start_key
+        client = self.dynamodb.meta.client
+        while True:
+            if bucket is not None:
+                wait = bucket.reserve(1.0)
+                if wait > 0:
+                    time.sleep(wait)
+            response = client.scan(**scan_kwargs)
+            if bucket is not None:
+                bucket.charge(float(response.get('ConsumedCapacity', {}).get('CapacityUnits', 1.0)) - 1.0)
+            yield response
+            if 'LastEvaluatedKey' not in response:
+                return
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
+    # ------------------------------------------------------------------
+    # Profile pictures (S3)
+    # ------------------------------------------------------------------
     def save_profile_picture(self, user_id: int, image: Image.Image) -> Dict[str, Any]:
         """Save profile picture to S3 (no database column needed)."""
+        image = normalize_image(image)
         thumb_bytes = self._resize_to_bytes(image, 200)
         full_bytes = self._resize_to_bytes(image, 800)
         
@@ -227,66 +416,74 @@ class StorageDynamoDB:
         except ClientError:
             return None
 
+    def get_profile_picture_path(self, user_id: int, variant: str) -> Optional[Path]:
+        """Profile pictures live in S3, never on local disk."""
+        return None
+
     # ------------------------------------------------------------------
     # Photos (DynamoDB + S3)
     # ------------------------------------------------------------------
     def list_photos(self, user_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
         """List photos, optionally filtered by user IDs."""
         try:
-            if user_ids is None:
-                # Scan all photos with SK='META' (for 'all' scope)
-                response = self.photos_table.scan(
-                    FilterExpression=Attr('SK').eq('META')
-                )
-                items = response.get('Items', [])
-                
-                # Handle pagination if there are more items
-                while 'LastEvaluatedKey' in response:
-                    response = self.photos_table.scan(
-                        FilterExpression=Attr('SK').eq('META'),
-                        ExclusiveStartKey=response['LastEvaluatedKey']
-                    )
-                    items.extend(response.get('Items', []))
-            else:
-                # For specific users, scan with filter (simpler and faster than multiple queries + gets)
-                items = []
-                response = self.photos_table.scan(
-                    FilterExpression=Attr('SK').eq('META') & Attr('user_id').is_in(user_ids)
-                )
-                items = response.get('Items', [])
-                
-                # Handle pagination
-                while 'LastEvaluatedKey' in response:
-                    response = self.photos_table.scan(
-                        FilterExpression=Attr('SK').eq('META') & Attr('user_id').is_in(user_ids),
-                        ExclusiveStartKey=response['LastEvaluatedKey']
-                    )
-                    items.extend(response.get('Items', []))
-            
             # Convert Decimal to int and sort by timestamp
-            photos = [self._deserialize_photo(item) for item in items]
+            photos = list(self.iter_photos(user_ids))
             photos.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
             return photos
         except ClientError as e:
             print(f"Error listing photos: {e}")
             return []
 
+    def iter_photos(self, user_ids: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield photos, unsorted; all of them, or only those of user_ids.
+
+        All photos come from a parallel scan (see parallel_scan). For given
+        users, their USER#{id} index items are queried for photo ids and the
+        META items fetched with BatchGetItem, so a home or profile feed reads
+        only the feed's photos instead of the whole table. Nothing is
+        accumulated or sorted; ClientError propagates to the caller.
+        """
+        if user_ids is None:
+            # Consistent like the version read before it, so the feed's ETag never runs ahead of its data
+            for item in self.parallel_scan(self.photos_table, _attr('SK').eq('META'), consistent_read=True):
+                yield self._deserialize_photo(item)
+            return
+
+        keys = ({'PK': f'PHOTO#{photo_id}', 'SK': 'META'}
+                for user_id in dict.fromkeys(user_ids) for photo_id in self._user_photo_ids(user_id))
+        for item in self._batch_get(keys):
+            yield self._deserialize_photo(item)
+
+    def _user_photo_ids(self, user_id: int) -> Iterator[str]:
+        """Ids of the user's photos, from the USER#{id} index items."""
+        query_kwargs = {
+            'KeyConditionExpression': _key('PK').eq(f'USER#{user_id}') & _key('SK').begins_with('PHOTO#'),
+            'ProjectionExpression': 'photo_id',
+            'ConsistentRead': True,
+        }
+        while True:
+            response = self.photos_table.query(**query_kwargs)
+            for item in response.get('Items', []):
+                yield item['photo_id']
+            if 'LastEvaluatedKey' not in response:
+                return
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
     def add_photo(self, user: Dict[str, Any], topic: str, image: Image.Image, caption: str = "") -> Dict[str, Any]:
-        """Add a new photo."""
+        """
+        Add a new photo.
+
+        Variants are content-addressed: re-uploading an image with identical
+        pixels reuses the stored variants and skips resizing, encoding and S3.
+        """
         photo_id = uuid.uuid4().hex
         timestamp = int(datetime.utcnow().timestamp() * 1000)
+        image = normalize_image(image)
+        digest = content_hash(image)
+        variants = self._acquire_variants(digest, image)
         
-        # Resize and upload to S3
-        thumb_bytes = self._resize_to_bytes(image, self.max_thumb_width)
-        full_bytes = self._resize_to_bytes(image, self.max_full_width)
-        
-        thumb_key = f"photos/{photo_id}_thumb.jpg"
-        full_key = f"photos/{photo_id}_full.jpg"
-        
-        self.s3.put_object(Bucket=self.bucket_name, Key=thumb_key, Body=thumb_bytes, ContentType='image/jpeg')
-        self.s3.put_object(Bucket=self.bucket_name, Key=full_key, Body=full_bytes, ContentType='image/jpeg')
-        
-        # Store metadata in DynamoDB
+        # Store metadata in DynamoDB (placeholder lets clients paint the tile before the thumbnail loads)
         item = {
             'PK': f'PHOTO#{photo_id}',
             'SK': 'META',
@@ -297,8 +494,11 @@ class StorageDynamoDB:
             'caption': caption,
             'timestamp': timestamp,
             'likes': 0,
-            'thumbnail_key': thumb_key,
-            'full_key': full_key,
+            'comment_count': 0,
+            'recent_comments': [],
+            'comment_rev': 0,
+            'content_hash': digest,
+            **variants,
         }
         self.photos_table.put_item(Item=item)
         
@@ -309,29 +509,136 @@ class StorageDynamoDB:
             'photo_id': photo_id,
             'timestamp': timestamp,
         })
+        self._bump_photo_versions([user['id']])
         
         return item
 
-    def delete_photo(self, photo_id: str) -> Optional[Dict[str, Any]]:
-        """Delete a photo and its associated data."""
-        try:
-            response = self.photos_table.get_item(Key={
+    def add_photos(self, user: Dict[str, Any], topic: str, images: List[Image.Image],
+                   caption: str = "") -> List[Union[Dict[str, Any], Exception, None]]:
+        """
+        Add several photos at once (album upload).
+
+        Images are decoded, hashed and encoded on BULK_UPLOAD_WORKERS threads
+        (Pillow releases the GIL while resizing and encoding) so their S3
+        uploads overlap, then all metadata is written through batch_write_item
+        (25 items per request) instead of two put_item calls per photo.
+
+        Returns one entry per image, in order: the stored item, None if that
+        image could not be decoded, or the exception (e.g. StorageThrottled)
+        that stopped its variants from being stored. If the metadata write
+        fails, items already written are removed, every variant reference is
+        released and the error propagates. Images are closed once processed.
+        """
+        with ThreadPoolExecutor(max_workers=self.config.BULK_UPLOAD_WORKERS) as pool:
+            prepared = list(pool.map(self._prepare_upload, images))
+
+        timestamp = int(datetime.utcnow().timestamp() * 1000)
+        results: List[Union[Dict[str, Any], Exception, None]] = []
+        stored: List[Dict[str, Any]] = []
+        for entry in prepared:
+            if not isinstance(entry, tuple):
+                results.append(entry)
+                continue
+            digest, variants = entry
+            photo_id = uuid.uuid4().hex
+            item = {
                 'PK': f'PHOTO#{photo_id}',
-                'SK': 'META'
-            })
-            item = response.get('Item')
-            if not item:
+                'SK': 'META',
+                'id': photo_id,
+                'user_id': user['id'],
+                'username': user['username'],
+                'topic': topic,
+                'caption': caption,
+                'timestamp': timestamp,
+                'likes': 0,
+                'comment_count': 0,
+                'recent_comments': [],
+                'comment_rev': 0,
+                'content_hash': digest,
+                **variants,
+            }
+            stored.append(item)
+            results.append(item)
+        try:
+            with self.photos_table.batch_writer() as batch:
+                for item in stored:
+                    batch.put_item(Item=item)
+                    batch.put_item(Item={
+                        'PK': f'USER#{user["id"]}',
+                        'SK': f'PHOTO#{item["id"]}',
+                        'photo_id': item['id'],
+                        'timestamp': timestamp,
+                    })
+        except Exception:
+            self._discard_uploads(stored)
+            raise
+        if stored:
+            self._bump_photo_versions([user['id']])
+        return results
+
+    def _prepare_upload(self, image: Image.Image) -> Union[Tuple[str, Dict[str, Any]], Exception, None]:
+        """
+        Normalize, hash and store the variants of one bulk upload.
+
+        Returns (content hash, variant fields), None if the image cannot be
+        decoded, or the exception that stopped the variants from being stored,
+        so one failed upload does not abort the others.
+        """
+        try:
+            try:
+                normalized = normalize_image(image)
+                digest = content_hash(normalized)
+            except (OSError, ValueError, Image.DecompressionBombError):
                 return None
-            
-            # Delete from S3
-            self.s3.delete_object(Bucket=self.bucket_name, Key=item.get('thumbnail_key', ''))
-            self.s3.delete_object(Bucket=self.bucket_name, Key=item.get('full_key', ''))
-            
-            # Delete from DynamoDB (main photo record)
-            self.photos_table.delete_item(Key={
-                'PK': f'PHOTO#{photo_id}',
-                'SK': 'META'
-            })
+            return digest, self._acquire_variants(digest, normalized)
+        except Exception as e:
+            return e
+        finally:
+            image.close()
+
+    def _discard_uploads(self, items: List[Dict[str, Any]]) -> None:
+        """Undo a failed bulk metadata write: delete whatever was written, then release the variants."""
+        try:
+            with self.photos_table.batch_writer() as batch:
+                for item in items:
+                    batch.delete_item(Key={'PK': item['PK'], 'SK': 'META'})
+                    batch.delete_item(Key={'PK': f"USER#{item['user_id']}", 'SK': f"PHOTO#{item['id']}"})
+        except ClientError as e:
+            # Written items may still point at the variants, so keep their references
+            print(f"Error discarding failed bulk upload: {e}")
+            return
+        for item in items:
+            try:
+                self._release_variants(item['content_hash'])
+            except ClientError as e:
+                print(f"Error releasing variants of {item['content_hash']}: {e}")
+
+    def delete_photo(self, photo_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Delete a photo and its associated data.
+
+        The photo item is removed first, conditionally, and only the call that
+        removed it releases the variants: a repeated or concurrent delete of the
+        same photo returns None instead of dropping another photo's reference.
+        """
+        try:
+            try:
+                response = self.photos_table.delete_item(
+                    Key={'PK': f'PHOTO#{photo_id}', 'SK': 'META'},
+                    ConditionExpression='attribute_exists(PK)',
+                    ReturnValues='ALL_OLD',
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    return None
+                raise
+            item = response['Attributes']
+
+            # Delete from S3 once no other photo references the variants
+            if item.get('content_hash'):
+                self._release_variants(item['content_hash'])
+            else:
+                self._delete_variant_objects(item)
             
             # Delete user index entry
             user_id = item.get('user_id')
@@ -343,6 +650,7 @@ class StorageDynamoDB:
             
             # Delete comments
             self._delete_comments_for_photo(photo_id)
+            self._bump_photo_versions([item['user_id']], f'comments:{photo_id}')
             
             return self._deserialize_photo(item)
         except ClientError:
@@ -361,7 +669,7 @@ class StorageDynamoDB:
             return None
 
     def increment_like(self, photo_id: str) -> Optional[int]:
-        """Increment like count for a photo."""
+        """Increment like count for a photo; None if the photo does not exist."""
         try:
             response = self.photos_table.update_item(
                 Key={
@@ -369,13 +677,188 @@ class StorageDynamoDB:
                     'SK': 'META'
                 },
                 UpdateExpression='SET likes = if_not_exists(likes, :zero) + :inc',
+                # Without the condition a missing photo would be upserted as a bare likes item
+                ConditionExpression='attribute_exists(PK)',
                 ExpressionAttributeValues={':inc': 1, ':zero': 0},
-                ReturnValues='UPDATED_NEW'
+                ReturnValues='ALL_NEW'
             )
+            self._bump_photo_versions([response['Attributes']['user_id']])
             return int(response['Attributes'].get('likes', 0))
         except ClientError:
             return None
 
+    def _acquire_variants(self, content_hash: str, image: Image.Image) -> Dict[str, Any]:
+        """
+        Take a reference on the stored variants for content_hash.
+
+        On a hit the reference count is incremented and the stored fields are
+        returned as-is. On a miss the variants are encoded and uploaded under
+        keys unique to this upload before the reference item is created, so a
+        reader never sees keys without objects behind them, and a release
+        racing with this upload can only delete the objects of the item it
+        removed.
+        """
+        variants = None
+        attempt = 0
+        while True:
+            stored = self._reference_variants(content_hash)
+            if stored is not None:
+                if variants is not None:
+                    # A concurrent upload of the same content won; use its objects and drop ours
+                    self._delete_variant_objects(variants)
+                return stored
+            if variants is None:
+                variants = self._upload_variants(content_hash, image)
+            try:
+                # refs is SET (not ADD) so a stray count left without variants is reset
+                names = {f'#{field}': field for field in variants}
+                values = {f':{field}': value for field, value in variants.items()}
+                self.photos_table.update_item(
+                    Key={'PK': f'BLOB#{content_hash}', 'SK': 'REF'},
+                    UpdateExpression='SET ' + ', '.join(f'#{f} = :{f}' for f in variants) + ', refs = :one',
+                    ConditionExpression='attribute_not_exists(full_key)',
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues={**values, ':one': 1},
+                )
+                return variants
+            except ClientError as e:
+                # Lost to a concurrent upload of the same content: take a reference on its variants
+                attempt += 1
+                if (e.response['Error']['Code'] != 'ConditionalCheckFailedException'
+                        or attempt == TRANSACTION_ATTEMPTS):
+                    raise
+
+    def _reference_variants(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Add a reference to existing variants; None if there are none."""
+        try:
+            response = self.photos_table.update_item(
+                Key={'PK': f'BLOB#{content_hash}', 'SK': 'REF'},
+                UpdateExpression='ADD refs :one',
+                ConditionExpression='attribute_exists(full_key)',
+                ExpressionAttributeValues={':one': 1},
+                ReturnValues='ALL_NEW',
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return None
+            raise
+        stored = response['Attributes']
+        return {field: stored[field] for field in self.VARIANT_FIELDS if field in stored}
+
+    def _upload_variants(self, content_hash: str, image: Image.Image) -> Dict[str, Any]:
+        """Encode and upload both variants under keys no other upload uses."""
+        upload_id = uuid.uuid4().hex
+        thumb_key = f"photos/{content_hash}_{upload_id}_thumb.jpg"
+        full_key = f"photos/{content_hash}_{upload_id}_full.jpg"
+        thumb_bytes = self._resize_to_bytes(image, self.max_thumb_width)
+        full_bytes = self._resize_to_bytes(image, self.max_full_width)
+        self.s3.put_object(Bucket=self.bucket_name, Key=thumb_key, Body=thumb_bytes, ContentType='image/jpeg')
+        self.s3.put_object(Bucket=self.bucket_name, Key=full_key, Body=full_bytes, ContentType='image/jpeg')
+
+        thumb_width, thumb_height = scaled_size(image.size, self.max_thumb_width)
+        return {
+            'thumbnail_key': thumb_key,
+            'full_key': full_key,
+            'thumb_width': thumb_width,
+            'thumb_height': thumb_height,
+            **placeholder_fields(image),
+        }
+
+    def _release_variants(self, content_hash: str) -> None:
+        """Drop a reference and delete the S3 variants when none remain."""
+        blob_key = {'PK': f'BLOB#{content_hash}', 'SK': 'REF'}
+        try:
+            # Conditional so a missing reference item is not created with refs = -1
+            response = self.photos_table.update_item(
+                Key=blob_key,
+                UpdateExpression='ADD refs :minus_one',
+                ConditionExpression='attribute_exists(full_key)',
+                ExpressionAttributeValues={':minus_one': -1},
+                ReturnValues='ALL_NEW',
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                print(f"Variants of {content_hash} were already released")
+                return
+            raise
+        stored = response['Attributes']
+        if stored.get('refs', 0) > 0:
+            return
+        try:
+            # Only delete if no upload re-acquired the variants in the meantime
+            self.photos_table.delete_item(
+                Key=blob_key,
+                ConditionExpression=_attr('refs').lte(0),
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return
+            raise
+        self._delete_variant_objects(stored)
+
+    def _delete_variant_objects(self, item: Dict[str, Any]) -> None:
+        for field in ('thumbnail_key', 'full_key'):
+            if item.get(field):
+                self.s3.delete_object(Bucket=self.bucket_name, Key=item[field])
+
+    def backfill_placeholders(self, max_workers: int = 8) -> int:
+        """
+        Compute placeholders for photos uploaded before they were generated.
+
+        Photos come from a parallel scan; thumbnails are fetched and decoded
+        on a bounded thread pool a batch at a time, and the DynamoDB updates
+        are issued from the calling thread. The shared BLOB item is updated
+        too, so later uploads of the same content get the placeholder.
+        Returns the number of photos updated.
+        """
+        photos = self.parallel_scan(self.photos_table, _attr('SK').eq('META') & _attr('placeholder').not_exists(),
+                                    projection=['PK', 'SK', 'thumbnail_key', 'content_hash', 'user_id'])
+        owners = []
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for items in _batches(photos, max_workers * 4):
+                keys = [item.get('thumbnail_key') for item in items]
+                for item, fields in zip(items, pool.map(self._placeholder_for_key, keys)):
+                    if not fields:
+                        continue
+                    update = {
+                        'UpdateExpression': 'SET placeholder = :p, dominant_color = :c, '
+                                            'thumb_width = :w, thumb_height = :h',
+                        'ExpressionAttributeValues': {
+                            ':p': fields['placeholder'],
+                            ':c': fields['dominant_color'],
+                            ':w': fields['thumb_width'],
+                            ':h': fields['thumb_height'],
+                        },
+                    }
+                    self.photos_table.update_item(Key={'PK': item['PK'], 'SK': item['SK']}, **update)
+                    if item.get('content_hash'):
+                        self._update_blob(item['content_hash'], update)
+                    owners.append(item['user_id'])
+        if owners:
+            self._bump_photo_versions(owners)
+        return len(owners)
+
+    def _update_blob(self, content_hash: str, update: Dict[str, Any]) -> None:
+        """Apply an update to a BLOB item unless it was released meanwhile."""
+        try:
+            self.photos_table.update_item(Key={'PK': f'BLOB#{content_hash}', 'SK': 'REF'},
+                                          ConditionExpression='attribute_exists(full_key)', **update)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    def _placeholder_for_key(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Load a stored thumbnail from S3 and derive its placeholder fields."""
+        if not key:
+            return None
+        try:
+            response = self.s3.get_object(Bucket=self.bucket_name, Key=key)
+            image = Image.open(BytesIO(response['Body'].read())).convert('RGB')
+        except (ClientError, OSError):
+            return None
+        width, height = image.size
+        return {'thumb_width': width, 'thumb_height': height, **placeholder_fields(image)}
+
     def get_image_bytes(self, photo_id: str, variant: str) -> Optional[bytes]:
         """Get image bytes from S3."""
         photo = self.get_photo(photo_id)
@@ -390,6 +873,14 @@ class StorageDynamoDB:
         except ClientError:
             return None
 
+    def get_image_path(self, photo_id: str, variant: str) -> Optional[Path]:
+        """Images live in S3, never on local disk; routes fall back to get_image_bytes."""
+        return None
+
+    def open_image(self, photo_id: str, variant: str) -> None:
+        """Not supported for S3 objects; routes fall back to get_image_bytes."""
+        return None
+
     # ------------------------------------------------------------------
     # Comments (DynamoDB)
     # ------------------------------------------------------------------
@@ -397,16 +888,22 @@ class StorageDynamoDB:
         """List comments for a photo."""
         try:
             response = self.comments_table.query(
-                KeyConditionExpression=Key('PK').eq(f'PHOTO#{photo_id}') & Key('SK').begins_with('COMMENT#'),
-                ScanIndexForward=True  # Ascending order (oldest first)
+                KeyConditionExpression=_key('PK').eq(f'PHOTO#{photo_id}') & _key('SK').begins_with('COMMENT#'),
+                ScanIndexForward=True,  # Ascending order (oldest first)
+                ConsistentRead=True,  # Guarded by the comments version ETag
             )
             return [self._deserialize_item(item) for item in response.get('Items', [])]
         except ClientError as e:
             print(f"Error listing comments: {e}")
             return []
 
-    def add_comment(self, photo_id: str, user: Dict[str, Any], text: str) -> Dict[str, Any]:
-        """Add a comment to a photo."""
+    def add_comment(self, photo_id: str, user: Dict[str, Any], text: str) -> Optional[Dict[str, Any]]:
+        """
+        Add a comment to a photo; None if the photo does not exist.
+
+        The comment and the photo's comment_count and recent_comments are
+        written in one transaction (see _comment_summary_update).
+        """
         timestamp = int(datetime.utcnow().timestamp() * 1000)
         comment_id = uuid.uuid4().hex
         
@@ -420,14 +917,162 @@ class StorageDynamoDB:
             'text': text,
             'timestamp': timestamp,
         }
-        self.comments_table.put_item(Item=item)
+        for attempt in range(TRANSACTION_ATTEMPTS):
+            meta = self._comment_meta(photo_id)
+            if meta is None:
+                return None
+            count, preview = self._comment_summary(photo_id, meta)
+            try:
+                self.dynamodb.meta.client.transact_write_items(TransactItems=[
+                    {'Put': {'TableName': self.config.DYNAMODB_COMMENTS_TABLE, 'Item': item}},
+                    self._comment_summary_update(photo_id, meta, count + 1,
+                                                 _latest_comments(preview + [_comment_preview(item)])),
+                ])
+                break
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                _back_off(attempt)
+        self._bump_photo_versions([meta['user_id']], f'comments:{photo_id}')
         return self._deserialize_item(item)
 
+    def delete_comment(self, photo_id: str, comment_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Delete a comment written by user_id, or any comment on user_id's photo.
+
+        Returns the deleted comment, or None if there is no such comment or
+        the user may not delete it. Like add_comment, the photo's summary is
+        updated in the same transaction.
+        """
+        comment = self._find_comment(photo_id, comment_id)
+        if comment is None:
+            return None
+        for attempt in range(TRANSACTION_ATTEMPTS):
+            meta = self._comment_meta(photo_id)
+            if meta is None or user_id not in (int(comment['user_id']), int(meta.get('user_id', -1))):
+                return None
+            count, preview = self._comment_summary(photo_id, meta)
+            if any(c['comment_id'] == comment_id for c in preview):
+                preview = self._recent_comments(photo_id, exclude=comment_id)
+            try:
+                self.dynamodb.meta.client.transact_write_items(TransactItems=[
+                    {'Delete': {'TableName': self.config.DYNAMODB_COMMENTS_TABLE,
+                                'Key': {'PK': comment['PK'], 'SK': comment['SK']},
+                                'ConditionExpression': 'attribute_exists(SK)'}},
+                    self._comment_summary_update(photo_id, meta, max(count - 1, 0), preview),
+                ])
+                break
+            except ClientError as e:
+                reasons = e.response.get('CancellationReasons') or [{}]
+                if reasons[0].get('Code') == 'ConditionalCheckFailed':
+                    # Deleted concurrently
+                    return None
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                _back_off(attempt)
+        self._bump_photo_versions([meta['user_id']], f'comments:{photo_id}')
+        return self._deserialize_item(comment)
+
+    def backfill_comment_counts(self) -> int:
+        """Recount comment_count and recent_comments for every photo; returns photos updated."""
+        owners = []
+        photos = self.parallel_scan(self.photos_table, _attr('SK').eq('META') & _attr('PK').begins_with('PHOTO#'),
+                                    projection=['PK', 'comment_rev', 'user_id'])
+        for meta in photos:
+            photo_id = meta['PK'].split('#', 1)[1]
+            count, preview = self._comment_summary(photo_id, {})
+            try:
+                self.dynamodb.meta.client.update_item(
+                    **self._comment_summary_update(photo_id, meta, count, preview)['Update'])
+                owners.append(meta['user_id'])
+            except ClientError as e:
+                # A comment written meanwhile already brought the summary up to date
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        if owners:
+            self._bump_photo_versions(owners)
+        return len(owners)
+
+    def _comment_meta(self, photo_id: str) -> Optional[Dict[str, Any]]:
+        """The photo item's owner and comment summary, read consistently; None if there is no photo."""
+        return self.photos_table.get_item(
+            Key={'PK': f'PHOTO#{photo_id}', 'SK': 'META'},
+            ProjectionExpression='PK, user_id, comment_count, recent_comments, comment_rev',
+            ConsistentRead=True,
+        ).get('Item')
+
+    def _comment_summary(self, photo_id: str, meta: Dict[str, Any]) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        (comment_count, recent_comments) as stored in meta, or counted from the
+        comments table for photos whose summary was never written.
+        """
+        if 'comment_rev' in meta:
+            return int(meta.get('comment_count', 0)), list(meta.get('recent_comments', []))
+        count = 0
+        query_kwargs = {
+            'KeyConditionExpression': _key('PK').eq(f'PHOTO#{photo_id}') & _key('SK').begins_with('COMMENT#'),
+            'Select': 'COUNT',
+        }
+        while True:
+            response = self.comments_table.query(**query_kwargs)
+            count += response['Count']
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return count, self._recent_comments(photo_id)
+
+    def _recent_comments(self, photo_id: str, exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+        """The preview of a photo's stored comments, leaving out comment exclude."""
+        response = self.comments_table.query(
+            KeyConditionExpression=_key('PK').eq(f'PHOTO#{photo_id}') & _key('SK').begins_with('COMMENT#'),
+            ScanIndexForward=False,
+            Limit=COMMENT_PREVIEW_SIZE + 1,
+        )
+        comments = [_comment_preview(item) for item in response.get('Items', []) if item['comment_id'] != exclude]
+        return _latest_comments(comments)
+
+    def _comment_summary_update(self, photo_id: str, meta: Dict[str, Any], count: int,
+                                preview: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        TransactWriteItems action storing a photo's comment summary.
+
+        comment_rev counts summary writes; conditioning on the revision read
+        with meta makes concurrent comment writes retry instead of losing an
+        increment or a preview entry.
+        """
+        update = {
+            'TableName': self.config.DYNAMODB_PHOTOS_TABLE,
+            'Key': {'PK': f'PHOTO#{photo_id}', 'SK': 'META'},
+            'UpdateExpression': 'SET comment_count = :count, recent_comments = :preview, comment_rev = :next',
+            'ExpressionAttributeValues': {':count': count, ':preview': preview},
+        }
+        if 'comment_rev' in meta:
+            update['ConditionExpression'] = 'comment_rev = :rev'
+            update['ExpressionAttributeValues'].update({':rev': meta['comment_rev'], ':next': meta['comment_rev'] + 1})
+        else:
+            update['ConditionExpression'] = 'attribute_exists(PK) AND attribute_not_exists(comment_rev)'
+            update['ExpressionAttributeValues'][':next'] = 1
+        return {'Update': update}
+
+    def _find_comment(self, photo_id: str, comment_id: str) -> Optional[Dict[str, Any]]:
+        """The stored comment item (with its key); comment keys start with the timestamp, not the id."""
+        query_kwargs = {
+            'KeyConditionExpression': _key('PK').eq(f'PHOTO#{photo_id}') & _key('SK').begins_with('COMMENT#'),
+            'FilterExpression': _attr('comment_id').eq(comment_id),
+        }
+        while True:
+            response = self.comments_table.query(**query_kwargs)
+            if response.get('Items'):
+                return response['Items'][0]
+            if 'LastEvaluatedKey' not in response:
+                return None
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
     def _delete_comments_for_photo(self, photo_id: str) -> None:
         """Delete all comments for a photo."""
         try:
             response = self.comments_table.query(
-                KeyConditionExpression=Key('PK').eq(f'PHOTO#{photo_id}') & Key('SK').begins_with('COMMENT#')
+                KeyConditionExpression=_key('PK').eq(f'PHOTO#{photo_id}') & _key('SK').begins_with('COMMENT#')
             )
             for item in response.get('Items', []):
                 self.comments_table.delete_item(
@@ -439,73 +1084,17 @@ class StorageDynamoDB:
         except ClientError:
             pass
 
-    # ------------------------------------------------------------------
-    # Friendships (MySQL)
-    # ------------------------------------------------------------------
-    def send_friend_request(self, requester_id: int, receiver_id: int) -> bool:
-        if requester_id == receiver_id:
-            return False
-        with self.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT id FROM friend_requests WHERE requester_id=%s AND receiver_id=%s AND status='pending'",
-                    (requester_id, receiver_id),
-                )
-                if cur.fetchone():
-                    return False
-                cur.execute(
-                    "INSERT INTO friend_requests (requester_id, receiver_id) VALUES (%s, %s)",
-                    (requester_id, receiver_id),
-                )
-        return True
-
-    def list_friend_requests(self, user_id: int) -> List[Dict[str, Any]]:
-        with self.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT fr.id, fr.requester_id, u.username AS requester_username, fr.status, fr.created_at
-                    FROM friend_requests fr
-                    JOIN users u ON u.id = fr.requester_id
-                    WHERE fr.receiver_id=%s AND fr.status='pending'
-                    ORDER BY fr.created_at DESC
-                    """,
-                    (user_id,),
-                )
-                return list(cur.fetchall())
-
-    def respond_friend_request(self, request_id: int, receiver_id: int, accept: bool) -> bool:
-        new_status = 'accepted' if accept else 'declined'
-        with self.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE friend_requests SET status=%s WHERE id=%s AND receiver_id=%s",
-                    (new_status, request_id, receiver_id),
-                )
-                return cur.rowcount > 0
-
-    def list_friends(self, user_id: int) -> List[Dict[str, Any]]:
-        with self.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT u.id, u.username
-                    FROM friend_requests fr
-                    JOIN users u ON u.id = CASE WHEN fr.requester_id=%s THEN fr.receiver_id ELSE fr.requester_id END
-                    WHERE fr.status='accepted' AND (fr.requester_id=%s OR fr.receiver_id=%s)
-                    """,
-                    (user_id, user_id, user_id),
-                )
-                return list(cur.fetchall())
-
-    def friend_ids(self, user_id: int) -> List[int]:
-        return [f['id'] for f in self.list_friends(user_id)]
-
     # ------------------------------------------------------------------
     # Messages (DynamoDB)
     # ------------------------------------------------------------------
     def send_message(self, from_user: Dict[str, Any], to_user_id: int, text: str) -> Dict[str, Any]:
-        """Send a message to another user."""
+        """
+        Send a message to another user.
+
+        The message and both participants' inbox entries are written in one
+        transaction, conditional on the entries not having moved since they
+        were read; a concurrent send to the same pair makes it retry.
+        """
         timestamp = int(datetime.utcnow().timestamp() * 1000)
         message_id = uuid.uuid4().hex
         
@@ -525,7 +1114,24 @@ class StorageDynamoDB:
             'text': text,
             'timestamp': timestamp,
         }
-        self.messages_table.put_item(Item=item)
+        to_username = (self.get_user_by_id(to_user_id) or {}).get('username', '')
+        # The sender has read everything up to their own message; the recipient has one more unread
+        sides = [(from_user['id'], to_user_id, to_username, False)]
+        if to_user_id != from_user['id']:
+            sides.append((to_user_id, from_user['id'], from_user['username'], True))
+
+        for attempt in range(TRANSACTION_ATTEMPTS):
+            actions = [{'Put': {'TableName': self.config.DYNAMODB_MESSAGES_TABLE, 'Item': item}}]
+            for owner, other, other_username, incoming in sides:
+                actions += self._inbox_move_actions(owner, other, other_username, item, incoming,
+                                                    self._inbox_pointer(owner, other))
+            try:
+                self.dynamodb.meta.client.transact_write_items(TransactItems=actions)
+                break
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                _back_off(attempt)
         return self._deserialize_item(item)
 
     def list_messages(self, user_id: int, other_user_id: int) -> List[Dict[str, Any]]:
@@ -535,7 +1141,7 @@ class StorageDynamoDB:
             conversation_id = f"CONV#{user1}#{user2}"
             
             response = self.messages_table.query(
-                KeyConditionExpression=Key('PK').eq(conversation_id) & Key('SK').begins_with('MSG#'),
+                KeyConditionExpression=_key('PK').eq(conversation_id) & _key('SK').begins_with('MSG#'),
                 ScanIndexForward=True,  # Ascending order (oldest first)
                 Limit=100
             )
@@ -543,9 +1149,332 @@ class StorageDynamoDB:
         except ClientError:
             return []
 
+    # ------------------------------------------------------------------
+    # Conversation inbox (DynamoDB)
+    # ------------------------------------------------------------------
+    # Two items per participant and conversation, in the messages table:
+    #   PK=INBOX#{user_id}, SK=ACT#{timestamp}#{other_id}  entry: last message preview, unread
+    #   PK=INBOX#{user_id}, SK=PEER#{other_id}             pointer: the entry's current SK,
+    #                                                      last message_id, unread
+    # Each message moves the entry to a new ACT# key, so a single Query in
+    # descending SK order pages through the inbox by last activity. Writes are
+    # conditional on the pointer's (message_id, unread) as read, so concurrent
+    # sends and mark-reads retry instead of losing an update.
+    def list_conversations(self, user_id: int, limit: int = 20,
+                           before: Optional[Tuple[int, int]] = None) -> List[Dict[str, Any]]:
+        """
+        List a user's conversations, most recent activity first.
+
+        before is the (last_timestamp, other_user_id) of the last entry of the
+        previous page.
+        """
+        query_kwargs = {
+            'KeyConditionExpression': _key('PK').eq(f'INBOX#{user_id}') & _key('SK').begins_with('ACT#'),
+            'ScanIndexForward': False,
+            'Limit': limit,
+        }
+        if before:
+            query_kwargs['ExclusiveStartKey'] = {'PK': f'INBOX#{user_id}', 'SK': _activity_key(*before)}
+        try:
+            response = self.messages_table.query(**query_kwargs)
+        except ClientError as e:
+            print(f"Error listing conversations: {e}")
+            return []
+        return [self._conversation(item) for item in response.get('Items', [])]
+
+    def mark_conversation_read(self, user_id: int, other_user_id: int) -> bool:
+        """Reset the unread counter of a conversation; False if there is no such conversation."""
+        pointer_key = {'PK': f'INBOX#{user_id}', 'SK': f'PEER#{other_user_id}'}
+        for attempt in range(TRANSACTION_ATTEMPTS):
+            pointer = self._inbox_pointer(user_id, other_user_id)
+            if not pointer:
+                return False
+            if not pointer.get('unread'):
+                return True
+            table = self.config.DYNAMODB_MESSAGES_TABLE
+            reset = {'UpdateExpression': 'SET unread = :zero', 'TableName': table}
+            try:
+                self.dynamodb.meta.client.transact_write_items(TransactItems=[
+                    {'Update': {**reset,
+                                'Key': {'PK': pointer_key['PK'], 'SK': pointer['activity_sk']},
+                                'ConditionExpression': 'attribute_exists(PK)',
+                                'ExpressionAttributeValues': {':zero': 0}}},
+                    {'Update': {**reset, 'Key': pointer_key, **_unchanged(pointer, {':zero': 0})}},
+                ])
+                return True
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                _back_off(attempt)
+        return False
+
+    def backfill_inbox(self) -> int:
+        """Create inbox entries for conversations that predate the inbox; returns entries created."""
+        latest: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        for message in self.parallel_scan(self.messages_table, _attr('SK').begins_with('MSG#')):
+            _track_latest(latest, self._deserialize_item(message))
+
+        usernames: Dict[int, str] = {}
+        created = 0
+        for (owner, other), message in latest.items():
+            if other not in usernames:
+                usernames[other] = (self.get_user_by_id(other) or {}).get('username', '')
+            # The conditional pointer write skips conversations that already have an entry
+            actions = self._inbox_move_actions(owner, other, usernames[other], message, False, None)
+            try:
+                self.dynamodb.meta.client.transact_write_items(TransactItems=actions)
+                created += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+        return created
+
+    def _inbox_pointer(self, owner: int, other: int) -> Optional[Dict[str, Any]]:
+        return self.messages_table.get_item(
+            Key={'PK': f'INBOX#{owner}', 'SK': f'PEER#{other}'}, ConsistentRead=True).get('Item')
+
+    def _inbox_move_actions(self, owner: int, other: int, other_username: str, message: Dict[str, Any],
+                            incoming: bool, pointer: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        TransactWriteItems actions moving owner's entry for other to message's
+        activity key, conditional on pointer (as read) still being current.
+        """
+        table = self.config.DYNAMODB_MESSAGES_TABLE
+        pk = f'INBOX#{owner}'
+        unread = int(pointer.get('unread', 0)) + 1 if pointer and incoming else int(incoming)
+        activity_sk = _activity_key(int(message['timestamp']), other)
+
+        actions = [{'Put': {'TableName': table, 'Item': {
+            'PK': pk,
+            'SK': activity_sk,
+            'other_user_id': other,
+            'other_username': other_username,
+            'last_message': message['text'][:INBOX_PREVIEW_CHARS],
+            'last_from_user_id': message['from_user_id'],
+            'last_timestamp': message['timestamp'],
+            'unread': unread,
+        }}}]
+        if pointer and pointer['activity_sk'] != activity_sk:
+            actions.append({'Delete': {'TableName': table,
+                                       'Key': {'PK': pk, 'SK': pointer['activity_sk']}}})
+        pointer_put = {'TableName': table, 'Item': {
+            'PK': pk,
+            'SK': f'PEER#{other}',
+            'activity_sk': activity_sk,
+            'message_id': message['message_id'],
+            'unread': unread,
+        }}
+        if pointer:
+            pointer_put.update(_unchanged(pointer))
+        else:
+            pointer_put['ConditionExpression'] = 'attribute_not_exists(PK)'
+        actions.append({'Put': pointer_put})
+        return actions
+
+    def _conversation(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        entry = self._deserialize_item(item)
+        for key in ('PK', 'SK'):
+            entry.pop(key, None)
+        return entry
+
+    # ------------------------------------------------------------------
+    # Export / import (DynamoDB, see transfer.py)
+    # ------------------------------------------------------------------
+    # Streams: 'blobs' (BLOB# items), 'photos' (PHOTO#/META items), 'comments'
+    # and 'messages' (MSG# items). Exports are strongly consistent parallel
+    # scans; imports are batched puts of whole items, so replaying a page
+    # after a resume overwrites rather than duplicates.
+    def export_segments(self, stream: str, requested: int) -> int:
+        """Scan segments used for stream: any number (DynamoDB splits the table)."""
+        return max(requested, 1)
+
+    def export_size(self, stream: str) -> Optional[int]:
+        """Approximate items a full scan of stream reads (DescribeTable, refreshed about every 6 hours)."""
+        table, _ = self._export_scan(stream)
+        return int(table.item_count)
+
+    def export_page(self, stream: str, segment: int, total_segments: int, cursor: Optional[Dict[str, Any]],
+                    limit: int) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]], int]:
+        """
+        Read one page of a scan segment.
+
+        Returns (records, cursor of the next page or None once the segment is
+        done, items scanned). ClientError propagates.
+        """
+        table, filter_expression = self._export_scan(stream)
+        # One page of the parallel_scan primitive; the transfer runs the segments and keeps the cursors
+        response = next(self._scan_pages(table, segment, total_segments, filter_expression, None, True, None,
+                                         start_key=cursor, limit=limit))
+        records = []
+        for item in response.get('Items', []):
+            record = self._deserialize_photo(item) if stream == 'photos' else self._deserialize_item(item)
+            if stream == 'blobs':
+                record['content_hash'] = item['PK'].split('#', 1)[1]
+            for field in EXPORT_PRIVATE_FIELDS:
+                record.pop(field, None)
+            records.append(record)
+        return records, response.get('LastEvaluatedKey'), response.get('ScannedCount', 0)
+
+    def read_variants(self, stream: str, record: Dict[str, Any]) -> Optional[Dict[str, bytes]]:
+        """Image bytes of a blob (or of a photo uploaded before content addressing); None if missing."""
+        if stream != 'blobs':
+            variants = {variant: self.get_image_bytes(record['id'], variant) for variant in ('thumb', 'full')}
+            return variants if all(variants.values()) else None
+        blob = self.photos_table.get_item(
+            Key={'PK': f"BLOB#{record['content_hash']}", 'SK': 'REF'},
+            ProjectionExpression='thumbnail_key, full_key', ConsistentRead=True,
+        ).get('Item')
+        if not blob or 'full_key' not in blob:
+            return None
+        try:
+            return {
+                variant: self.s3.get_object(Bucket=self.bucket_name, Key=blob[field])['Body'].read()
+                for variant, field in (('thumb', 'thumbnail_key'), ('full', 'full_key'))
+            }
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def import_variants(self, stream: str, record: Dict[str, Any], variants: Dict[str, bytes]) -> Dict[str, Any]:
+        """Upload a record's image bytes; returns the key fields to store with it."""
+        name = record['content_hash'] if stream == 'blobs' else record['id']
+        fields = {}
+        for variant, field in (('thumb', 'thumbnail_key'), ('full', 'full_key')):
+            key = f"photos/{name}_{variant}.jpg"
+            self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=variants[variant], ContentType='image/jpeg')
+            fields[field] = key
+        return fields
+
+    def import_records(self, stream: str, records: List[Dict[str, Any]]) -> None:
+        """Write exported records (plus their import_variants fields) with batched puts."""
+        table = self.comments_table if stream == 'comments' else (
+            self.messages_table if stream == 'messages' else self.photos_table)
+        with table.batch_writer(overwrite_by_pkeys=['PK', 'SK']) as batch:
+            for record in records:
+                if stream == 'blobs':
+                    batch.put_item(Item={
+                        'PK': f"BLOB#{record['content_hash']}",
+                        'SK': 'REF',
+                        'thumbnail_key': f"photos/{record['content_hash']}_thumb.jpg",
+                        'full_key': f"photos/{record['content_hash']}_full.jpg",
+                        **{k: v for k, v in record.items() if k != 'content_hash'},
+                    })
+                elif stream == 'photos':
+                    item = {'PK': f"PHOTO#{record['id']}", 'SK': 'META', **record}
+                    if record.get('content_hash'):
+                        # Variant keys are derived from the content hash (see _acquire_variants)
+                        item.setdefault('thumbnail_key', f"photos/{record['content_hash']}_thumb.jpg")
+                        item.setdefault('full_key', f"photos/{record['content_hash']}_full.jpg")
+                    if 'comment_count' in record:
+                        item['comment_rev'] = 0
+                    batch.put_item(Item=item)
+                    batch.put_item(Item={
+                        'PK': f"USER#{record['user_id']}",
+                        'SK': f"PHOTO#{record['id']}",
+                        'photo_id': record['id'],
+                        'timestamp': record['timestamp'],
+                    })
+                elif stream == 'comments':
+                    batch.put_item(Item={
+                        'PK': f"PHOTO#{record['photo_id']}",
+                        'SK': f"COMMENT#{record['timestamp']}#{record['comment_id']}",
+                        **record,
+                    })
+                else:
+                    batch.put_item(Item={'PK': record['conversation_id'], 'SK': f"MSG#{record['sort_key']}", **record})
+        if stream == 'photos' and records:
+            self._bump_photo_versions(record['user_id'] for record in records)
+
+    def finish_import(self) -> None:
+        """Rebuild inboxes for the imported messages (feed versions are bumped per page)."""
+        self.backfill_inbox()
+
+    def _export_scan(self, stream: str) -> Tuple[Any, Any]:
+        if stream == 'blobs':
+            return self.photos_table, _attr('PK').begins_with('BLOB#')
+        if stream == 'photos':
+            return self.photos_table, _attr('PK').begins_with('PHOTO#') & _attr('SK').eq('META')
+        if stream == 'comments':
+            return self.comments_table, _attr('SK').begins_with('COMMENT#')
+        if stream == 'messages':
+            return self.messages_table, _attr('SK').begins_with('MSG#')
+        raise ValueError(f'unknown stream {stream!r}')
+
+    # ------------------------------------------------------------------
+    # Change versions (DynamoDB)
+    # ------------------------------------------------------------------
+    # Scopes: 'photos' (scope=all feed), 'photos:{user_id}' (that user's
+    # photos, combined with the friends' for home feeds), 'comments:{photo_id}',
+    # 'friends:{user_id}' (pending requests and friend list). Readers fetch the version before
+    # running the query it guards, and both are strongly consistent reads, so
+    # a response is never tagged newer than its data.
+    def get_version(self, scope: str) -> Optional[int]:
+        """Current change counter for scope (0 if never bumped, None on error)."""
+        try:
+            response = self.photos_table.get_item(
+                Key={'PK': f'VERSION#{scope}', 'SK': 'VERSION'},
+                ProjectionExpression='#v',
+                ExpressionAttributeNames={'#v': 'version'},
+                ConsistentRead=True,
+            )
+            return int(response.get('Item', {}).get('version', 0))
+        except ClientError as e:
+            print(f"Error reading version {scope}: {e}")
+            return None
+
+    def get_versions(self, scopes: List[str]) -> Optional[List[int]]:
+        """Change counters of several scopes with BatchGetItem, in order (None on error)."""
+        keys = [{'PK': f'VERSION#{scope}', 'SK': 'VERSION'} for scope in dict.fromkeys(scopes)]
+        try:
+            found = {item['PK'].split('#', 1)[1]: int(item.get('version', 0))
+                     for item in self._batch_get(keys, 'PK, #v', {'#v': 'version'})}
+        except ClientError as e:
+            print(f"Error reading versions: {e}")
+            return None
+        return [found.get(scope, 0) for scope in scopes]
+
+    def bump_versions(self, *scopes: str) -> None:
+        """Increment the change counters of scopes after a write."""
+        for scope in scopes:
+            try:
+                self.photos_table.update_item(
+                    Key={'PK': f'VERSION#{scope}', 'SK': 'VERSION'},
+                    UpdateExpression='ADD #v :one',
+                    ExpressionAttributeNames={'#v': 'version'},
+                    ExpressionAttributeValues={':one': 1},
+                )
+            except ClientError as e:
+                print(f"Error bumping version {scope}: {e}")
+
+    def _bump_photo_versions(self, owner_ids: Any, *scopes: str) -> None:
+        """Bump the owners' feed versions and the global one (scope=all), plus scopes."""
+        self.bump_versions('photos', *(f'photos:{owner}' for owner in sorted(set(owner_ids))), *scopes)
+
     # ------------------------------------------------------------------
     # Internal utilities
     # ------------------------------------------------------------------
+    def _batch_get(self, keys: Iterable[Dict[str, str]], projection: Optional[str] = None,
+                   names: Optional[Dict[str, str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Read photos-table items with BatchGetItem, BATCH_GET_SIZE keys per request.
+
+        Keys the service leaves unprocessed are requested again; items come
+        back in no particular order and missing keys are skipped.
+        """
+        table = self.config.DYNAMODB_PHOTOS_TABLE
+        for batch in _batches(iter(keys), BATCH_GET_SIZE):
+            request: Dict[str, Any] = {'Keys': batch, 'ConsistentRead': True}
+            if projection:
+                request['ProjectionExpression'] = projection
+            if names:
+                request['ExpressionAttributeNames'] = names
+            pending: Optional[Dict[str, Any]] = {table: request}
+            while pending:
+                response = self.dynamodb.meta.client.batch_get_item(RequestItems=pending)
+                yield from response['Responses'].get(table, [])
+                pending = response.get('UnprocessedKeys')
+
     def _deserialize_photo(self, item: Dict) -> Dict[str, Any]:
         """Convert DynamoDB item to standard dict, handling Decimals."""
         if not item:
@@ -561,6 +1490,8 @@ class StorageDynamoDB:
             result['thumbnail_id'] = result['thumbnail_key']
         if 'full_key' in result:
             result['full_id'] = result['full_key']
+        if 'recent_comments' in result:
+            result['recent_comments'] = [self._deserialize_item(c) for c in result['recent_comments']]
         return result
 
     def _deserialize_item(self, item: Dict) -> Dict[str, Any]:
@@ -575,14 +1506,11 @@ class StorageDynamoDB:
                 result[key] = value
         return result
 
-    @staticmethod
-    def _resize_to_bytes(image: Image.Image, max_width: int) -> bytes:
-        """Resize image and convert to JPEG bytes."""
-        img = image.copy()
-        width, height = img.size
-        if width > max_width:
-            ratio = max_width / width
-            img = img.resize((max_width, int(height * ratio)), Image.LANCZOS)
-        buffer = BytesIO()
-        img.save(buffer, format='JPEG', quality=85, optimize=True)
-        return buffer.getvalue()
+    def _resize_to_bytes(self, image: Image.Image, max_width: int) -> bytes:
+        """Resize image and convert to JPEG bytes using the configured encoder."""
+        encoded = encode_variant(image, max_width, mode=self.jpeg_encoder, ssim_target=self.jpeg_ssim_target)
+        with self._encoder_stats_lock:
+            self.encoder_stats['variants'] += 1
+            self.encoder_stats['bytes'] += len(encoded.data)
+            self.encoder_stats['baseline_bytes'] += encoded.baseline_size
+        return encoded.data
@@ -0,0 +1,951 @@
+"""
+Storage Layer Module - Local Single-Node Architecture (SQLite + Filesystem)
+
+This module implements the storage interface of StorageDynamoDB without
+any external service:
+    - SQLite (WAL mode): users, friendships, photo metadata, comments,
+      messages, the conversation inbox and change versions, with indexes
+      for every query path
+    - Filesystem: image variants as plain JPEG files
+
+Design Rationale:
+    On a single box, local files served with send_file let the WSGI server
+    hand them to the kernel (sendfile) instead of copying bytes through
+    Python, and SQLite in WAL mode serves concurrent readers alongside a
+    writer. With no network hops it is also a fast, hermetic backend for
+    tests and benchmarks.
+
+Directory Layout (LOCAL_DATA_DIR):
+    lumina.db                                     - SQLite database (+ -wal/-shm)
+    blobs/{hash[0:2]}/{hash[2:4]}/{hash}_full.jpg - content-addressed photo variants
+    blobs/{hash[0:2]}/{hash[2:4]}/{hash}_thumb.jpg
+    profiles/{user_id % 256:02x}/{user_id}_full.jpg
+    profiles/{user_id % 256:02x}/{user_id}_thumb.jpg
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from PIL import Image
+from .imaging import content_hash, encode_variant, normalize_image, placeholder_fields, scaled_size
+from .metrics import instrument_storage, timed_backend_call
+from .passwords import PasswordHasher, PasswordHashingBusy
+
+# Rows fetched per step while streaming a feed
+ITER_BATCH_SIZE = 500
+
+# Characters of the last message kept in each inbox entry
+INBOX_PREVIEW_CHARS = 120
+
+# Comments embedded in a photo row as its preview (the latest ones, oldest first)
+COMMENT_PREVIEW_SIZE = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    email TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS friend_requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    requester_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    receiver_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'accepted', 'declined')),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS friend_requests_receiver ON friend_requests (receiver_id, status);
+CREATE INDEX IF NOT EXISTS friend_requests_requester ON friend_requests (requester_id, status);
+
+CREATE TABLE IF NOT EXISTS blobs (
+    content_hash TEXT PRIMARY KEY,
+    refs INTEGER NOT NULL,
+    thumbnail_key TEXT NOT NULL,
+    full_key TEXT NOT NULL,
+    thumb_width INTEGER,
+    thumb_height INTEGER,
+    placeholder TEXT,
+    dominant_color TEXT
+);
+CREATE TABLE IF NOT EXISTS photos (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    caption TEXT NOT NULL DEFAULT '',
+    timestamp INTEGER NOT NULL,
+    likes INTEGER NOT NULL DEFAULT 0,
+    content_hash TEXT,
+    thumbnail_key TEXT,
+    full_key TEXT,
+    thumb_width INTEGER,
+    thumb_height INTEGER,
+    placeholder TEXT,
+    dominant_color TEXT,
+    comment_count INTEGER,
+    recent_comments TEXT
+);
+CREATE INDEX IF NOT EXISTS photos_by_time ON photos (timestamp DESC);
+CREATE INDEX IF NOT EXISTS photos_by_user ON photos (user_id, timestamp DESC);
+
+CREATE TABLE IF NOT EXISTS comments (
+    comment_id TEXT PRIMARY KEY,
+    photo_id TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    text TEXT NOT NULL,
+    timestamp INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comments_by_photo ON comments (photo_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS messages (
+    message_id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    sort_key TEXT NOT NULL,
+    from_user_id INTEGER NOT NULL,
+    from_username TEXT NOT NULL,
+    to_user_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    timestamp INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_conversation ON messages (conversation_id, sort_key);
+
+CREATE TABLE IF NOT EXISTS inbox (
+    owner_id INTEGER NOT NULL,
+    other_user_id INTEGER NOT NULL,
+    other_username TEXT NOT NULL,
+    last_message TEXT NOT NULL,
+    last_from_user_id INTEGER NOT NULL,
+    last_timestamp INTEGER NOT NULL,
+    unread INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (owner_id, other_user_id)
+);
+CREATE INDEX IF NOT EXISTS inbox_by_activity ON inbox (owner_id, last_timestamp DESC, other_user_id DESC);
+
+CREATE TABLE IF NOT EXISTS versions (
+    scope TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+PHOTO_COLUMNS = ('id, user_id, username, topic, caption, timestamp, likes, content_hash, thumbnail_key, '
+                 'full_key, thumb_width, thumb_height, placeholder, dominant_color, comment_count, recent_comments')
+
+# Columns added after a table was first created; migrate() adds them to existing databases.
+# comment_count is NULL until the photo's comments are first counted; recent_comments is JSON.
+ADDED_COLUMNS = {
+    'photos': ('comment_count INTEGER', 'recent_comments TEXT'),
+}
+
+
+@instrument_storage('local')
+class StorageLocal:
+    """
+    Single-node storage layer using SQLite and the local filesystem.
+
+    Implements the same public interface as StorageDynamoDB and returns the
+    same dictionaries, so routes and templates are backend-agnostic. Image
+    variants are additionally exposed as file paths (get_image_path) so
+    routes can serve them with send_file.
+    """
+
+    # Fields shared by every photo that references the same content hash
+    VARIANT_FIELDS = ('thumbnail_key', 'full_key', 'thumb_width', 'thumb_height', 'placeholder', 'dominant_color')
+
+    def __init__(self, config) -> None:
+        """Store configuration; the database is opened per thread on first use."""
+        self.config = config
+        self.max_full_width = config.MAX_FULL_WIDTH
+        self.max_thumb_width = config.MAX_THUMB_WIDTH
+        self.jpeg_encoder = config.JPEG_ENCODER
+        self.jpeg_ssim_target = config.JPEG_SSIM_TARGET
+        self.data_dir = Path(config.LOCAL_DATA_DIR).resolve()
+        self.db_path = self.data_dir / 'lumina.db'
+
+        # Running totals of encoded variant sizes vs the fixed quality-85 baseline
+        self.encoder_stats = {'variants': 0, 'bytes': 0, 'baseline_bytes': 0}
+        # Bulk uploads encode on several threads at once
+        self._encoder_stats_lock = threading.Lock()
+
+        self.passwords = PasswordHasher(config)
+
+        self._local = threading.local()
+        self._schema_pid: Optional[int] = None
+        self._schema_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Connections and schema
+    # ------------------------------------------------------------------
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Return this thread's connection, opening it on first use.
+
+        sqlite3 connections must not cross threads or forks, so they are kept
+        per thread and re-opened when the pid changes.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            self._ensure_schema()
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA foreign_keys=ON')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _ensure_schema(self) -> None:
+        # Creating a local schema is a few file-local statements with no network
+        # round trip, so unlike MySQL it is safe to do once per process
+        if self._schema_pid == os.getpid():
+            return
+        with self._schema_lock:
+            if self._schema_pid != os.getpid():
+                self.migrate()
+                self._schema_pid = os.getpid()
+
+    def migrate(self) -> None:
+        """Create the data directories, enable WAL and create tables and indexes."""
+        (self.data_dir / 'blobs').mkdir(parents=True, exist_ok=True)
+        (self.data_dir / 'profiles').mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            for table, columns in ADDED_COLUMNS.items():
+                existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+                for column in columns:
+                    if column.split()[0] not in existing:
+                        try:
+                            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column}')
+                        except sqlite3.OperationalError as e:
+                            # Another process added it first
+                            if 'duplicate column' not in str(e):
+                                raise
+        finally:
+            conn.close()
+
+    def _execute(self, query: str, args=()) -> sqlite3.Cursor:
+        with timed_backend_call('sqlite', query.split(None, 1)[0].upper()):
+            return self._connection().execute(query, args)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Serialize a multi-statement write (BEGIN IMMEDIATE takes the write lock up front)."""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    # ------------------------------------------------------------------
+    # User management
+    # ------------------------------------------------------------------
+    def create_user(self, username: str, password: str, email: Optional[str] = None) -> Dict[str, Any]:
+        password_hash = self.passwords.hash(password)
+        if not email:
+            email = f"{username}@lumina.local"
+        cur = self._execute(
+            "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+            (username, email, password_hash),
+        )
+        return {'id': cur.lastrowid, 'username': username}
+
+    def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        row = self._execute(
+            "SELECT id, username, email, password_hash, created_at FROM users WHERE username=?",
+            (username,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
+        row = self._execute(
+            "SELECT id, username, email, created_at FROM users WHERE id=?",
+            (user_id,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def verify_user(self, username: str, password: str) -> Optional[Dict[str, Any]]:
+        user = self.get_user_by_username(username)
+        if not user:
+            return None
+        if not self.passwords.verify(user['password_hash'], password):
+            return None
+        if self.passwords.needs_rehash(user['password_hash']):
+            self._rehash_password(user['id'], password)
+        return {
+            'id': user['id'],
+            'username': user['username'],
+        }
+
+    def _rehash_password(self, user_id: int, password: str) -> None:
+        """Store a hash made with the current PASSWORD_HASH_METHOD (best effort)."""
+        try:
+            password_hash = self.passwords.hash(password)
+        except PasswordHashingBusy:
+            return  # the next login tries again
+        self._execute("UPDATE users SET password_hash=? WHERE id=?", (password_hash, user_id))
+
+    def save_profile_picture(self, user_id: int, image: Image.Image) -> Dict[str, Any]:
+        """Save profile picture files (no database row needed)."""
+        image = normalize_image(image)
+        thumb_key = self._profile_key(user_id, 'thumb')
+        full_key = self._profile_key(user_id, 'full')
+        self._write_file(thumb_key, self._resize_to_bytes(image, 200))
+        self._write_file(full_key, self._resize_to_bytes(image, 800))
+        return {'full': full_key, 'thumb': thumb_key}
+
+    def get_profile_picture(self, user_id: int, variant: str) -> Optional[bytes]:
+        path = self.get_profile_picture_path(user_id, variant)
+        return path.read_bytes() if path else None
+
+    def get_profile_picture_path(self, user_id: int, variant: str) -> Optional[Path]:
+        """Absolute path of a profile picture variant, or None if none was uploaded."""
+        path = self.data_dir / self._profile_key(user_id, variant)
+        return path if path.is_file() else None
+
+    # ------------------------------------------------------------------
+    # Photos
+    # ------------------------------------------------------------------
+    def list_photos(self, user_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """List photos newest first, optionally filtered by user IDs."""
+        try:
+            return list(self.iter_photos(user_ids))
+        except sqlite3.Error as e:
+            print(f"Error listing photos: {e}")
+            return []
+
+    def iter_photos(self, user_ids: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield photos newest first, ITER_BATCH_SIZE rows at a time.
+
+        The query walks the timestamp (or user, timestamp) index, so nothing
+        is sorted in memory. sqlite3.Error propagates to the caller.
+        """
+        if user_ids is None:
+            cur = self._execute(f"SELECT {PHOTO_COLUMNS} FROM photos ORDER BY timestamp DESC")
+        elif not user_ids:
+            return
+        else:
+            placeholders = ', '.join('?' * len(user_ids))
+            cur = self._execute(
+                f"SELECT {PHOTO_COLUMNS} FROM photos WHERE user_id IN ({placeholders}) ORDER BY timestamp DESC",
+                tuple(user_ids),
+            )
+        try:
+            while True:
+                rows = cur.fetchmany(ITER_BATCH_SIZE)
+                if not rows:
+                    return
+                for row in rows:
+                    yield self._photo(row)
+        finally:
+            cur.close()
+
+    def add_photo(self, user: Dict[str, Any], topic: str, image: Image.Image, caption: str = "") -> Dict[str, Any]:
+        """
+        Add a new photo.
+
+        Variants are content-addressed: re-uploading an image with identical
+        pixels reuses the stored files and skips resizing and encoding.
+        """
+        photo_id = uuid.uuid4().hex
+        timestamp = int(datetime.utcnow().timestamp() * 1000)
+        image = normalize_image(image)
+        digest = content_hash(image)
+        variants = self._acquire_variants(digest, image)
+
+        item = {
+            'id': photo_id,
+            'user_id': user['id'],
+            'username': user['username'],
+            'topic': topic,
+            'caption': caption,
+            'timestamp': timestamp,
+            'likes': 0,
+            'comment_count': 0,
+            'content_hash': digest,
+            **variants,
+        }
+        columns = ', '.join(item)
+        self._execute(
+            f"INSERT INTO photos ({columns}) VALUES ({', '.join('?' * len(item))})",
+            tuple(item.values()),
+        )
+        self._bump_photo_versions([user['id']])
+        return item
+
+    def add_photos(self, user: Dict[str, Any], topic: str, images: List[Image.Image],
+                   caption: str = "") -> List[Union[Dict[str, Any], Exception, None]]:
+        """
+        Add several photos at once (album upload).
+
+        Images are decoded, hashed and encoded on BULK_UPLOAD_WORKERS threads
+        (Pillow releases the GIL while resizing and encoding), then all rows
+        are inserted in a single transaction.
+
+        Returns one entry per image, in order: the stored photo, None if that
+        image could not be decoded, or the exception that stopped its files
+        from being stored. If the insert fails, every variant reference is
+        released and the error propagates. Images are closed once processed.
+        """
+        with ThreadPoolExecutor(max_workers=self.config.BULK_UPLOAD_WORKERS) as pool:
+            prepared = list(pool.map(self._prepare_upload, images))
+
+        timestamp = int(datetime.utcnow().timestamp() * 1000)
+        items: List[Union[Dict[str, Any], Exception, None]] = []
+        for entry in prepared:
+            if not isinstance(entry, tuple):
+                items.append(entry)
+                continue
+            digest, variants = entry
+            items.append({
+                'id': uuid.uuid4().hex,
+                'user_id': user['id'],
+                'username': user['username'],
+                'topic': topic,
+                'caption': caption,
+                'timestamp': timestamp,
+                'likes': 0,
+                'comment_count': 0,
+                'content_hash': digest,
+                **variants,
+            })
+        stored = [item for item in items if isinstance(item, dict)]
+        if stored:
+            columns = ', '.join(stored[0])
+            try:
+                with self._transaction(), timed_backend_call('sqlite', 'INSERT'):
+                    self._connection().executemany(
+                        f"INSERT INTO photos ({columns}) VALUES ({', '.join('?' * len(stored[0]))})",
+                        [tuple(item.values()) for item in stored],
+                    )
+            except Exception:
+                # The transaction rolled back, so no row points at the variants
+                try:
+                    with self._transaction():
+                        for item in stored:
+                            self._release_variants(item['content_hash'])
+                except sqlite3.Error as e:
+                    print(f"Error releasing variants of a failed bulk upload: {e}")
+                raise
+            self._bump_photo_versions([user['id']])
+        return items
+
+    def _prepare_upload(self, image: Image.Image) -> Union[Tuple[str, Dict[str, Any]], Exception, None]:
+        """
+        Normalize, hash and store the variants of one bulk upload.
+
+        Returns (content hash, variant fields), None if the image cannot be
+        decoded, or the exception that stopped the files from being stored,
+        so one failed upload does not abort the others.
+        """
+        try:
+            try:
+                normalized = normalize_image(image)
+                digest = content_hash(normalized)
+            except (OSError, ValueError, Image.DecompressionBombError):
+                return None
+            return digest, self._acquire_variants(digest, normalized)
+        except Exception as e:
+            return e
+        finally:
+            image.close()
+
+    def delete_photo(self, photo_id: str) -> Optional[Dict[str, Any]]:
+        """Delete a photo, its comments, and its files once no other photo uses them."""
+        with self._transaction():
+            row = self._execute(f"SELECT {PHOTO_COLUMNS} FROM photos WHERE id=?", (photo_id,)).fetchone()
+            if not row:
+                return None
+            self._execute("DELETE FROM photos WHERE id=?", (photo_id,))
+            self._execute("DELETE FROM comments WHERE photo_id=?", (photo_id,))
+            if row['content_hash']:
+                self._release_variants(row['content_hash'])
+        self._bump_photo_versions([row['user_id']], f'comments:{photo_id}')
+        return self._photo(row)
+
+    def get_photo(self, photo_id: str) -> Optional[Dict[str, Any]]:
+        """Get a single photo by ID."""
+        row = self._execute(f"SELECT {PHOTO_COLUMNS} FROM photos WHERE id=?", (photo_id,)).fetchone()
+        return self._photo(row) if row else None
+
+    def increment_like(self, photo_id: str) -> Optional[int]:
+        """Increment like count for a photo."""
+        row = self._execute(
+            "UPDATE photos SET likes = likes + 1 WHERE id=? RETURNING likes, user_id",
+            (photo_id,),
+        ).fetchone()
+        if not row:
+            return None
+        self._bump_photo_versions([row['user_id']])
+        return row['likes']
+
+    def _acquire_variants(self, content_hash: str, image: Image.Image) -> Dict[str, Any]:
+        """
+        Take a reference on the stored variants for content_hash.
+
+        Encoding happens outside the write lock; files are written and the
+        blob row inserted inside one transaction, so a concurrent release can
+        never delete files that a committed row points at.
+        """
+        with self._transaction():
+            row = self._execute(
+                "UPDATE blobs SET refs = refs + 1 WHERE content_hash=? "
+                "RETURNING thumbnail_key, full_key, thumb_width, thumb_height, placeholder, dominant_color",
+                (content_hash,),
+            ).fetchone()
+        if row:
+            return dict(row)
+
+        thumb_bytes = self._resize_to_bytes(image, self.max_thumb_width)
+        full_bytes = self._resize_to_bytes(image, self.max_full_width)
+        thumb_width, thumb_height = scaled_size(image.size, self.max_thumb_width)
+        variants = {
+            'thumbnail_key': self._blob_key(content_hash, 'thumb'),
+            'full_key': self._blob_key(content_hash, 'full'),
+            'thumb_width': thumb_width,
+            'thumb_height': thumb_height,
+            **placeholder_fields(image),
+        }
+        with self._transaction():
+            self._write_file(variants['thumbnail_key'], thumb_bytes)
+            self._write_file(variants['full_key'], full_bytes)
+            # A concurrent upload of the same content may have inserted the row
+            # meanwhile; its (deterministic) files were just rewritten identically
+            self._execute(
+                "INSERT INTO blobs (content_hash, refs, thumbnail_key, full_key, thumb_width, thumb_height, "
+                "placeholder, dominant_color) VALUES (?, 1, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(content_hash) DO UPDATE SET refs = refs + 1",
+                (content_hash, *(variants[field] for field in self.VARIANT_FIELDS)),
+            )
+        return variants
+
+    def _release_variants(self, content_hash: str) -> None:
+        """Drop a reference and delete the files when none remain (caller holds the transaction)."""
+        row = self._execute(
+            "UPDATE blobs SET refs = refs - 1 WHERE content_hash=? RETURNING refs, thumbnail_key, full_key",
+            (content_hash,),
+        ).fetchone()
+        if row is None or row['refs'] > 0:
+            return
+        self._execute("DELETE FROM blobs WHERE content_hash=?", (content_hash,))
+        for key in (row['thumbnail_key'], row['full_key']):
+            (self.data_dir / key).unlink(missing_ok=True)
+
+    def backfill_placeholders(self, max_workers: int = 8) -> int:
+        """
+        Compute placeholders for photos stored without them.
+
+        Thumbnails are read and decoded on a bounded thread pool; the SQLite
+        updates are issued from the calling thread. The shared blob row is
+        updated too, so later uploads of the same content get the
+        placeholder. Returns the number of photos updated.
+        """
+        rows = self._execute(
+            "SELECT id, user_id, content_hash, thumbnail_key FROM photos "
+            "WHERE placeholder IS NULL AND thumbnail_key IS NOT NULL"
+        ).fetchall()
+        owners = []
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            keys = [row['thumbnail_key'] for row in rows]
+            for row, fields in zip(rows, pool.map(self._placeholder_for_key, keys)):
+                if not fields:
+                    continue
+                values = (fields['thumb_width'], fields['thumb_height'], fields['placeholder'],
+                          fields['dominant_color'])
+                with self._transaction():
+                    self._execute(
+                        "UPDATE photos SET thumb_width=?, thumb_height=?, placeholder=?, dominant_color=? "
+                        "WHERE id=?",
+                        (*values, row['id']),
+                    )
+                    if row['content_hash']:
+                        self._execute(
+                            "UPDATE blobs SET thumb_width=?, thumb_height=?, placeholder=?, dominant_color=? "
+                            "WHERE content_hash=?",
+                            (*values, row['content_hash']),
+                        )
+                owners.append(row['user_id'])
+        if owners:
+            self._bump_photo_versions(owners)
+        return len(owners)
+
+    def _placeholder_for_key(self, key: str) -> Optional[Dict[str, Any]]:
+        """Load a stored thumbnail and derive its placeholder fields."""
+        try:
+            with Image.open(self.data_dir / key) as thumb:
+                image = thumb.convert('RGB')
+        except OSError:
+            return None
+        width, height = image.size
+        return {'thumb_width': width, 'thumb_height': height, **placeholder_fields(image)}
+
+    def get_image_bytes(self, photo_id: str, variant: str) -> Optional[bytes]:
+        path = self.get_image_path(photo_id, variant)
+        return path.read_bytes() if path else None
+
+    def get_image_path(self, photo_id: str, variant: str) -> Optional[Path]:
+        """Absolute path of a photo variant, or None if the photo or file is missing."""
+        column = 'thumbnail_key' if variant == 'thumb' else 'full_key'
+        row = self._execute(f"SELECT {column} AS key FROM photos WHERE id=?", (photo_id,)).fetchone()
+        if not row or not row['key']:
+            return None
+        path = self.data_dir / row['key']
+        return path if path.is_file() else None
+
+    def open_image(self, photo_id: str, variant: str) -> None:
+        """Not needed: routes serve get_image_path directly."""
+        return None
+
+    # ------------------------------------------------------------------
+    # Comments
+    # ------------------------------------------------------------------
+    def list_comments(self, photo_id: str) -> List[Dict[str, Any]]:
+        """List comments for a photo, oldest first."""
+        rows = self._execute(
+            "SELECT photo_id, comment_id, user_id, username, text, timestamp FROM comments "
+            "WHERE photo_id=? ORDER BY timestamp, comment_id",
+            (photo_id,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def add_comment(self, photo_id: str, user: Dict[str, Any], text: str) -> Optional[Dict[str, Any]]:
+        """
+        Add a comment to a photo; None if the photo does not exist.
+
+        The photo's comment_count and recent_comments are updated in the same
+        transaction.
+        """
+        item = {
+            'photo_id': photo_id,
+            'comment_id': uuid.uuid4().hex,
+            'user_id': user['id'],
+            'username': user['username'],
+            'text': text,
+            'timestamp': int(datetime.utcnow().timestamp() * 1000),
+        }
+        with self._transaction():
+            photo = self._execute("SELECT user_id, comment_count FROM photos WHERE id=?", (photo_id,)).fetchone()
+            if photo is None:
+                return None
+            self._execute(
+                "INSERT INTO comments (photo_id, comment_id, user_id, username, text, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                tuple(item.values()),
+            )
+            self._update_comment_summary(photo_id, photo['comment_count'], 1)
+        self._bump_photo_versions([photo['user_id']], f'comments:{photo_id}')
+        return item
+
+    def delete_comment(self, photo_id: str, comment_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Delete a comment written by user_id, or any comment on user_id's photo.
+
+        Returns the deleted comment, or None if there is no such comment or
+        the user may not delete it.
+        """
+        with self._transaction():
+            row = self._execute(
+                "SELECT c.photo_id, c.comment_id, c.user_id, c.username, c.text, c.timestamp, "
+                "p.user_id AS owner_id, p.comment_count FROM comments c JOIN photos p ON p.id = c.photo_id "
+                "WHERE c.photo_id=? AND c.comment_id=?",
+                (photo_id, comment_id),
+            ).fetchone()
+            if row is None or user_id not in (row['user_id'], row['owner_id']):
+                return None
+            self._execute("DELETE FROM comments WHERE comment_id=?", (comment_id,))
+            self._update_comment_summary(photo_id, row['comment_count'], -1)
+        self._bump_photo_versions([row['owner_id']], f'comments:{photo_id}')
+        comment = dict(row)
+        del comment['owner_id'], comment['comment_count']
+        return comment
+
+    def backfill_comment_counts(self) -> int:
+        """Recount comment_count and recent_comments for every photo; returns photos updated."""
+        with self._transaction():
+            rows = self._execute("SELECT id, user_id FROM photos").fetchall()
+            for row in rows:
+                self._update_comment_summary(row['id'], None, 0)
+        if rows:
+            self._bump_photo_versions(row['user_id'] for row in rows)
+        return len(rows)
+
+    def _update_comment_summary(self, photo_id: str, count: Optional[int], delta: int) -> None:
+        """
+        Store a photo's comment_count (count + delta, or counted if count is
+        NULL) and its recent_comments; call inside _transaction.
+        """
+        if count is None:
+            count = self._execute("SELECT count(*) FROM comments WHERE photo_id=?", (photo_id,)).fetchone()[0]
+        else:
+            count += delta
+        rows = self._execute(
+            "SELECT comment_id, user_id, username, text, timestamp FROM comments "
+            "WHERE photo_id=? ORDER BY timestamp DESC, comment_id DESC LIMIT ?",
+            (photo_id, COMMENT_PREVIEW_SIZE),
+        ).fetchall()
+        preview = json.dumps([dict(row) for row in reversed(rows)], separators=(',', ':'))
+        self._execute("UPDATE photos SET comment_count=?, recent_comments=? WHERE id=?", (count, preview, photo_id))
+
+    # ------------------------------------------------------------------
+    # Friendships
+    # ------------------------------------------------------------------
+    def send_friend_request(self, requester_id: int, receiver_id: int) -> bool:
+        if requester_id == receiver_id:
+            return False
+        with self._transaction():
+            pending = self._execute(
+                "SELECT id FROM friend_requests WHERE requester_id=? AND receiver_id=? AND status='pending'",
+                (requester_id, receiver_id),
+            ).fetchone()
+            if pending:
+                return False
+            self._execute(
+                "INSERT INTO friend_requests (requester_id, receiver_id) VALUES (?, ?)",
+                (requester_id, receiver_id),
+            )
+        self.bump_versions(f'friends:{receiver_id}')
+        return True
+
+    def list_friend_requests(self, user_id: int) -> List[Dict[str, Any]]:
+        rows = self._execute(
+            """
+            SELECT fr.id, fr.requester_id, u.username AS requester_username, fr.status, fr.created_at
+            FROM friend_requests fr
+            JOIN users u ON u.id = fr.requester_id
+            WHERE fr.receiver_id=? AND fr.status='pending'
+            ORDER BY fr.created_at DESC
+            """,
+            (user_id,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def respond_friend_request(self, request_id: int, receiver_id: int, accept: bool) -> bool:
+        new_status = 'accepted' if accept else 'declined'
+        row = self._execute(
+            "UPDATE friend_requests SET status=? WHERE id=? AND receiver_id=? RETURNING requester_id",
+            (new_status, request_id, receiver_id),
+        ).fetchone()
+        if not row:
+            return False
+        self.bump_versions(f'friends:{receiver_id}', f'friends:{row["requester_id"]}')
+        return True
+
+    def list_friends(self, user_id: int) -> List[Dict[str, Any]]:
+        rows = self._execute(
+            """
+            SELECT u.id, u.username
+            FROM friend_requests fr
+            JOIN users u ON u.id = CASE WHEN fr.requester_id=? THEN fr.receiver_id ELSE fr.requester_id END
+            WHERE fr.status='accepted' AND (fr.requester_id=? OR fr.receiver_id=?)
+            """,
+            (user_id, user_id, user_id),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def friend_ids(self, user_id: int) -> List[int]:
+        return [f['id'] for f in self.list_friends(user_id)]
+
+    # ------------------------------------------------------------------
+    # Messages
+    # ------------------------------------------------------------------
+    def send_message(self, from_user: Dict[str, Any], to_user_id: int, text: str) -> Dict[str, Any]:
+        """Send a message to another user and move the conversation to the top of both inboxes."""
+        timestamp = int(datetime.utcnow().timestamp() * 1000)
+        message_id = uuid.uuid4().hex
+        user1, user2 = sorted([from_user['id'], to_user_id])
+        item = {
+            'conversation_id': f"CONV#{user1}#{user2}",
+            'sort_key': f"{timestamp}#{message_id}",
+            'message_id': message_id,
+            'from_user_id': from_user['id'],
+            'from_username': from_user['username'],
+            'to_user_id': to_user_id,
+            'text': text,
+            'timestamp': timestamp,
+        }
+        to_username = (self.get_user_by_id(to_user_id) or {}).get('username', '')
+        entries = [(from_user['id'], to_user_id, to_username, 0)]
+        if to_user_id != from_user['id']:
+            entries.append((to_user_id, from_user['id'], from_user['username'], 1))
+        preview = text[:INBOX_PREVIEW_CHARS]
+        with self._transaction():
+            self._execute(
+                f"INSERT INTO messages ({', '.join(item)}) VALUES ({', '.join('?' * len(item))})",
+                tuple(item.values()),
+            )
+            self._connection().executemany(
+                "INSERT INTO inbox (owner_id, other_user_id, other_username, last_message, last_from_user_id, "
+                "last_timestamp, unread) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (owner_id, other_user_id) DO UPDATE SET other_username=excluded.other_username, "
+                "last_message=excluded.last_message, last_from_user_id=excluded.last_from_user_id, "
+                "last_timestamp=excluded.last_timestamp, "
+                "unread=CASE WHEN excluded.unread = 0 THEN 0 ELSE inbox.unread + excluded.unread END",
+                [(owner, other, name, preview, from_user['id'], timestamp, unread)
+                 for owner, other, name, unread in entries],
+            )
+        return item
+
+    def list_messages(self, user_id: int, other_user_id: int) -> List[Dict[str, Any]]:
+        """List the first 100 messages between two users, oldest first."""
+        user1, user2 = sorted([user_id, other_user_id])
+        rows = self._execute(
+            "SELECT conversation_id, sort_key, message_id, from_user_id, from_username, to_user_id, text, "
+            "timestamp FROM messages WHERE conversation_id=? ORDER BY sort_key LIMIT 100",
+            (f"CONV#{user1}#{user2}",),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    # ------------------------------------------------------------------
+    # Conversation inbox
+    # ------------------------------------------------------------------
+    def list_conversations(self, user_id: int, limit: int = 20,
+                           before: Optional[Tuple[int, int]] = None) -> List[Dict[str, Any]]:
+        """
+        List a user's conversations, most recent activity first.
+
+        before is the (last_timestamp, other_user_id) of the last entry of the
+        previous page; the inbox_by_activity index serves every page.
+        """
+        query = ("SELECT other_user_id, other_username, last_message, last_from_user_id, last_timestamp, unread "
+                 "FROM inbox WHERE owner_id=?")
+        args: Tuple[Any, ...] = (user_id,)
+        if before:
+            query += " AND (last_timestamp, other_user_id) < (?, ?)"
+            args += tuple(before)
+        query += " ORDER BY last_timestamp DESC, other_user_id DESC LIMIT ?"
+        try:
+            rows = self._execute(query, args + (limit,)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error listing conversations: {e}")
+            return []
+        return [dict(row) for row in rows]
+
+    def mark_conversation_read(self, user_id: int, other_user_id: int) -> bool:
+        """Reset the unread counter of a conversation; False if there is no such conversation."""
+        cur = self._execute("UPDATE inbox SET unread=0 WHERE owner_id=? AND other_user_id=?",
+                            (user_id, other_user_id))
+        return cur.rowcount > 0
+
+    def backfill_inbox(self) -> int:
+        """Create inbox entries for conversations that predate the inbox; returns entries created."""
+        conn = self._connection()
+        with self._transaction():
+            before = conn.total_changes
+            # Latest message per (owner, other) pair across both directions; SQLite
+            # takes the bare columns from the max() row. WHERE true disambiguates ON CONFLICT.
+            self._execute(
+                "INSERT INTO inbox (owner_id, other_user_id, other_username, last_message, last_from_user_id, "
+                "last_timestamp, unread) "
+                "SELECT m.owner_id, m.other_user_id, COALESCE(u.username, ''), substr(m.text, 1, ?), "
+                "m.from_user_id, max(m.timestamp), 0 FROM ("
+                "  SELECT from_user_id AS owner_id, to_user_id AS other_user_id, text, from_user_id, timestamp "
+                "  FROM messages UNION ALL "
+                "  SELECT to_user_id, from_user_id, text, from_user_id, timestamp FROM messages"
+                ") m LEFT JOIN users u ON u.id = m.other_user_id WHERE true "
+                "GROUP BY m.owner_id, m.other_user_id "
+                "ON CONFLICT (owner_id, other_user_id) DO NOTHING",
+                (INBOX_PREVIEW_CHARS,),
+            )
+            return conn.total_changes - before
+
+    # ------------------------------------------------------------------
+    # Change versions
+    # ------------------------------------------------------------------
+    def get_version(self, scope: str) -> Optional[int]:
+        """Current change counter for scope (0 if never bumped, None on error)."""
+        try:
+            row = self._execute("SELECT version FROM versions WHERE scope=?", (scope,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading version {scope}: {e}")
+            return None
+        return row['version'] if row else 0
+
+    def get_versions(self, scopes: List[str]) -> Optional[List[int]]:
+        """Change counters of several scopes in one query, in order (None on error)."""
+        try:
+            rows = self._execute(
+                f"SELECT scope, version FROM versions WHERE scope IN ({', '.join('?' * len(scopes))})",
+                tuple(scopes),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading versions: {e}")
+            return None
+        found = {row['scope']: row['version'] for row in rows}
+        return [found.get(scope, 0) for scope in scopes]
+
+    def bump_versions(self, *scopes: str) -> None:
+        """Increment the change counters of scopes after a write."""
+        for scope in scopes:
+            try:
+                self._execute(
+                    "INSERT INTO versions (scope, version) VALUES (?, 1) "
+                    "ON CONFLICT(scope) DO UPDATE SET version = version + 1",
+                    (scope,),
+                )
+            except sqlite3.Error as e:
+                print(f"Error bumping version {scope}: {e}")
+
+    def _bump_photo_versions(self, owner_ids: Any, *scopes: str) -> None:
+        """Bump the owners' feed versions and the global one (scope=all), plus scopes."""
+        self.bump_versions('photos', *(f'photos:{owner}' for owner in sorted(set(owner_ids))), *scopes)
+
+    # ------------------------------------------------------------------
+    # Internal utilities
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _blob_key(content_hash: str, variant: str) -> str:
+        return f"blobs/{content_hash[0:2]}/{content_hash[2:4]}/{content_hash}_{variant}.jpg"
+
+    @staticmethod
+    def _profile_key(user_id: int, variant: str) -> str:
+        variant = 'thumb' if variant == 'thumb' else 'full'
+        return f"profiles/{user_id % 256:02x}/{user_id}_{variant}.jpg"
+
+    def _write_file(self, key: str, data: bytes) -> None:
+        """Write atomically: readers see the old file or the new one, never a partial one."""
+        path = self.data_dir / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _photo(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Row to the dict shape StorageDynamoDB returns."""
+        result = {key: row[key] for key in row.keys() if row[key] is not None}
+        if 'thumbnail_key' in result:
+            result['thumbnail_id'] = result['thumbnail_key']
+        if 'full_key' in result:
+            result['full_id'] = result['full_key']
+        if 'recent_comments' in result:
+            result['recent_comments'] = json.loads(result['recent_comments'])
+        return result
+
+    def _resize_to_bytes(self, image: Image.Image, max_width: int) -> bytes:
+        """Resize image and convert to JPEG bytes using the configured encoder."""
+        encoded = encode_variant(image, max_width, mode=self.jpeg_encoder, ssim_target=self.jpeg_ssim_target)
+        with self._encoder_stats_lock:
+            self.encoder_stats['variants'] += 1
+            self.encoder_stats['bytes'] += len(encoded.data)
+            self.encoder_stats['baseline_bytes'] += encoded.baseline_size
+        return encoded.data
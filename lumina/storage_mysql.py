@@ -0,0 +1,265 @@
+"""
+Account Storage Module - MySQL Users and Friendships
+
+Relational data shared by the document-store backends: user accounts,
+password hashes and friend requests live in MySQL (RDS) whichever store
+holds photos, comments and messages.
+
+StorageDynamoDB and Storage (MongoDB) inherit from MySQLAccounts and only
+supply bump_versions, which the friendship methods call to invalidate the
+ETags of friend lists and feeds.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from .metrics import timed_backend_call
+from .passwords import PasswordHasher, PasswordHashingBusy
+
+# pymysql takes ~50 ms to import; it is loaded on first connection so
+# worker boot stays fast
+if TYPE_CHECKING:
+    from pymysql.connections import Connection
+
+
+@lru_cache(maxsize=None)
+def _timed_cursor_class() -> type:
+    """DictCursor subclass that records each query's latency under the mysql backend."""
+    from pymysql.cursors import DictCursor
+
+    class TimedDictCursor(DictCursor):
+        def execute(self, query, args=None):
+            with timed_backend_call('mysql', query.split(None, 1)[0].upper()):
+                return super().execute(query, args)
+
+    return TimedDictCursor
+
+
+class MySQLAccounts(ABC):
+    """
+    User and friendship storage in MySQL.
+
+    Database Schema:
+        - users: id, username, email, password_hash, created_at
+        - friend_requests: id, requester_id, receiver_id, status, created_at
+
+    Subclasses set self.config and self.passwords (a PasswordHasher) and
+    implement bump_versions(*scopes).
+    """
+
+    config: Any
+    passwords: PasswordHasher
+
+    @abstractmethod
+    def bump_versions(self, *scopes: str) -> None:
+        """Increment the change counters of scopes (e.g. 'friends:{user_id}')."""
+
+    # ------------------------------------------------------------------
+    # Schema (run once per deployment, not per worker)
+    # ------------------------------------------------------------------
+    def migrate(self) -> None:
+        """Create the MySQL database and tables if they do not exist (subclasses extend this)."""
+        self._ensure_database()
+        self._ensure_tables()
+
+    def _ensure_database(self) -> None:
+        with self._raw_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"CREATE DATABASE IF NOT EXISTS `{self.config.DB_NAME}` CHARACTER SET utf8mb4")
+
+    def _ensure_tables(self) -> None:
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS users (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        username VARCHAR(255) NOT NULL UNIQUE,
+                        email VARCHAR(255) NOT NULL,
+                        password_hash VARCHAR(255) NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+                    """
+                )
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS friend_requests (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        requester_id INT NOT NULL,
+                        receiver_id INT NOT NULL,
+                        status ENUM('pending','accepted','declined') NOT NULL DEFAULT 'pending',
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (requester_id) REFERENCES users(id) ON DELETE CASCADE,
+                        FOREIGN KEY (receiver_id) REFERENCES users(id) ON DELETE CASCADE
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+                    """
+                )
+
+    @contextmanager
+    def _raw_connection(self) -> Connection:
+        import pymysql
+
+        conn = pymysql.connect(
+            host=self.config.DB_HOST,
+            port=self.config.DB_PORT,
+            user=self.config.DB_USER,
+            password=self.config.DB_PASSWORD,
+            autocommit=True,
+            cursorclass=_timed_cursor_class(),
+        )
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def connection(self) -> Connection:
+        import pymysql
+
+        conn = pymysql.connect(
+            host=self.config.DB_HOST,
+            port=self.config.DB_PORT,
+            user=self.config.DB_USER,
+            password=self.config.DB_PASSWORD,
+            database=self.config.DB_NAME,
+            autocommit=True,
+            cursorclass=_timed_cursor_class(),
+        )
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # User management (MySQL)
+    # ------------------------------------------------------------------
+    def create_user(self, username: str, password: str, email: Optional[str] = None) -> Dict[str, Any]:
+        password_hash = self.passwords.hash(password)
+        # Use placeholder email if none provided (for backwards compatibility)
+        if not email:
+            email = f"{username}@lumina.local"
+        
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+                    (username, email, password_hash),
+                )
+                user_id = cur.lastrowid
+        return {'id': user_id, 'username': username}
+
+    def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT id, username, email, password_hash, created_at FROM users WHERE username=%s",
+                    (username,),
+                )
+                return cur.fetchone()
+
+    def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT id, username, email, created_at FROM users WHERE id=%s",
+                    (user_id,),
+                )
+                return cur.fetchone()
+
+    def verify_user(self, username: str, password: str) -> Optional[Dict[str, Any]]:
+        user = self.get_user_by_username(username)
+        if not user:
+            return None
+        if not self.passwords.verify(user['password_hash'], password):
+            return None
+        if self.passwords.needs_rehash(user['password_hash']):
+            self._rehash_password(user['id'], password)
+        return {
+            'id': user['id'],
+            'username': user['username'],
+        }
+
+    def _rehash_password(self, user_id: int, password: str) -> None:
+        """Store a hash made with the current PASSWORD_HASH_METHOD (best effort)."""
+        try:
+            password_hash = self.passwords.hash(password)
+        except PasswordHashingBusy:
+            return  # the next login tries again
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE users SET password_hash=%s WHERE id=%s", (password_hash, user_id))
+
+    # ------------------------------------------------------------------
+    # Friendships (MySQL)
+    # ------------------------------------------------------------------
+    def send_friend_request(self, requester_id: int, receiver_id: int) -> bool:
+        if requester_id == receiver_id:
+            return False
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT id FROM friend_requests WHERE requester_id=%s AND receiver_id=%s AND status='pending'",
+                    (requester_id, receiver_id),
+                )
+                if cur.fetchone():
+                    return False
+                cur.execute(
+                    "INSERT INTO friend_requests (requester_id, receiver_id) VALUES (%s, %s)",
+                    (requester_id, receiver_id),
+                )
+        self.bump_versions(f'friends:{receiver_id}')
+        return True
+
+    def list_friend_requests(self, user_id: int) -> List[Dict[str, Any]]:
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT fr.id, fr.requester_id, u.username AS requester_username, fr.status, fr.created_at
+                    FROM friend_requests fr
+                    JOIN users u ON u.id = fr.requester_id
+                    WHERE fr.receiver_id=%s AND fr.status='pending'
+                    ORDER BY fr.created_at DESC
+                    """,
+                    (user_id,),
+                )
+                return list(cur.fetchall())
+
+    def respond_friend_request(self, request_id: int, receiver_id: int, accept: bool) -> bool:
+        new_status = 'accepted' if accept else 'declined'
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT requester_id FROM friend_requests WHERE id=%s AND receiver_id=%s",
+                    (request_id, receiver_id),
+                )
+                row = cur.fetchone()
+                cur.execute(
+                    "UPDATE friend_requests SET status=%s WHERE id=%s AND receiver_id=%s",
+                    (new_status, request_id, receiver_id),
+                )
+                updated = cur.rowcount > 0
+        if updated:
+            self.bump_versions(f'friends:{receiver_id}', f'friends:{row["requester_id"]}')
+        return updated
+
+    def list_friends(self, user_id: int) -> List[Dict[str, Any]]:
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT u.id, u.username
+                    FROM friend_requests fr
+                    JOIN users u ON u.id = CASE WHEN fr.requester_id=%s THEN fr.receiver_id ELSE fr.requester_id END
+                    WHERE fr.status='accepted' AND (fr.requester_id=%s OR fr.receiver_id=%s)
+                    """,
+                    (user_id, user_id, user_id),
+                )
+                return list(cur.fetchall())
+
+    def friend_ids(self, user_id: int) -> List[int]:
+        return [f['id'] for f in self.list_friends(user_id)]
@@ -0,0 +1,181 @@
+"""
+Capacity Throttling Module
+
+Keeps DynamoDB traffic inside the tables' provisioned capacity instead of
+discovering the limit through ProvisionedThroughputExceededException:
+
+    - client_options(): botocore settings for jittered adaptive retries
+      (AWS_RETRY_MODE / AWS_MAX_ATTEMPTS) and TCP keep-alive
+    - CapacityLimiter: a read and a write token bucket per table, refilled at
+      DYNAMODB_READ_CAPACITY / DYNAMODB_WRITE_CAPACITY units per second. Each
+      call reserves one unit per item before it is sent and is then charged
+      the ConsumedCapacity DynamoDB reports, so a large query slows down the
+      calls queued behind it rather than tripping the table's limit.
+    - raise_on_throttle(): a call still throttled after every retry raises
+      StorageThrottled instead of ClientError. Storage methods that map
+      ClientError to [] or None therefore cannot report an empty feed or a
+      missing photo; the routes answer 503 + Retry-After instead.
+
+The buckets live in each process: with N gunicorn workers, set the
+capacities to the provisioned units divided by N.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .metrics import BACKEND_THROTTLED, DYNAMODB_CAPACITY_WAIT
+
+# Error codes AWS uses for "slow down" across DynamoDB and S3
+THROTTLE_ERRORS = frozenset({
+    'ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded',
+    'Throttling', 'SlowDown', 'RequestThrottled',
+})
+
+READ_OPERATIONS = frozenset({'GetItem', 'Query', 'Scan', 'BatchGetItem', 'TransactGetItems'})
+WRITE_OPERATIONS = frozenset({'PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem', 'TransactWriteItems'})
+
+
+class StorageThrottled(Exception):
+    """Raised when a backend call is still throttled after every retry; retry later."""
+
+
+def client_options(config) -> Dict[str, Any]:
+    """Retry and keep-alive settings for the boto3 clients."""
+    return {
+        'retries': {'mode': config.AWS_RETRY_MODE, 'max_attempts': config.AWS_MAX_ATTEMPTS},
+        'tcp_keepalive': True,
+    }
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that hands out reservations.
+
+    reserve() always debits the bucket and returns how long the caller must
+    wait for the tokens it took, so waiting callers are served in arrival
+    order. The debt is capped at max_wait seconds of refill, which bounds
+    every wait and lets the bucket recover quickly after an overload.
+    """
+
+    def __init__(self, rate: float, burst: float, max_wait: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.floor = -rate * max_wait
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take amount tokens; return the seconds to sleep before using them."""
+        with self._lock:
+            self._adjust(-amount)
+            return max(0.0, -self._tokens / self.rate)
+
+    def charge(self, amount: float) -> None:
+        """Debit (or, if negative, refund) capacity measured after the call."""
+        with self._lock:
+            self._adjust(-amount)
+
+    def _adjust(self, delta: float) -> None:
+        now = time.monotonic()
+        refilled = self._tokens + (now - self._updated) * self.rate
+        self._tokens = max(self.floor, min(self.burst, refilled + delta))
+        self._updated = now
+
+
+class CapacityLimiter:
+    """Per-table read and write token buckets applied to a botocore DynamoDB client."""
+
+    def __init__(self, read_capacity: float, write_capacity: float, max_wait: float) -> None:
+        self.capacity = {'read': read_capacity, 'write': write_capacity}
+        self.max_wait = max_wait
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> 'CapacityLimiter':
+        return cls(config.DYNAMODB_READ_CAPACITY, config.DYNAMODB_WRITE_CAPACITY,
+                   config.DYNAMODB_THROTTLE_MAX_WAIT)
+
+    def register(self, client: Any) -> None:
+        """Hook the limiter into a (sync) DynamoDB client; waits block the calling thread."""
+        client.meta.events.register('before-parameter-build.dynamodb', self._before_call)
+        client.meta.events.register('after-call.dynamodb', self._after_call)
+
+    def _bucket(self, table: str, kind: str) -> Optional[TokenBucket]:
+        rate = self.capacity[kind]
+        if rate <= 0:
+            return None
+        bucket = self._buckets.get((table, kind))
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault((table, kind), TokenBucket(rate, rate, self.max_wait))
+        return bucket
+
+    def _before_call(self, params, model, context, **kwargs) -> None:
+        kind = _operation_kind(model.name)
+        if kind is None:
+            return
+        # ConsumedCapacity in the response settles the reservation
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+        reserved = _reserved_units(params)
+        context['capacity_reserved'] = (kind, reserved)
+        wait = 0.0
+        for table, units in reserved.items():
+            bucket = self._bucket(table, kind)
+            if bucket is not None:
+                wait = max(wait, bucket.reserve(units))
+        if wait > 0:
+            DYNAMODB_CAPACITY_WAIT.labels(kind).observe(wait)
+            time.sleep(wait)
+
+    def _after_call(self, parsed, context, **kwargs) -> None:
+        kind, reserved = context.pop('capacity_reserved', (None, {}))
+        capacity = parsed.get('ConsumedCapacity')
+        if kind is None or not capacity:
+            return
+        for entry in capacity if isinstance(capacity, list) else [capacity]:
+            table = entry.get('TableName')
+            bucket = self._bucket(table, kind) if table else None
+            if bucket is not None and 'CapacityUnits' in entry:
+                bucket.charge(float(entry['CapacityUnits']) - reserved.get(table, 0.0))
+
+
+def raise_on_throttle(client: Any) -> None:
+    """Make a botocore client raise StorageThrottled once retries give up on a throttle."""
+    service = client.meta.service_model.service_id.hyphenize()
+    client.meta.events.register(f'after-call.{service}', _raise_on_throttle)
+
+
+def _raise_on_throttle(parsed, model, **kwargs) -> None:
+    # after-call runs once the retry loop is done, just before botocore raises ClientError
+    code = parsed.get('Error', {}).get('Code')
+    if code in THROTTLE_ERRORS:
+        BACKEND_THROTTLED.labels(model.service_model.service_id.hyphenize(), model.name).inc()
+        raise StorageThrottled(f'{model.name} throttled after retries ({code})')
+
+
+def _operation_kind(operation: str) -> Optional[str]:
+    if operation in READ_OPERATIONS:
+        return 'read'
+    if operation in WRITE_OPERATIONS:
+        return 'write'
+    return None
+
+
+def _reserved_units(params: Dict[str, Any]) -> Dict[str, float]:
+    """Estimate the units a call will consume per table: one per item, two per transactional item."""
+    if 'TableName' in params:
+        return {params['TableName']: 1.0}
+    units: Dict[str, float] = {}
+    for table, requests in params.get('RequestItems', {}).items():
+        # BatchWriteItem lists requests; BatchGetItem wraps its keys in {'Keys': [...]}
+        count = len(requests) if isinstance(requests, list) else len(requests.get('Keys', ()))
+        units[table] = units.get(table, 0.0) + count
+    for item in params.get('TransactItems', ()):
+        for action in item.values():
+            units[action['TableName']] = units.get(action['TableName'], 0.0) + 2.0
+    return units
@@ -0,0 +1,314 @@
+"""
+Data Transfer Module
+
+Streams every photo, image, comment and message from one backend to
+another, for migrating between MongoDB and DynamoDB or exporting to (and
+restoring from) a directory:
+
+    flask --app app transfer --source mongodb --dest dynamodb
+    flask --app app transfer --source dynamodb --dest dir:/backups/2026-10-19
+    flask --app app transfer --source dir:/backups/2026-10-19 --dest mongodb
+
+Data moves in four streams. 'blobs' (content-addressed image variants) goes
+first so photos can point at their images on arrival; 'photos', 'comments'
+and 'messages' then run concurrently. Each stream is read in pages:
+
+    - DynamoDB sources are split into scan segments (Segment/TotalSegments)
+      read by parallel workers; MongoDB and directory sources have one
+      segment per stream, read in key order
+    - image bytes are copied on a separate pool of copy workers, so page
+      reads are not stalled behind S3 / GridFS round trips
+    - records are written with batched puts (DynamoDB batch_writer,
+      MongoDB unordered bulk upserts), paced by the capacity limiter
+
+After every page the segment's cursor is saved to the checkpoint file; an
+interrupted run started again with the same --checkpoint resumes where it
+stopped. Writes are idempotent upserts, so a page replayed after a crash is
+overwritten rather than duplicated (a directory sink may hold a repeated
+line, which a restore absorbs the same way).
+
+Scans read with strong consistency, but the export is not a point-in-time
+snapshot: writes made while it runs may or may not be included. Stop
+writers (or run it again) for an exact copy. Inbox entries are rebuilt on
+the destination at the end, so unread counts start at zero. Users and
+friendships live in MySQL, shared by both backends, and are not copied; the
+'local' SQLite backend is not supported.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Streams in dependency order; everything after 'blobs' is copied concurrently
+STREAMS = ('blobs', 'photos', 'comments', 'messages')
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+
+def open_storage(name: str, config) -> Any:
+    """Build a transfer endpoint: 'mongodb', 'dynamodb' or 'dir:PATH'."""
+    if name.startswith('dir:'):
+        return DirectoryStore(name[len('dir:'):])
+    if name == 'dynamodb':
+        from .storage_dynamodb import StorageDynamoDB
+        return StorageDynamoDB(config)
+    if name == 'mongodb':
+        from .storage import Storage
+        return Storage(config)
+    raise ValueError(f"unsupported transfer endpoint {name!r} (use mongodb, dynamodb or dir:PATH)")
+
+
+def transfer(source: Any, dest: Any, checkpoint: 'Checkpoint', segments: int = 4, workers: int = 4,
+             copy_workers: int = 8, page_size: int = 100, echo: Callable[[str], None] = print) -> Dict[str, int]:
+    """
+    Copy every stream from source to dest; returns records written per stream.
+
+    Exceptions from either side propagate after the running pages finish;
+    the checkpoint keeps everything written before the failure.
+    """
+    progress = Progress(sum(source.export_size(stream) or 0 for stream in STREAMS), echo)
+    written = {stream: 0 for stream in STREAMS}
+    with ThreadPoolExecutor(max_workers=max(copy_workers, 1)) as copy_pool:
+        for phase in (STREAMS[:1], STREAMS[1:]):
+            tasks = []
+            for stream in phase:
+                total = checkpoint.segments(stream, source.export_segments(stream, segments))
+                tasks += [(stream, segment, total) for segment in range(total)
+                          if not checkpoint.is_done(stream, segment)]
+            with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+                futures = [pool.submit(_copy_segment, source, dest, checkpoint, progress, copy_pool,
+                                       stream, segment, total, page_size, written)
+                           for stream, segment, total in tasks]
+                for future in futures:
+                    future.result()
+    dest.finish_import()
+    progress.report(force=True)
+    return written
+
+
+def _copy_segment(source: Any, dest: Any, checkpoint: 'Checkpoint', progress: 'Progress',
+                  copy_pool: ThreadPoolExecutor, stream: str, segment: int, total: int,
+                  page_size: int, written: Dict[str, int]) -> None:
+    cursor = checkpoint.cursor(stream, segment)
+    while True:
+        records, cursor, scanned = source.export_page(stream, segment, total, cursor, page_size)
+        copied = 0
+        if stream in ('blobs', 'photos'):
+            records, copied = _copy_variants(source, dest, copy_pool, stream, records, progress)
+        dest.import_records(stream, records)
+        checkpoint.advance(stream, segment, cursor)
+        with progress.lock:
+            written[stream] += len(records)
+        progress.add(scanned, copied)
+        if cursor is None:
+            return
+
+
+def _copy_variants(source: Any, dest: Any, copy_pool: ThreadPoolExecutor, stream: str,
+                   records: List[Dict[str, Any]], progress: 'Progress') -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Copy the image bytes of a page's records on the copy pool.
+
+    Blobs always carry images; photos only if they predate content
+    addressing (no content_hash). Records whose images are missing at the
+    source are skipped with a warning. Returns (records, bytes copied).
+    """
+    def copy(record: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], int]:
+        variants = source.read_variants(stream, record)
+        if variants is None:
+            return None, 0
+        return dest.import_variants(stream, record, variants), sum(len(data) for data in variants.values())
+
+    pending = [(record, copy_pool.submit(copy, record)) for record in records
+               if stream == 'blobs' or not record.get('content_hash')]
+    skipped = set()
+    copied = 0
+    for record, future in pending:
+        fields, size = future.result()
+        if fields is None:
+            key = record.get('content_hash') if stream == 'blobs' else record.get('id')
+            progress.echo(f"warning: {stream} {key} has no images at the source, skipped")
+            skipped.add(id(record))
+            continue
+        record.update(fields)
+        copied += size
+    return [record for record in records if id(record) not in skipped], copied
+
+
+class Checkpoint:
+    """
+    Per-segment scan cursors saved as JSON after every page.
+
+    The file also records the endpoints and segment counts; resuming with
+    other endpoints is refused, and a stream keeps the segment count it
+    started with (cursors are only valid within one segmentation).
+    """
+
+    def __init__(self, path: Optional[str], source: str, dest: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.state: Dict[str, Any] = {'source': source, 'dest': dest, 'streams': {}}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if (saved.get('source'), saved.get('dest')) != (source, dest):
+                raise ValueError(f"checkpoint {path} is for {saved.get('source')} -> {saved.get('dest')}")
+            self.state = saved
+
+    def segments(self, stream: str, requested: int) -> int:
+        with self.lock:
+            entry = self.state['streams'].setdefault(stream, {
+                'total_segments': requested,
+                'segments': {str(segment): {'cursor': None, 'done': False} for segment in range(requested)},
+            })
+            return entry['total_segments']
+
+    def cursor(self, stream: str, segment: int) -> Any:
+        with self.lock:
+            return self.state['streams'][stream]['segments'][str(segment)]['cursor']
+
+    def is_done(self, stream: str, segment: int) -> bool:
+        with self.lock:
+            return self.state['streams'][stream]['segments'][str(segment)]['done']
+
+    def advance(self, stream: str, segment: int, cursor: Any) -> None:
+        """Record that everything before cursor is written (None: the segment is finished)."""
+        with self.lock:
+            self.state['streams'][stream]['segments'][str(segment)] = {'cursor': cursor, 'done': cursor is None}
+            self._save()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        # Write-then-rename so a crash mid-write leaves the previous checkpoint intact
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+
+class Progress:
+    """Thread-safe counters printed every PROGRESS_INTERVAL seconds with rate and ETA."""
+
+    def __init__(self, estimate: int, echo: Callable[[str], None]) -> None:
+        self.estimate = estimate
+        self.echo = echo
+        self.lock = threading.Lock()
+        self.scanned = 0
+        self.bytes = 0
+        self.started = self._reported = time.monotonic()
+
+    def add(self, scanned: int, copied_bytes: int) -> None:
+        with self.lock:
+            self.scanned += scanned
+            self.bytes += copied_bytes
+        self.report()
+
+    def report(self, force: bool = False) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self._reported < PROGRESS_INTERVAL:
+                return
+            self._reported = now
+            elapsed = max(now - self.started, 1e-6)
+            rate = self.scanned / elapsed
+            line = f"{self.scanned:,} items, {rate:,.0f} items/s, {self.bytes / elapsed / 1e6:.1f} MB/s"
+            if self.estimate:
+                # Table sizes are estimates, so the percentage can pass 100 before the end
+                line += f", {self.scanned / self.estimate:.0%} of ~{self.estimate:,}"
+                if rate > 0 and self.scanned < self.estimate:
+                    line += f", ETA {_duration((self.estimate - self.scanned) / rate)}"
+        self.echo(line)
+
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class DirectoryStore:
+    """
+    Transfer endpoint backed by a directory.
+
+    Each stream is a {stream}.jsonl file of records and images are stored
+    as images/{content hash or photo id}_{variant}.jpg. As a source a
+    stream has one segment whose cursor is a byte offset; as a destination
+    lines are appended, and finish_import writes manifest.json with the
+    record counts (used as the size estimate when restoring).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._locks = {stream: threading.Lock() for stream in STREAMS}
+        os.makedirs(os.path.join(path, 'images'), exist_ok=True)
+
+    def export_segments(self, stream: str, requested: int) -> int:
+        return 1
+
+    def export_size(self, stream: str) -> Optional[int]:
+        try:
+            with open(os.path.join(self.path, 'manifest.json')) as f:
+                return json.load(f)['counts'].get(stream)
+        except FileNotFoundError:
+            return None
+
+    def export_page(self, stream: str, segment: int, total_segments: int, cursor: Optional[int],
+                    limit: int) -> Tuple[List[Dict[str, Any]], Optional[int], int]:
+        records = []
+        try:
+            with open(self._stream_path(stream), 'rb') as f:
+                f.seek(cursor or 0)
+                while len(records) < limit:
+                    line = f.readline()
+                    if not line:
+                        return records, None, len(records)
+                    records.append(json.loads(line))
+                return records, f.tell(), len(records)
+        except FileNotFoundError:
+            return [], None, 0
+
+    def read_variants(self, stream: str, record: Dict[str, Any]) -> Optional[Dict[str, bytes]]:
+        variants = {}
+        for variant in ('thumb', 'full'):
+            try:
+                with open(self._image_path(stream, record, variant), 'rb') as f:
+                    variants[variant] = f.read()
+            except FileNotFoundError:
+                return None
+        return variants
+
+    def import_variants(self, stream: str, record: Dict[str, Any], variants: Dict[str, bytes]) -> Dict[str, Any]:
+        for variant, data in variants.items():
+            with open(self._image_path(stream, record, variant), 'wb') as f:
+                f.write(data)
+        return {}
+
+    def import_records(self, stream: str, records: List[Dict[str, Any]]) -> None:
+        lines = ''.join(json.dumps(record, default=str) + '\n' for record in records)
+        with self._locks[stream], open(self._stream_path(stream), 'a') as f:
+            f.write(lines)
+
+    def finish_import(self) -> None:
+        counts = {}
+        for stream in STREAMS:
+            try:
+                with open(self._stream_path(stream), 'rb') as f:
+                    counts[stream] = sum(1 for _ in f)
+            except FileNotFoundError:
+                counts[stream] = 0
+        with open(os.path.join(self.path, 'manifest.json'), 'w') as f:
+            json.dump({'counts': counts, 'exported_at': int(time.time())}, f)
+
+    def _stream_path(self, stream: str) -> str:
+        return os.path.join(self.path, f'{stream}.jsonl')
+
+    def _image_path(self, stream: str, record: Dict[str, Any], variant: str) -> str:
+        name = record['content_hash'] if stream == 'blobs' else record['id']
+        return os.path.join(self.path, 'images', f'{name}_{variant}.jpg')
@@ -0,0 +1,78 @@
+"""
+Test Fixtures
+
+Tests run against StorageLocal (SQLite + files in a temporary
+LOCAL_DATA_DIR), which needs no external services. Fast settings keep the
+suite quick: the fixed JPEG encoder and a cheap inline password hash.
+"""
+
+from __future__ import annotations
+
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from lumina import create_app  # noqa: E402
+from lumina.config import Config  # noqa: E402
+from lumina.storage_local import StorageLocal  # noqa: E402
+
+
+@pytest.fixture
+def config_class(tmp_path):
+    class TestConfig(Config):
+        STORAGE_BACKEND = 'local'
+        LOCAL_DATA_DIR = tmp_path
+        JPEG_ENCODER = 'fixed'
+        PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+        PASSWORD_HASH_WORKERS = 0
+        BULK_UPLOAD_WORKERS = 2
+        TESTING = True
+
+    return TestConfig
+
+
+@pytest.fixture
+def storage(config_class):
+    return StorageLocal(config_class())
+
+
+@pytest.fixture
+def app(config_class):
+    return create_app(config_class)
+
+
+@pytest.fixture
+def app_storage(app):
+    return app.extensions['photo_storage']
+
+
+@pytest.fixture
+def login(app, app_storage):
+    """Create a user and return a test client whose session is signed in as them."""
+    def sign_in(username):
+        user = app_storage.create_user(username, 'secret')
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user['id']
+        return client, user
+
+    return sign_in
+
+
+def make_image(seed: int = 0, size=(64, 48)) -> Image.Image:
+    """A small RGB image whose pixels (and so content hash) differ per seed."""
+    image = Image.new('RGB', size, (seed * 37 % 256, seed * 91 % 256, seed * 53 % 256))
+    image.putpixel((0, 0), (seed % 256, 255 - seed % 256, 0))
+    return image
+
+
+def jpeg_bytes(seed: int = 0) -> bytes:
+    buffer = BytesIO()
+    make_image(seed).save(buffer, format='JPEG', quality=95)
+    return buffer.getvalue()
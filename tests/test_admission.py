@@ -0,0 +1,71 @@
+"""Admission control: per-user token buckets per route class and concurrency shedding."""
+
+import pytest
+
+from lumina.admission import AdmissionController, Rejection
+from lumina.config import Config
+
+
+@pytest.fixture
+def settings(tmp_path):
+    settings = {name: getattr(Config, name) for name in dir(Config) if name.startswith('ADMISSION_')}
+    settings.update(
+        ADMISSION_STATE_PATH=str(tmp_path / 'admission'),
+        ADMISSION_UPLOAD_RATE=0.01, ADMISSION_UPLOAD_BURST=2, ADMISSION_UPLOAD_CONCURRENCY=0,
+        ADMISSION_SCAN_CONCURRENCY=1, ADMISSION_QUEUE_TARGET=0.02,
+    )
+    return settings
+
+
+def test_empty_bucket_is_a_429_per_user_and_class(settings):
+    admission = AdmissionController(settings)
+    for _ in range(2):
+        admission.admit(1, 'upload')()
+
+    rejected = admission.admit(1, 'upload')
+    assert isinstance(rejected, Rejection)
+    assert rejected.status == 429 and rejected.retry_after >= 1
+    assert not isinstance(admission.admit(2, 'upload'), Rejection)
+    assert not isinstance(admission.admit(1, 'image'), Rejection)
+
+
+def test_charge_puts_the_bucket_in_debt(settings):
+    admission = AdmissionController(settings)
+    admission.admit(1, 'upload')()
+    admission.charge(1, 'upload', 25)
+
+    rejected = admission.admit(1, 'upload')
+    assert isinstance(rejected, Rejection) and rejected.status == 429
+    # 24 tokens owed at 0.01 per second
+    assert rejected.retry_after > 2000
+
+
+def test_busy_class_sheds_with_503_and_returns_the_token(settings):
+    settings['ADMISSION_SCAN_BURST'] = 2
+    admission = AdmissionController(settings)
+    release = admission.admit(1, 'scan')
+
+    rejected = admission.admit(2, 'scan')
+    assert rejected == Rejection(503, 1, 'server is busy, try again shortly')
+
+    release()
+    release()  # releasing twice frees one slot only
+    # User 2's token was given back, so both of its burst tokens are still there
+    for _ in range(2):
+        admitted = admission.admit(2, 'scan')
+        assert not isinstance(admitted, Rejection)
+        admitted()
+
+
+def test_routes_answer_429_with_retry_after(app, login):
+    client, _ = login('alice')
+    admission = app.extensions['admission']
+    admission.bursts['default'] = 2
+    admission.rates['default'] = 0.01
+
+    statuses = [client.get('/api/friends').status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    response = client.get('/api/friends')
+    assert response.headers['Retry-After'].isdigit()
+    # Image reads are their own class and still admitted
+    assert client.get('/api/users/1/profile-picture/thumb').status_code != 429
@@ -0,0 +1,67 @@
+"""Content-addressed variants: uploads of identical pixels share one reference-counted blob."""
+
+from conftest import make_image
+
+
+def _blob(storage, content_hash):
+    row = storage._execute("SELECT refs, thumbnail_key, full_key FROM blobs WHERE content_hash=?",
+                           (content_hash,)).fetchone()
+    return dict(row) if row else None
+
+
+def test_identical_uploads_share_one_blob(storage):
+    user = storage.create_user('alice', 'secret')
+    first = storage.add_photo(user, 'sky', make_image(1))
+    second = storage.add_photo(user, 'sky', make_image(1))
+
+    assert first['content_hash'] == second['content_hash']
+    assert (first['thumbnail_key'], first['full_key']) == (second['thumbnail_key'], second['full_key'])
+    assert _blob(storage, first['content_hash'])['refs'] == 2
+
+
+def test_distinct_uploads_get_their_own_blobs(storage):
+    user = storage.create_user('alice', 'secret')
+    first = storage.add_photo(user, 'sky', make_image(1))
+    second = storage.add_photo(user, 'sky', make_image(2))
+
+    assert first['content_hash'] != second['content_hash']
+    assert _blob(storage, first['content_hash'])['refs'] == 1
+    assert _blob(storage, second['content_hash'])['refs'] == 1
+
+
+def test_files_are_deleted_with_the_last_reference(storage):
+    user = storage.create_user('alice', 'secret')
+    first = storage.add_photo(user, 'sky', make_image(1))
+    second = storage.add_photo(user, 'sky', make_image(1))
+    blob = _blob(storage, first['content_hash'])
+    files = [storage.data_dir / blob['thumbnail_key'], storage.data_dir / blob['full_key']]
+
+    assert storage.delete_photo(first['id'])['id'] == first['id']
+    assert _blob(storage, first['content_hash'])['refs'] == 1
+    assert all(path.exists() for path in files)
+    assert storage.get_image_bytes(second['id'], 'full')
+
+    assert storage.delete_photo(second['id'])['id'] == second['id']
+    assert _blob(storage, first['content_hash']) is None
+    assert not any(path.exists() for path in files)
+
+
+def test_deleting_a_photo_twice_releases_its_blob_once(storage):
+    user = storage.create_user('alice', 'secret')
+    first = storage.add_photo(user, 'sky', make_image(1))
+    second = storage.add_photo(user, 'sky', make_image(1))
+
+    assert storage.delete_photo(first['id']) is not None
+    assert storage.delete_photo(first['id']) is None
+    assert _blob(storage, first['content_hash'])['refs'] == 1
+    assert storage.get_image_bytes(second['id'], 'thumb')
+
+
+def test_reupload_after_cleanup_stores_the_blob_again(storage):
+    user = storage.create_user('alice', 'secret')
+    photo = storage.add_photo(user, 'sky', make_image(1))
+    storage.delete_photo(photo['id'])
+
+    again = storage.add_photo(user, 'sky', make_image(1))
+    assert _blob(storage, again['content_hash'])['refs'] == 1
+    assert storage.get_image_bytes(again['id'], 'full')
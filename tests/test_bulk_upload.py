@@ -0,0 +1,89 @@
+"""Album uploads: per-photo results, and no leaked variants when the metadata write fails."""
+
+import zipfile
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from conftest import jpeg_bytes, make_image
+
+from lumina.imaging import content_hash, normalize_image
+from lumina.throttling import StorageThrottled
+
+
+def _post(client, files, archive=None):
+    data = {'topic': 'sky', 'photos': [(BytesIO(body), name) for name, body in files]}
+    if archive is not None:
+        data['archive'] = (BytesIO(archive), 'album.zip')
+    return client.post('/api/photos/bulk', data=data, content_type='multipart/form-data')
+
+
+def _zip(members):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, body in members:
+            archive.writestr(name, body)
+    return buffer.getvalue()
+
+
+def test_every_photo_stored_is_a_201(login, app_storage):
+    client, alice = login('alice')
+    response = _post(client, [('a.jpg', jpeg_bytes(1))], archive=_zip([('b.jpg', jpeg_bytes(2))]))
+
+    assert response.status_code == 201
+    results = response.get_json()['results']
+    assert [result['filename'] for result in results] == ['a.jpg', 'b.jpg']
+    assert {photo['id'] for photo in app_storage.list_photos([alice['id']])} == {r['id'] for r in results}
+
+
+def test_partial_failure_reports_each_photo(login, app_storage, monkeypatch):
+    client, alice = login('alice')
+    busy = content_hash(normalize_image(Image.open(BytesIO(jpeg_bytes(2)))))
+    acquire = app_storage._acquire_variants
+
+    def acquire_or_throttle(digest, image):
+        if digest == busy:
+            raise StorageThrottled('slow down')
+        return acquire(digest, image)
+
+    monkeypatch.setattr(app_storage, '_acquire_variants', acquire_or_throttle)
+    response = _post(client, [('ok.jpg', jpeg_bytes(1)), ('busy.jpg', jpeg_bytes(2)), ('junk.jpg', b'not an image')])
+
+    assert response.status_code == 207
+    assert [result['status'] for result in response.get_json()['results']] == [201, 503, 400]
+    assert len(app_storage.list_photos([alice['id']])) == 1
+
+
+def test_all_throttled_is_a_503_with_retry_after(login, app_storage, monkeypatch):
+    client, _ = login('alice')
+
+    def throttled(digest, image):
+        raise StorageThrottled('slow down')
+
+    monkeypatch.setattr(app_storage, '_acquire_variants', throttled)
+    response = _post(client, [('a.jpg', jpeg_bytes(1)), ('b.jpg', jpeg_bytes(2))])
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_archive_over_the_byte_budget_is_a_413(app, login, app_storage):
+    client, alice = login('alice')
+    app.config['BULK_UPLOAD_MAX_BYTES'] = len(jpeg_bytes(1)) + 10
+    response = _post(client, [], archive=_zip([('a.jpg', jpeg_bytes(1)), ('b.jpg', jpeg_bytes(2))]))
+
+    assert response.status_code == 413
+    assert app_storage.list_photos([alice['id']]) == []
+
+
+def test_failed_metadata_write_releases_the_variants(storage):
+    user = storage.create_user('alice', 'secret')
+    kept = storage.add_photo(user, 'sky', make_image(1))
+    storage._execute("CREATE TRIGGER reject_photos BEFORE INSERT ON photos BEGIN SELECT RAISE(ABORT, 'rejected'); END")
+
+    with pytest.raises(Exception, match='rejected'):
+        storage.add_photos(user, 'sky', [make_image(1), make_image(2)])
+
+    refs = dict(storage._execute("SELECT content_hash, refs FROM blobs").fetchall())
+    assert refs == {kept['content_hash']: 1}
+    assert [photo['id'] for photo in storage.list_photos()] == [kept['id']]
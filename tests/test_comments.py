@@ -0,0 +1,74 @@
+"""Denormalized comment_count and recent_comments, kept in step with every comment write."""
+
+from conftest import make_image
+
+from lumina.storage_local import COMMENT_PREVIEW_SIZE
+
+
+def _ids(comments):
+    return {comment['comment_id'] for comment in comments}
+
+
+def test_adding_comments_updates_count_and_preview(storage):
+    alice = storage.create_user('alice', 'secret')
+    photo = storage.add_photo(alice, 'sky', make_image(1))
+    added = [storage.add_comment(photo['id'], alice, f'comment {i}') for i in range(COMMENT_PREVIEW_SIZE + 2)]
+
+    stored = storage.get_photo(photo['id'])
+    assert stored['comment_count'] == len(added)
+    assert len(stored['recent_comments']) == COMMENT_PREVIEW_SIZE
+    assert _ids(stored['recent_comments']) <= _ids(added)
+    assert storage.add_comment('nope', alice, 'lost') is None
+
+
+def test_deleting_comments_updates_count_and_preview(storage):
+    alice = storage.create_user('alice', 'secret')
+    photo = storage.add_photo(alice, 'sky', make_image(1))
+    first = storage.add_comment(photo['id'], alice, 'first')
+    second = storage.add_comment(photo['id'], alice, 'second')
+
+    assert storage.delete_comment(photo['id'], second['comment_id'], alice['id'])['text'] == 'second'
+    stored = storage.get_photo(photo['id'])
+    assert stored['comment_count'] == 1
+    assert _ids(stored['recent_comments']) == {first['comment_id']}
+
+    assert storage.delete_comment(photo['id'], second['comment_id'], alice['id']) is None
+    assert storage.get_photo(photo['id'])['comment_count'] == 1
+
+
+def test_only_authors_and_photo_owners_delete_comments(storage):
+    alice = storage.create_user('alice', 'secret')
+    bob = storage.create_user('bob', 'secret')
+    carol = storage.create_user('carol', 'secret')
+    photo = storage.add_photo(alice, 'sky', make_image(1))
+    by_bob = storage.add_comment(photo['id'], bob, 'mine')
+    by_carol = storage.add_comment(photo['id'], carol, 'hers')
+
+    assert storage.delete_comment(photo['id'], by_bob['comment_id'], carol['id']) is None
+    assert storage.delete_comment(photo['id'], by_bob['comment_id'], bob['id']) is not None
+    assert storage.delete_comment(photo['id'], by_carol['comment_id'], alice['id']) is not None
+    assert storage.get_photo(photo['id'])['comment_count'] == 0
+    assert storage.get_photo(photo['id'])['recent_comments'] == []
+
+
+def test_backfill_recounts_drifted_summaries(storage):
+    alice = storage.create_user('alice', 'secret')
+    photo = storage.add_photo(alice, 'sky', make_image(1))
+    comment = storage.add_comment(photo['id'], alice, 'hi')
+    storage._execute("UPDATE photos SET comment_count=7, recent_comments='[]' WHERE id=?", (photo['id'],))
+
+    assert storage.backfill_comment_counts() == 1
+    stored = storage.get_photo(photo['id'])
+    assert stored['comment_count'] == 1
+    assert _ids(stored['recent_comments']) == {comment['comment_id']}
+
+
+def test_feed_embeds_the_preview_on_request(login, app_storage):
+    client, alice = login('alice')
+    photo = app_storage.add_photo(alice, 'sky', make_image(1))
+    client.post(f"/api/photos/{photo['id']}/comments", json={'text': 'nice'})
+
+    plain = client.get('/api/photos?scope=profile').get_json()[0]
+    assert plain['commentCount'] == 1 and 'recentComments' not in plain
+    detailed = client.get('/api/photos?scope=profile&with_comments=1').get_json()[0]
+    assert [comment['text'] for comment in detailed['recentComments']] == ['nice']
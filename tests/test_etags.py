@@ -0,0 +1,104 @@
+"""Weak ETags from change counters: revalidation answers 304 until a write bumps a version."""
+
+from conftest import make_image
+
+
+def _get(client, url, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    return client.get(url, headers=headers)
+
+
+def _befriend(app_storage, a, b):
+    app_storage.send_friend_request(a['id'], b['id'])
+    request = app_storage.list_friend_requests(b['id'])[0]
+    assert app_storage.respond_friend_request(request['id'], b['id'], True)
+
+
+def test_like_of_a_missing_photo_is_a_404(login, app_storage):
+    client, _ = login('alice')
+
+    assert app_storage.increment_like('nope') is None
+    assert app_storage.get_photo('nope') is None
+    assert client.post('/api/photos/nope/like').status_code == 404
+    assert app_storage.list_photos() == []
+
+
+def test_profile_feed_revalidates_until_a_like(login, app_storage):
+    client, alice = login('alice')
+    photo = app_storage.add_photo(alice, 'sky', make_image(1))
+
+    first = _get(client, '/api/photos?scope=profile')
+    assert first.status_code == 200 and first.headers['ETag'].startswith('W/')
+    assert _get(client, '/api/photos?scope=profile', first.headers['ETag']).status_code == 304
+
+    assert client.post(f"/api/photos/{photo['id']}/like").get_json() == {'likes': 1}
+    after = _get(client, '/api/photos?scope=profile', first.headers['ETag'])
+    assert after.status_code == 200
+    assert after.get_json()[0]['likes'] == 1
+    assert after.headers['ETag'] != first.headers['ETag']
+
+
+def test_home_feed_ignores_strangers_but_not_friends(login, app_storage):
+    client, alice = login('alice')
+    bob = app_storage.create_user('bob', 'secret')
+    carol = app_storage.create_user('carol', 'secret')
+    app_storage.add_photo(alice, 'sky', make_image(1))
+    etag = _get(client, '/api/photos?scope=home').headers['ETag']
+
+    app_storage.add_photo(carol, 'sky', make_image(2))
+    assert _get(client, '/api/photos?scope=home', etag).status_code == 304
+
+    _befriend(app_storage, alice, bob)
+    response = _get(client, '/api/photos?scope=home', etag)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    bob_photo = app_storage.add_photo(bob, 'sea', make_image(3))
+    response = _get(client, '/api/photos?scope=home', etag)
+    assert response.status_code == 200
+    assert bob_photo['id'] in {photo['id'] for photo in response.get_json()}
+
+
+def test_all_feed_changes_with_any_write(login, app_storage):
+    client, _ = login('alice')
+    bob = app_storage.create_user('bob', 'secret')
+    etag = _get(client, '/api/photos?scope=all').headers['ETag']
+    assert _get(client, '/api/photos?scope=all', etag).status_code == 304
+
+    photo = app_storage.add_photo(bob, 'sea', make_image(1))
+    response = _get(client, '/api/photos?scope=all', etag)
+    assert response.status_code == 200
+    assert [p['id'] for p in response.get_json()] == [photo['id']]
+
+    etag = response.headers['ETag']
+    app_storage.delete_photo(photo['id'])
+    assert _get(client, '/api/photos?scope=all', etag).status_code == 200
+
+
+def test_comments_revalidate_until_a_comment_is_added_or_deleted(login, app_storage):
+    client, alice = login('alice')
+    photo = app_storage.add_photo(alice, 'sky', make_image(1))
+    url = f"/api/photos/{photo['id']}/comments"
+    etag = _get(client, url).headers['ETag']
+    assert _get(client, url, etag).status_code == 304
+
+    comment = client.post(url, json={'text': 'nice'}).get_json()
+    response = _get(client, url, etag)
+    assert response.status_code == 200 and len(response.get_json()) == 1
+
+    etag = response.headers['ETag']
+    assert client.delete(f"{url}/{comment['comment_id']}").status_code == 204
+    response = _get(client, url, etag)
+    assert response.status_code == 200 and response.get_json() == []
+
+
+def test_friend_list_revalidates_until_a_request_is_accepted(login, app_storage):
+    client, alice = login('alice')
+    bob = app_storage.create_user('bob', 'secret')
+    etag = _get(client, '/api/friends').headers['ETag']
+    assert _get(client, '/api/friends', etag).status_code == 304
+
+    _befriend(app_storage, bob, alice)
+    response = _get(client, '/api/friends', etag)
+    assert response.status_code == 200
+    assert [friend['username'] for friend in response.get_json()] == ['bob']
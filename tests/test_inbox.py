@@ -0,0 +1,77 @@
+"""Conversation inbox: last-message previews and unread counters kept with each message."""
+
+from lumina.storage_local import INBOX_PREVIEW_CHARS
+
+
+def _entry(storage, owner, other):
+    return next(e for e in storage.list_conversations(owner['id']) if e['other_user_id'] == other['id'])
+
+
+def test_messages_count_as_unread_for_the_receiver_only(storage):
+    alice = storage.create_user('alice', 'secret')
+    bob = storage.create_user('bob', 'secret')
+    storage.send_message(alice, bob['id'], 'hi')
+    storage.send_message(alice, bob['id'], 'x' * (INBOX_PREVIEW_CHARS + 50))
+
+    received = _entry(storage, bob, alice)
+    assert received['unread'] == 2
+    assert received['other_username'] == 'alice'
+    assert received['last_message'] == 'x' * INBOX_PREVIEW_CHARS
+    assert received['last_from_user_id'] == alice['id']
+    assert _entry(storage, alice, bob)['unread'] == 0
+
+
+def test_replying_and_marking_read_reset_the_counter(storage):
+    alice = storage.create_user('alice', 'secret')
+    bob = storage.create_user('bob', 'secret')
+    storage.send_message(alice, bob['id'], 'hi')
+    storage.send_message(bob, alice['id'], 'hello')
+
+    assert _entry(storage, bob, alice)['unread'] == 0
+    assert _entry(storage, alice, bob)['unread'] == 1
+    assert storage.mark_conversation_read(alice['id'], bob['id'])
+    assert _entry(storage, alice, bob)['unread'] == 0
+    assert not storage.mark_conversation_read(alice['id'], 999)
+
+
+def test_message_to_self_is_never_unread(storage):
+    alice = storage.create_user('alice', 'secret')
+    storage.send_message(alice, alice['id'], 'note')
+
+    assert storage.list_conversations(alice['id']) == [_entry(storage, alice, alice)]
+    assert _entry(storage, alice, alice)['unread'] == 0
+
+
+def test_backfill_rebuilds_missing_entries(storage):
+    alice = storage.create_user('alice', 'secret')
+    bob = storage.create_user('bob', 'secret')
+    storage.send_message(alice, bob['id'], 'first')
+    storage.send_message(bob, alice['id'], 'second')
+    # Both may have been sent in the same millisecond
+    storage._execute("UPDATE messages SET timestamp = timestamp - 1000 WHERE text='first'")
+    storage._execute("DELETE FROM inbox")
+
+    assert storage.backfill_inbox() == 2
+    assert _entry(storage, alice, bob)['last_message'] == 'second'
+    assert _entry(storage, bob, alice)['last_message'] == 'second'
+    assert storage.backfill_inbox() == 0
+
+
+def test_conversation_pages_cover_every_entry_once(login, app_storage):
+    client, alice = login('alice')
+    others = [app_storage.create_user(f'user{i}', 'secret') for i in range(5)]
+    for other in others:
+        app_storage.send_message(other, alice['id'], 'hi')
+
+    seen, cursor = [], None
+    while True:
+        page = client.get('/api/conversations', query_string={'limit': 2, **({'cursor': cursor} if cursor else {})})
+        body = page.get_json()
+        seen += [entry['other_user_id'] for entry in body['conversations']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(other['id'] for other in others)
+
+    assert client.post(f"/api/conversations/{others[0]['id']}/read").status_code == 204
+    assert client.post('/api/conversations/999/read').status_code == 404